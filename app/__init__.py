@@ -31,6 +31,9 @@ def create_app(config_name='default'):
     from app.blueprints.analytics.routes import analytics_bp
     app.register_blueprint(analytics_bp, url_prefix='/analytics')
 
+    from app.blueprints.telemetry.routes import telemetry_bp
+    app.register_blueprint(telemetry_bp, url_prefix='/telemetry')
+
     from app.blueprints.main.routes import main_bp
     app.register_blueprint(main_bp, url_prefix='/')
     
@@ -3,12 +3,25 @@ from flask_login import login_required, current_user
 from werkzeug.security import generate_password_hash
 
 from app.extensions import db
-from app.models import User, UserRole, AuditLog, Printer, Filament, SparePart
+from app.models import User, UserRole, AuditLog, Printer, Filament, SparePart, PricingRule, PricingRuleKind
 from app.auth.decorators import role_required
 from app.services.audit import log_action
+from app.services.geometry import SPEED_PROFILES, MATERIAL_DENSITY
+from app.services.fleet_poller import FIRMWARE_APIS, parse_api_url
+from app.services.pricing import rate_table
 
 admin_bp = Blueprint('admin', __name__)
 
+def _api_url_error(api_url):
+    """Why the fleet poller could not use this printer API URL, or None."""
+    if not api_url:
+        return None
+    try:
+        parse_api_url(api_url)
+    except ValueError as e:
+        return str(e)
+    return None
+
 @admin_bp.route('/dashboard')
 @login_required
 @role_required(UserRole.ADMIN)
@@ -90,35 +103,56 @@ def printer_new():
         name = request.form.get('name')
         location = request.form.get('location')
         notes = request.form.get('notes')
+        bed_width = request.form.get('bed_width_mm', 220.0, type=float)
+        bed_depth = request.form.get('bed_depth_mm', 220.0, type=float)
+        speed_profile = request.form.get('speed_profile') or 'standard'
+        api_url_error = _api_url_error(request.form.get('api_url', '').strip())
         
         if Printer.query.filter_by(name=name).first():
             flash('Printer name already exists.', 'danger')
+        elif api_url_error:
+            flash(api_url_error, 'danger')
         else:
-            p = Printer(name=name, location=location, notes=notes)
+            p = Printer(name=name, location=location, notes=notes,
+                        bed_width_mm=bed_width, bed_depth_mm=bed_depth, speed_profile=speed_profile,
+                        api_type=request.form.get('api_type') or 'moonraker',
+                        api_url=request.form.get('api_url', '').strip() or None,
+                        api_key=request.form.get('api_key', '').strip() or None)
             db.session.add(p)
             db.session.commit()
             log_action(current_user.id, "create_printer", "Printer", p.id, after={'name': name})
             flash('Printer added successfully.', 'success')
             return redirect(url_for('admin.printers'))
             
-    return render_template('admin/printer_form.html', title="Add New Printer", printer=None)
+    return render_template('admin/printer_form.html', title="Add New Printer", printer=None,
+                           speed_profiles=SPEED_PROFILES, firmware_apis=FIRMWARE_APIS)
 
 @admin_bp.route('/printers/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 @role_required(UserRole.ADMIN)
 def printer_edit(id):
     printer = Printer.query.get_or_404(id)
-    if request.method == 'POST':
+    api_url_error = _api_url_error(request.form.get('api_url', '').strip())
+    if request.method == 'POST' and api_url_error:
+        flash(api_url_error, 'danger')
+    elif request.method == 'POST':
         printer.name = request.form.get('name')
         printer.location = request.form.get('location')
         printer.notes = request.form.get('notes')
+        printer.bed_width_mm = request.form.get('bed_width_mm', printer.bed_width_mm, type=float)
+        printer.bed_depth_mm = request.form.get('bed_depth_mm', printer.bed_depth_mm, type=float)
+        printer.speed_profile = request.form.get('speed_profile') or printer.speed_profile
+        printer.api_type = request.form.get('api_type') or printer.api_type
+        printer.api_url = request.form.get('api_url', '').strip() or None
+        printer.api_key = request.form.get('api_key', '').strip() or None
         
         db.session.commit()
         log_action(current_user.id, "update_printer", "Printer", printer.id, after={'name': printer.name})
         flash('Printer updated successfully.', 'success')
         return redirect(url_for('admin.printers'))
         
-    return render_template('admin/printer_form.html', title="Edit Printer", printer=printer)
+    return render_template('admin/printer_form.html', title="Edit Printer", printer=printer,
+                           speed_profiles=SPEED_PROFILES, firmware_apis=FIRMWARE_APIS)
 
 @admin_bp.route('/printers/<int:id>/delete', methods=['POST'])
 @login_required
@@ -135,3 +169,79 @@ def printer_delete(id):
         flash('Printer deleted.', 'success')
         
     return redirect(url_for('admin.printers'))
+
+def _optional_float(name):
+    value = request.form.get(name, '').strip()
+    return float(value) if value else None
+
+def _rule_from_form():
+    kind = request.form.get('kind')
+    rule = PricingRule(kind=kind)
+    if kind == PricingRuleKind.MATERIAL:
+        rule.material_type = request.form.get('material_type') or None
+        rule.rate_per_gram = _optional_float('rate_per_gram')
+        rule.rate_per_minute = _optional_float('rate_per_minute')
+        rule.base_fee = _optional_float('base_fee')
+        if PricingRule.query.filter_by(kind=kind, material_type=rule.material_type, active=True).first():
+            raise ValueError('There is already an active rate rule for that material; disable it first.')
+    elif kind in (PricingRuleKind.QUANTITY_BREAK, PricingRuleKind.RUSH, PricingRuleKind.CUSTOMER):
+        rule.percent = _optional_float('percent')
+        if rule.percent is None or not 0 <= rule.percent <= (1000 if kind == PricingRuleKind.RUSH else 100):
+            raise ValueError('Enter a valid percentage.')
+        if kind == PricingRuleKind.QUANTITY_BREAK:
+            rule.min_quantity = request.form.get('min_quantity', type=int)
+            if not rule.min_quantity or rule.min_quantity < 2:
+                raise ValueError('Quantity breaks start at 2 units or more.')
+        elif kind == PricingRuleKind.CUSTOMER:
+            rule.customer_user_id = request.form.get('customer_user_id', type=int)
+            if not rule.customer_user_id:
+                raise ValueError('Choose a customer.')
+    else:
+        raise ValueError('Unknown rule type.')
+    return rule
+
+@admin_bp.route('/pricing', methods=['GET', 'POST'])
+@login_required
+@role_required(UserRole.ADMIN)
+def pricing():
+    if request.method == 'POST':
+        try:
+            rule = _rule_from_form()
+            db.session.add(rule)
+            db.session.commit()
+            log_action(current_user.id, "create_pricing_rule", "PricingRule", rule.id, after={'kind': rule.kind})
+            flash('Pricing rule added.', 'success')
+        except ValueError as e:
+            flash(str(e), 'danger')
+        return redirect(url_for('admin.pricing'))
+
+    rules = PricingRule.query.order_by(PricingRule.kind, PricingRule.material_type, PricingRule.min_quantity).all()
+    customers = User.query.filter_by(role=UserRole.CUSTOMER).order_by(User.name).all()
+    return render_template('admin/pricing.html', rules=rules, customers=customers, kinds=PricingRuleKind,
+                           materials=list(MATERIAL_DENSITY), table=rate_table())
+
+@admin_bp.route('/pricing/<int:id>/toggle', methods=['POST'])
+@login_required
+@role_required(UserRole.ADMIN)
+def pricing_toggle(id):
+    rule = PricingRule.query.get_or_404(id)
+    if not rule.active and rule.kind == PricingRuleKind.MATERIAL and PricingRule.query.filter_by(
+            kind=rule.kind, material_type=rule.material_type, active=True).first():
+        flash('Another rate rule for that material is active; disable it first.', 'danger')
+        return redirect(url_for('admin.pricing'))
+    rule.active = not rule.active
+    db.session.commit()
+    log_action(current_user.id, "toggle_pricing_rule", "PricingRule", rule.id, after={'active': rule.active})
+    flash(f"Pricing rule {'enabled' if rule.active else 'disabled'}.", 'info')
+    return redirect(url_for('admin.pricing'))
+
+@admin_bp.route('/pricing/<int:id>/delete', methods=['POST'])
+@login_required
+@role_required(UserRole.ADMIN)
+def pricing_delete(id):
+    rule = PricingRule.query.get_or_404(id)
+    db.session.delete(rule)
+    db.session.commit()
+    log_action(current_user.id, "delete_pricing_rule", "PricingRule", id)
+    flash('Pricing rule deleted.', 'success')
+    return redirect(url_for('admin.pricing'))
@@ -1,6 +1,8 @@
 from flask import Blueprint, render_template, jsonify, request
 from flask_login import login_required, current_user
-from app.services.analytics_service import AnalyticsService
+from datetime import datetime, timedelta
+from app.services.analytics_service import AnalyticsService, MAX_STATS_DAYS
+from app.services.utilization import printer_utilization
 from app.models import UserRole, Printer
 
 analytics_bp = Blueprint('analytics', __name__, template_folder='templates')
@@ -23,7 +25,7 @@ def dashboard():
 
 @analytics_bp.route('/api/stats')
 def get_stats():
-    days = int(request.args.get('days', 30))
+    days = request.args.get('days', 30, type=int)
     printer_id = request.args.get('printer_id')
     
     if printer_id and printer_id.isdigit():
@@ -31,10 +33,25 @@ def get_stats():
     else:
         printer_id = None
 
-    data = {
-        'orders_per_day': AnalyticsService.get_orders_per_day(days, printer_id),
-        'order_status': AnalyticsService.get_order_status_distribution(printer_id),
-        'filament_usage': AnalyticsService.get_filament_usage_stats(printer_id),
-        'printer_utilization': AnalyticsService.get_printer_utilization()
-    }
+    stats = AnalyticsService.get_stats(days, printer_id)
+    response = jsonify(stats['data'])
+    # Browsers revalidate every time and get a 304 while nothing changed
+    response.set_etag(stats['etag'])
+    response.last_modified = stats['last_modified']
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@analytics_bp.route('/api/utilization')
+def get_utilization():
+    """Busy / idle / maintenance percentages per printer, by hour or day."""
+    days = max(1, min(request.args.get('days', 7, type=int), MAX_STATS_DAYS))
+    bucket = request.args.get('bucket', 'day')
+    printer_id = request.args.get('printer_id', type=int)
+    end = datetime.utcnow()
+    try:
+        data = printer_utilization(end - timedelta(days=days), end, bucket,
+                                   [printer_id] if printer_id else None)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     return jsonify(data)
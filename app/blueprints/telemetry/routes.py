@@ -0,0 +1,29 @@
+import hmac
+
+from flask import Blueprint, current_app, jsonify, request
+
+from app.extensions import csrf
+from app.services.telemetry import ingest
+
+# Machine-to-machine: printers or a bridge script on the farm LAN POST
+# batches here with a shared bearer token instead of a login session.
+telemetry_bp = Blueprint('telemetry', __name__)
+
+
+def _authorized():
+    token = current_app.config.get('TELEMETRY_TOKEN')
+    supplied = request.headers.get('Authorization', '')
+    return bool(token) and hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode())
+
+
+@telemetry_bp.route('/ingest', methods=['POST'])
+@csrf.exempt
+def ingest_samples():
+    if not _authorized():
+        return jsonify({'error': 'Invalid or missing telemetry token'}), 401
+    payload = request.get_json(silent=True) or {}
+    try:
+        result = ingest(payload.get('samples'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result), 202
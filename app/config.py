@@ -6,6 +6,11 @@ class Config:
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
     MAX_CONTENT_LENGTH = 64 * 1024 * 1024  # 64MB max upload
+    # Local SQLite file the worker processes share for live events (services/events.py)
+    EVENT_LOG_PATH = os.environ.get('EVENT_LOG_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'events.db')
+    # Per-printer telemetry ring files (services/telemetry.py) and the token printers send
+    TELEMETRY_FOLDER = os.environ.get('TELEMETRY_FOLDER') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'telemetry')
+    TELEMETRY_TOKEN = os.environ.get('TELEMETRY_TOKEN')
     WTF_CSRF_ENABLED = True
 
 class DevelopmentConfig(Config):
@@ -22,6 +27,8 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    EVENT_LOG_PATH = None
+    TELEMETRY_FOLDER = None
 
 config = {
     'development': DevelopmentConfig,
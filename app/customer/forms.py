@@ -1,6 +1,6 @@
 from flask_wtf import FlaskForm
-from flask_wtf.file import FileField, FileAllowed, FileRequired
-from wtforms import StringField, SelectField, IntegerField, TextAreaField, SubmitField, FieldList, FormField
+from flask_wtf.file import FileField, FileAllowed
+from wtforms import StringField, SelectField, IntegerField, TextAreaField, SubmitField, FieldList, FormField, HiddenField, BooleanField
 from wtforms.validators import DataRequired, NumberRange
 
 class PrintJobForm(FlaskForm):
@@ -13,9 +13,13 @@ class PrintJobForm(FlaskForm):
 class NewOrderForm(FlaskForm):
     # Simplified approach: allow uploading multiple STLs at once. 
     # Logic in route: create one job per STL.
+    # Not FileRequired: app.js sends files in chunks beforehand and submits
+    # their ids in upload_ids instead. The route checks one of them is set.
+    # Pre-sliced G-code and 3MF projects are taken too (services/printfiles)
     stl_files = FileField('Upload STLs', 
-                          validators=[FileRequired(), FileAllowed(['stl'], 'STL files only!')],
+                          validators=[FileAllowed(['stl', 'gcode', '3mf'], 'STL, G-code or 3MF files only!')],
                           render_kw={'multiple': True})
+    upload_ids = HiddenField()
     
     material_type = SelectField('Material', choices=[('PLA', 'PLA'), ('PETG', 'PETG'), ('ABS', 'ABS')], validators=[DataRequired()])
     color = SelectField('Color', choices=[('Black', 'Black'), ('White', 'White'), ('Grey', 'Grey'), ('Red', 'Red'), ('Blue', 'Blue')], validators=[DataRequired()])
@@ -27,6 +31,8 @@ class NewOrderForm(FlaskForm):
     # "Customer creates order -> Order.status='new'"
     # We will apply these settings to all uploaded files.
     quantity = IntegerField('Quantity (per file)', default=1, validators=[NumberRange(min=1)])
+    # Sets Order.priority: printed first, priced with the rush surcharge
+    rush = BooleanField('Rush order')
     
     notes = TextAreaField('Special Instructions')
     submit = SubmitField('Submit Order')
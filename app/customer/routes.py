@@ -1,15 +1,24 @@
 import os
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 
 from app.extensions import db
-from app.models import Order, PrintJob, UserRole, OrderStatus, JobStatus
+from app.models import Order, PrintJob, Upload, UserRole, OrderStatus, JobStatus, AnalysisStatus
 from app.customer.forms import NewOrderForm
-from app.services.storage import save_file
-from app.services.pricing import calculate_estimate
+from app.services.storage import store_upload, cached_analysis
+from app.services.uploads import (create_upload, write_chunk, complete_upload, consume_uploads,
+                                  upload_state, UploadOffsetError)
+from app.services.geometry import estimate_from_metrics, MATERIAL_DENSITY
+from app.services.calibration import apply_calibration
+from app.services.tasks import enqueue
+from app.services.pricing import price_jobs, price_order, rate_table
+from app.services.quotes import quote
+from app.services.thumbnails import thumbnail_path
+from app.services.printfiles import UPLOAD_EXTENSIONS, MESH_EXTENSIONS
 from app.services.workflow import transition_order_status
 from app.services.audit import log_action
+from app.services.simulation import get_order_eta
 from app.auth.decorators import role_required
 
 customer_bp = Blueprint('customer', __name__)
@@ -24,60 +33,161 @@ def home():
 def order_new():
     form = NewOrderForm()
     if form.validate_on_submit():
-        uploaded_files = request.files.getlist('stl_files')
-        
-        if not uploaded_files or uploaded_files[0].filename == '':
+        uploaded_files = [f for f in request.files.getlist('stl_files')
+                          if f and f.filename.lower().endswith(UPLOAD_EXTENSIONS)]
+        upload_ids = [u for u in (form.upload_ids.data or '').split(',') if u]
+
+        if not uploaded_files and not upload_ids:
             flash('No files selected', 'danger')
             return render_template('customer/order_new.html', form=form)
 
+        try:
+            # Files already sent in chunks by app.js (see the /uploads routes below)
+            uploads = consume_uploads(upload_ids, current_user.id)
+        except ValueError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+            return render_template('customer/order_new.html', form=form)
+
         # Create Order in REVIEW status
         order = Order(
             customer_user_id=current_user.id,
             status=OrderStatus.REVIEW,
-            priority=False, 
+            priority=form.rush.data,
             shipping_address=current_user.customer_profile.address_line1 if current_user.customer_profile else "No Address",
             created_at=db.func.now()
         )
         db.session.add(order)
         db.session.flush() # get ID
         
-        total_estimate = 0
+        jobs = []
+
+        # Plain multipart files are still accepted for browsers without JS.
+        # Either way the file ends up stored once per distinct contents.
+        sources = [(u.stored_file, u.filename) for u in uploads]
+        sources += [(store_upload(f), secure_filename(f.filename)) for f in uploaded_files]
         
-        for file in uploaded_files:
-            if file and file.filename.endswith('.stl'):
-                # Save file
-                rel_path = save_file(file, order.id)
-                
-                # Create Job
-                # Estimate placeholder: 50g, 60min default
-                est_grams = 50 
-                est_mins = 60
-                qty = form.quantity.data
-                
-                job_price = calculate_estimate(est_grams, est_mins, qty)
-                total_estimate += job_price
-                
-                job = PrintJob(
-                    order_id=order.id,
-                    stl_path=rel_path,
-                    original_filename=secure_filename(file.filename),
-                    material_type=form.material_type.data,
-                    color=form.color.data,
-                    quantity=qty,
-                    estimated_time_minutes=est_mins,
-                    estimated_material_grams=est_grams,
-                    status=JobStatus.WAITING,
-                )
-                db.session.add(job)
+        for stored, filename in sources:
+            if stored.rel_path.endswith(MESH_EXTENSIONS) and not os.path.exists(thumbnail_path(stored.sha256)):
+                enqueue('render_thumbnail', {'sha256': stored.sha256}, commit=False)
+            job = PrintJob(
+                order_id=order.id,
+                stl_path=stored.rel_path,
+                file_hash=stored.sha256,
+                original_filename=filename,
+                material_type=form.material_type.data,
+                color=form.color.data,
+                quantity=form.quantity.data,
+                status=JobStatus.WAITING,
+            )
+            metrics = cached_analysis(stored.sha256)
+            if metrics is not None:
+                # Seen these bytes before: quote straight away
+                apply_calibration(job, *estimate_from_metrics(metrics, job.material_type))
+                job.analysis_status = AnalysisStatus.DONE
+            else:
+                # Placeholder estimate (50g, 60min) until the worker has
+                # analyzed the file (see services/tasks.analyze_job)
+                job.estimated_material_grams, job.estimated_time_minutes = 50, 60
+                job.analysis_status = AnalysisStatus.PENDING
+            db.session.add(job)
+            db.session.flush()
+            jobs.append(job)
+            if job.analysis_status == AnalysisStatus.PENDING:
+                enqueue('analyze_job', {'job_id': job.id}, commit=False)
         
-        order.total_estimated_price = total_estimate
+        order.total_estimated_price = sum(price_jobs(jobs, current_user.id, order.priority))
         
         # Don't log create yet? Or log 'draft'?
         db.session.commit()
         
         return redirect(url_for('customer.order_confirm', id=order.id))
 
-    return render_template('customer/order_new.html', form=form)
+    return render_template('customer/order_new.html', form=form,
+                           rush_percent=rate_table().rush_surcharge * 100)
+
+# --- Chunked uploads (used by app.js for the New Order form) ---
+
+def _own_upload(upload_id):
+    upload = db.session.get(Upload, upload_id)
+    if upload is None or upload.customer_user_id != current_user.id:
+        return None
+    return upload
+
+@customer_bp.route('/uploads', methods=['POST'])
+@login_required
+@role_required(UserRole.CUSTOMER)
+def upload_create():
+    data = request.get_json(silent=True) or {}
+    try:
+        upload = create_upload(current_user.id, data.get('filename'), data.get('size', 0))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(upload_state(upload)), 201
+
+@customer_bp.route('/uploads/<upload_id>', methods=['GET'])
+@login_required
+@role_required(UserRole.CUSTOMER)
+def upload_status(upload_id):
+    """Where to resume after a dropped connection."""
+    upload = _own_upload(upload_id)
+    if upload is None:
+        return jsonify({'error': 'Unknown upload'}), 404
+    return jsonify(upload_state(upload))
+
+@customer_bp.route('/uploads/<upload_id>', methods=['PUT'])
+@login_required
+@role_required(UserRole.CUSTOMER)
+def upload_chunk(upload_id):
+    """Raw chunk body at ?offset=N, optionally with an X-Chunk-SHA256 header."""
+    upload = _own_upload(upload_id)
+    if upload is None:
+        return jsonify({'error': 'Unknown upload'}), 404
+    try:
+        write_chunk(upload, request.args.get('offset', type=int), request.stream,
+                    checksum=request.headers.get('X-Chunk-SHA256'))
+    except UploadOffsetError as e:
+        return jsonify(dict(upload_state(upload), error=str(e))), 409
+    except ValueError as e:
+        return jsonify(dict(upload_state(upload), error=str(e))), 400
+    return jsonify(upload_state(upload))
+
+@customer_bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+@role_required(UserRole.CUSTOMER)
+def upload_complete(upload_id):
+    upload = _own_upload(upload_id)
+    if upload is None:
+        return jsonify({'error': 'Unknown upload'}), 404
+    try:
+        complete_upload(upload)
+    except ValueError as e:
+        return jsonify(dict(upload_state(upload), error=str(e))), 400
+    return jsonify(upload_state(upload))
+
+# --- Instant quotes ---
+
+@customer_bp.route('/quote', methods=['POST'])
+@login_required
+@role_required(UserRole.CUSTOMER)
+def quote_files():
+    """
+    Prices uploaded files without creating an order. Body:
+    {"files": [sha256, ...], "material_type": "PLA", "quantity": 1, "rush": false}.
+    The file hashes come from the upload routes (file_hash) or past orders.
+    """
+    data = request.get_json(silent=True) or {}
+    material_type = data.get('material_type')
+    if material_type not in MATERIAL_DENSITY:
+        return jsonify({'error': 'Unknown material'}), 400
+    try:
+        result = quote(current_user.id, list(data.get('files') or []), material_type,
+                       int(data.get('quantity', 1)), bool(data.get('rush')))
+    except LookupError:
+        return jsonify({'error': 'Unknown file'}), 404
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result)
 
 @customer_bp.route('/order/<int:id>/confirm', methods=['GET', 'POST'])
 @login_required
@@ -92,9 +202,13 @@ def order_confirm(id):
         # If already confirmed, just go to detail
         return redirect(url_for('customer.order_detail', id=order.id))
 
+    analysis_pending = any(j.analysis_status == AnalysisStatus.PENDING for j in order.jobs)
+
     if request.method == 'POST':
         action = request.form.get('action')
-        if action == 'confirm':
+        if action == 'confirm' and analysis_pending:
+            flash('Your files are still being analyzed. Please wait for the final price.', 'warning')
+        elif action == 'confirm':
             order.status = OrderStatus.NEW
             log_action(current_user.id, "create_order", "Order", order.id)
             db.session.commit()
@@ -108,7 +222,32 @@ def order_confirm(id):
             
     shipping_cost = 15.00
     grand_total = float(order.total_estimated_price) + shipping_cost
-    return render_template('customer/order_confirmation.html', order=order, shipping_cost=shipping_cost, grand_total=grand_total)
+    job_prices = price_order(order)
+    return render_template('customer/order_confirmation.html', order=order, shipping_cost=shipping_cost,
+                           grand_total=grand_total, job_prices=job_prices, analysis_pending=analysis_pending)
+
+@customer_bp.route('/order/<int:id>/analysis')
+@login_required
+@role_required(UserRole.CUSTOMER)
+def order_analysis(id):
+    """Polled by the confirmation page while uploads are analyzed."""
+    order = Order.query.get_or_404(id)
+    if order.customer_user_id != current_user.id:
+        return jsonify({'error': 'Access denied'}), 403
+
+    prices = price_order(order)
+    jobs = [{
+        'id': j.id,
+        'analysis_status': j.analysis_status,
+        'estimated_material_grams': j.estimated_material_grams,
+        'estimated_time_minutes': j.estimated_time_minutes,
+        'price': prices[j.id],
+    } for j in order.jobs]
+    return jsonify({
+        'pending': sum(1 for j in jobs if j['analysis_status'] == AnalysisStatus.PENDING),
+        'total_estimated_price': float(order.total_estimated_price or 0),
+        'jobs': jobs,
+    })
 
 @customer_bp.route('/orders')
 @login_required
@@ -130,5 +269,9 @@ def order_detail(id):
     if order.customer_user_id != current_user.id:
         flash('You do not have access to that order.', 'danger')
         return redirect(url_for('customer.orders'))
+
+    eta = None
+    if order.status in [OrderStatus.NEW, OrderStatus.QUEUED, OrderStatus.PRINTING]:
+        eta = get_order_eta(order)
         
-    return render_template('customer/order_detail.html', order=order)
+    return render_template('customer/order_detail.html', order=order, eta=eta)
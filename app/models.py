@@ -1,4 +1,6 @@
-from datetime import datetime
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, select
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from app.extensions import db
@@ -33,6 +35,35 @@ class PrinterStatus:
     ERROR = 'error'
     MAINTENANCE = 'maintenance'
 
+class PlateStatus:
+    PLANNED = 'planned'
+    QUEUED = 'queued'
+    PRINTING = 'printing'
+    DONE = 'done'
+    FAILED = 'failed'
+
+class AnalysisStatus:
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+
+class UploadStatus:
+    RECEIVING = 'receiving'
+    COMPLETE = 'complete'
+    CONSUMED = 'consumed'
+
+class TaskStatus:
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+class PricingRuleKind:
+    MATERIAL = 'material'               # rates for one material (or the default)
+    QUANTITY_BREAK = 'quantity_break'   # percent off from min_quantity units
+    RUSH = 'rush'                       # percent added to priority orders
+    CUSTOMER = 'customer'               # percent off for one customer
+
 class ShipmentStatus:
     CREATED = 'created'
     SHIPPED = 'shipped'
@@ -82,6 +113,21 @@ class Printer(db.Model):
     location = db.Column(db.String(64))
     status = db.Column(db.String(20), default=PrinterStatus.IDLE)
     notes = db.Column(db.Text)
+
+    # Spool currently loaded (updated when a job starts or an operator swaps it)
+    loaded_material = db.Column(db.String(20), nullable=True)
+    loaded_color = db.Column(db.String(30), nullable=True)
+
+    # Usable build area, used by plate nesting
+    bed_width_mm = db.Column(db.Float, default=220.0)
+    bed_depth_mm = db.Column(db.Float, default=220.0)
+    # Key into geometry.SPEED_PROFILES
+    speed_profile = db.Column(db.String(20), default='standard')
+
+    # Firmware HTTP API polled by scripts/run_poller.py; not polled when api_url is empty
+    api_type = db.Column(db.String(20), default='moonraker')  # key into fleet_poller.FIRMWARE_APIS
+    api_url = db.Column(db.String(255), nullable=True)  # e.g. http://192.168.1.50:7125
+    api_key = db.Column(db.String(64), nullable=True)
     
     current_job_id = db.Column(db.Integer, db.ForeignKey('print_jobs.id'), nullable=True) # Optional back ref helper
 
@@ -106,6 +152,7 @@ class Order(db.Model):
     customer_user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     status = db.Column(db.String(20), default=OrderStatus.NEW, index=True)
     priority = db.Column(db.Boolean, default=False)
+    due_date = db.Column(db.DateTime, nullable=True)
     shipping_address = db.Column(db.Text) # JSON string snapshot
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -123,6 +170,14 @@ class Order(db.Model):
         """Calculates total estimated weight of all jobs in the order."""
         return sum(job.estimated_material_grams * job.quantity for job in self.jobs)
 
+    @property
+    def units_total(self):
+        return sum(job.quantity for job in self.jobs)
+
+    @property
+    def units_done(self):
+        return sum(job.quantity for job in self.jobs if job.status == JobStatus.DONE)
+
 class PrintJob(db.Model):
     __tablename__ = 'print_jobs'
     id = db.Column(db.Integer, primary_key=True)
@@ -130,6 +185,8 @@ class PrintJob(db.Model):
     
     stl_path = db.Column(db.String(256), nullable=False)
     original_filename = db.Column(db.String(256), nullable=False)
+    # SHA-256 of the upload when it lives in the content-addressed store
+    file_hash = db.Column(db.String(64), db.ForeignKey('stored_files.sha256'), nullable=True, index=True)
     
     material_type = db.Column(db.String(20), nullable=False)
     color = db.Column(db.String(30), nullable=False)
@@ -138,12 +195,51 @@ class PrintJob(db.Model):
     # Estimates per unit
     estimated_time_minutes = db.Column(db.Integer, default=60)
     estimated_material_grams = db.Column(db.Float, default=50.0)
+    # Pending while a background task analyzes the uploaded mesh
+    analysis_status = db.Column(db.String(20), default=AnalysisStatus.DONE)
+    # Per-unit estimate before calibration (services/calibration); the
+    # factors are fitted against these, not the calibrated values above
+    model_time_minutes = db.Column(db.Float, nullable=True)
+    model_material_grams = db.Column(db.Float, nullable=True)
+
+    # What really happened, recorded by start_job/finish_job
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    # Total for the run (all units), weighed by the operator
+    actual_material_grams = db.Column(db.Float, nullable=True)
     
     assigned_printer_id = db.Column(db.Integer, db.ForeignKey('printers.id'), nullable=True)
     status = db.Column(db.String(20), default=JobStatus.WAITING, index=True)
     operator_notes = db.Column(db.Text)
 
+    # Set on runs split off a high-quantity job (see workflow.split_job)
+    parent_job_id = db.Column(db.Integer, db.ForeignKey('print_jobs.id'), nullable=True)
+    # Set when the job is nested with others on one build plate
+    plate_id = db.Column(db.Integer, db.ForeignKey('plates.id'), nullable=True, index=True)
+
     printer = db.relationship('Printer', foreign_keys=[assigned_printer_id], backref='jobs')
+    runs = db.relationship('PrintJob', backref=db.backref('parent_job', remote_side=[id]))
+
+class Plate(db.Model):
+    """Several small jobs of the same material/color printed as one run."""
+    __tablename__ = 'plates'
+    id = db.Column(db.Integer, primary_key=True)
+    material_type = db.Column(db.String(20), nullable=False)
+    color = db.Column(db.String(30), nullable=False)
+    bed_width_mm = db.Column(db.Float, nullable=False)
+    bed_depth_mm = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(20), default=PlateStatus.PLANNED, index=True)
+    assigned_printer_id = db.Column(db.Integer, db.ForeignKey('printers.id'), nullable=True)
+    # JSON list of {job_id, x, y, w, d, rotated} in mm, one entry per unit
+    layout_json = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    jobs = db.relationship('PrintJob', backref='plate')
+    printer = db.relationship('Printer', foreign_keys=[assigned_printer_id])
+
+    @property
+    def estimated_time_minutes(self):
+        return sum(job.estimated_time_minutes * job.quantity for job in self.jobs)
 
 class Shipment(db.Model):
     __tablename__ = 'shipments'
@@ -156,6 +252,300 @@ class Shipment(db.Model):
     shipped_at = db.Column(db.DateTime, default=datetime.utcnow)
     delivered_at = db.Column(db.DateTime, nullable=True)
 
+class StoredFile(db.Model):
+    """
+    One copy of an uploaded file, keyed by the SHA-256 of its contents
+    (see services/storage.store_upload). ref_count is the number of
+    PrintJobs pointing at it and is kept up to date by the listeners below.
+    """
+    __tablename__ = 'stored_files'
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), unique=True, nullable=False)
+    rel_path = db.Column(db.String(256), nullable=False)
+    size_bytes = db.Column(db.Integer, default=0)
+    ref_count = db.Column(db.Integer, default=0, nullable=False)
+    # Cached geometry.mesh_metrics output; material-independent
+    analysis_json = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+def _adjust_refs(connection, sha256, delta):
+    if sha256:
+        table = StoredFile.__table__
+        connection.execute(table.update().where(table.c.sha256 == sha256)
+                           .values(ref_count=table.c.ref_count + delta))
+
+@event.listens_for(PrintJob, 'after_insert')
+def _job_inserted(mapper, connection, job):
+    _adjust_refs(connection, job.file_hash, 1)
+
+@event.listens_for(PrintJob, 'after_delete')
+def _job_deleted(mapper, connection, job):
+    _adjust_refs(connection, job.file_hash, -1)
+
+@event.listens_for(PrintJob, 'after_update')
+def _job_updated(mapper, connection, job):
+    history = db.inspect(job).attrs.file_hash.history
+    if history.has_changes():
+        for old in history.deleted:
+            _adjust_refs(connection, old, -1)
+        for new in history.added:
+            _adjust_refs(connection, new, 1)
+
+class DailyOrderStat(db.Model):
+    """
+    Orders created on `day`, by current status. Kept current by the
+    listeners below (and rebuilt by scripts/rebuild_rollups.py), so the
+    analytics dashboard reads a row per day and status, not every order.
+    """
+    __tablename__ = 'daily_order_stats'
+    __table_args__ = (db.UniqueConstraint('day', 'status'),)
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False)
+    orders = db.Column(db.Integer, default=0, nullable=False)
+
+class DailyJobStat(db.Model):
+    """Jobs and estimated grams of the orders created on `day`; see DailyOrderStat."""
+    __tablename__ = 'daily_job_stats'
+    __table_args__ = (db.UniqueConstraint('day', 'printer_id', 'material_type', 'order_status'),)
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    # 0 while unassigned; no foreign key, history outlives deleted printers
+    printer_id = db.Column(db.Integer, default=0, nullable=False)
+    material_type = db.Column(db.String(20), nullable=False)
+    order_status = db.Column(db.String(20), nullable=False)
+    jobs = db.Column(db.Integer, default=0, nullable=False)
+    grams = db.Column(db.Float, default=0.0, nullable=False)
+
+def _bump(connection, model, key, **deltas):
+    """Adds `deltas` to the rollup row for `key`, creating it if needed."""
+    table = model.__table__
+    updated = connection.execute(table.update().where(*[table.c[k] == v for k, v in key.items()])
+                                 .values({k: table.c[k] + v for k, v in deltas.items()})).rowcount
+    if not updated:
+        connection.execute(table.insert().values(**key, **deltas))
+
+def _order_row(connection, order_id):
+    table = Order.__table__
+    return connection.execute(select(table.c.created_at, table.c.status).where(table.c.id == order_id)).one()
+
+def _bump_jobs(connection, order_row, status, printer_id, material_type, jobs, grams):
+    key = {'day': order_row.created_at.date(), 'printer_id': printer_id or 0,
+           'material_type': material_type, 'order_status': status}
+    _bump(connection, DailyJobStat, key, jobs=jobs, grams=grams or 0.0)
+
+# The rollup listeners read old values back from the database: attribute
+# history has no "before" for an attribute that was expired when it was set.
+# Orders flush before their jobs on insert and update, and after them on delete.
+ROLLUP_JOB_ATTRS = ('assigned_printer_id', 'material_type', 'estimated_material_grams')
+
+@event.listens_for(Order, 'after_insert')
+def _order_inserted(mapper, connection, order):
+    _bump(connection, DailyOrderStat, {'day': order.created_at.date(), 'status': order.status}, orders=1)
+
+@event.listens_for(Order, 'before_delete')
+def _order_deleting(mapper, connection, order):
+    row = _order_row(connection, order.id)
+    _bump(connection, DailyOrderStat, {'day': row.created_at.date(), 'status': row.status}, orders=-1)
+
+@event.listens_for(Order, 'before_update')
+def _order_updating(mapper, connection, order):
+    if not db.inspect(order).attrs.status.history.has_changes():
+        return
+    old = _order_row(connection, order.id)
+    if old.status == order.status:
+        return
+    day = old.created_at.date()
+    _bump(connection, DailyOrderStat, {'day': day, 'status': old.status}, orders=-1)
+    _bump(connection, DailyOrderStat, {'day': day, 'status': order.status}, orders=1)
+
+    # Every job of the order moves to the new status, as the database has it
+    jobs = PrintJob.__table__
+    groups = connection.execute(
+        select(jobs.c.assigned_printer_id, jobs.c.material_type, func.count(), func.sum(jobs.c.estimated_material_grams))
+        .where(jobs.c.order_id == order.id)
+        .group_by(jobs.c.assigned_printer_id, jobs.c.material_type)).all()
+    for printer_id, material_type, count, grams in groups:
+        _bump_jobs(connection, old, old.status, printer_id, material_type, -count, -(grams or 0.0))
+        _bump_jobs(connection, old, order.status, printer_id, material_type, count, grams)
+
+def _job_row(connection, job_id):
+    table = PrintJob.__table__
+    return connection.execute(select(table.c.order_id, table.c.assigned_printer_id, table.c.material_type,
+                                     table.c.estimated_material_grams).where(table.c.id == job_id)).one()
+
+@event.listens_for(PrintJob, 'after_insert')
+def _job_rolled_up(mapper, connection, job):
+    order = _order_row(connection, job.order_id)
+    _bump_jobs(connection, order, order.status, job.assigned_printer_id, job.material_type,
+               1, job.estimated_material_grams)
+
+@event.listens_for(PrintJob, 'before_delete')
+def _job_rollup_deleting(mapper, connection, job):
+    old = _job_row(connection, job.id)
+    order = _order_row(connection, old.order_id)
+    _bump_jobs(connection, order, order.status, old.assigned_printer_id, old.material_type,
+               -1, -(old.estimated_material_grams or 0.0))
+
+@event.listens_for(PrintJob, 'before_update')
+def _job_rollup_updating(mapper, connection, job):
+    state = db.inspect(job)
+    if not any(state.attrs[name].history.has_changes() for name in ROLLUP_JOB_ATTRS):
+        return
+    old = _job_row(connection, job.id)
+    order = _order_row(connection, old.order_id)
+    _bump_jobs(connection, order, order.status, old.assigned_printer_id, old.material_type,
+               -1, -(old.estimated_material_grams or 0.0))
+    _bump_jobs(connection, order, order.status, job.assigned_printer_id, job.material_type,
+               1, job.estimated_material_grams)
+
+class PrinterStatusChange(db.Model):
+    """
+    A printer entering `status` at `changed_at`; it stays there until the
+    printer's next row. Written by the listeners below whenever
+    Printer.status changes, read as intervals by services/utilization.py.
+    """
+    __tablename__ = 'printer_status_changes'
+    __table_args__ = (db.Index('ix_printer_status_changes_printer_time', 'printer_id', 'changed_at'),)
+    id = db.Column(db.Integer, primary_key=True)
+    # No foreign key, history outlives deleted printers
+    printer_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+class PrinterDayStat(db.Model):
+    """
+    Seconds a printer spent in each status on `day`, from its closed status
+    intervals: the interval a change ends is added when the change is
+    recorded, so long windows read one row per printer and day.
+    """
+    __tablename__ = 'printer_day_stats'
+    __table_args__ = (db.UniqueConstraint('printer_id', 'day'),)
+    id = db.Column(db.Integer, primary_key=True)
+    printer_id = db.Column(db.Integer, nullable=False)
+    day = db.Column(db.Date, nullable=False, index=True)
+    idle_seconds = db.Column(db.Float, default=0.0, nullable=False)
+    printing_seconds = db.Column(db.Float, default=0.0, nullable=False)
+    error_seconds = db.Column(db.Float, default=0.0, nullable=False)
+    maintenance_seconds = db.Column(db.Float, default=0.0, nullable=False)
+
+# PrinterDayStat column for each PrinterStatus
+PRINTER_DAY_COLUMNS = {
+    PrinterStatus.IDLE: 'idle_seconds',
+    PrinterStatus.PRINTING: 'printing_seconds',
+    PrinterStatus.ERROR: 'error_seconds',
+    PrinterStatus.MAINTENANCE: 'maintenance_seconds',
+}
+
+def split_by_day(start, end):
+    """Yields (date, seconds) for the part of [start, end) on each calendar day."""
+    while start < end:
+        midnight = datetime.combine(start.date(), datetime.min.time()) + timedelta(days=1)
+        yield start.date(), (min(end, midnight) - start).total_seconds()
+        start = midnight
+
+def _record_printer_status(connection, printer_id, status):
+    now = datetime.utcnow()
+    table = PrinterStatusChange.__table__
+    previous = connection.execute(select(table.c.status, table.c.changed_at)
+                                  .where(table.c.printer_id == printer_id)
+                                  .order_by(table.c.changed_at.desc()).limit(1)).first()
+    if previous is not None and previous.status in PRINTER_DAY_COLUMNS:
+        for day, seconds in split_by_day(previous.changed_at, now):
+            _bump(connection, PrinterDayStat, {'printer_id': printer_id, 'day': day},
+                  **{PRINTER_DAY_COLUMNS[previous.status]: seconds})
+    connection.execute(table.insert().values(printer_id=printer_id, status=status, changed_at=now))
+
+@event.listens_for(Printer, 'after_insert')
+def _printer_inserted(mapper, connection, printer):
+    _record_printer_status(connection, printer.id, printer.status)
+
+@event.listens_for(Printer, 'before_update')
+def _printer_updating(mapper, connection, printer):
+    if not db.inspect(printer).attrs.status.history.has_changes():
+        return
+    table = Printer.__table__
+    old = connection.execute(select(table.c.status).where(table.c.id == printer.id)).scalar()
+    if old != printer.status:
+        _record_printer_status(connection, printer.id, printer.status)
+
+class Upload(db.Model):
+    """
+    A file arriving in chunks (see services/uploads.py). Bytes collect in
+    uploads/partial/<id>.part until complete, then move into the
+    content-addressed store; an order consumes the upload by id.
+    """
+    __tablename__ = 'uploads'
+    id = db.Column(db.String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    customer_user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    filename = db.Column(db.String(256), nullable=False)
+    size_bytes = db.Column(db.Integer, nullable=False)
+    received_bytes = db.Column(db.Integer, default=0, nullable=False)
+    status = db.Column(db.String(20), default=UploadStatus.RECEIVING, index=True)
+    file_hash = db.Column(db.String(64), db.ForeignKey('stored_files.sha256'), nullable=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    stored_file = db.relationship('StoredFile')
+
+class Task(db.Model):
+    """Background work picked up by scripts/run_worker.py (see services/tasks.py)."""
+    __tablename__ = 'tasks'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload_json = db.Column(db.Text)
+    status = db.Column(db.String(20), default=TaskStatus.PENDING, index=True)
+    attempts = db.Column(db.Integer, default=0)
+    error = db.Column(db.Text, nullable=True)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+class PricingRule(db.Model):
+    """
+    One row of the price list (see services/pricing.py). Which columns
+    matter depends on `kind`; the service compiles the active rules into a
+    rate table and recompiles whenever a rule changes.
+    """
+    __tablename__ = 'pricing_rules'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)
+    # MATERIAL: NULL is the default for materials without their own rule
+    material_type = db.Column(db.String(20), nullable=True)
+    rate_per_gram = db.Column(db.Float, nullable=True)
+    rate_per_minute = db.Column(db.Float, nullable=True)
+    base_fee = db.Column(db.Float, nullable=True)
+    # QUANTITY_BREAK
+    min_quantity = db.Column(db.Integer, nullable=True)
+    # QUANTITY_BREAK / CUSTOMER: discount; RUSH: surcharge
+    percent = db.Column(db.Float, nullable=True)
+    # CUSTOMER
+    customer_user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    active = db.Column(db.Boolean, default=True, nullable=False)
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    customer = db.relationship('User')
+
+class CalibrationCell(db.Model):
+    """
+    Running sums of log(actual / estimate) for one printer and material
+    (see services/calibration.py). Finishing a job adds to one cell, so
+    refitting costs the same however long the history is.
+    """
+    __tablename__ = 'calibration_cells'
+    __table_args__ = (db.UniqueConstraint('metric', 'printer_id', 'material_type'),)
+    id = db.Column(db.Integer, primary_key=True)
+    metric = db.Column(db.String(20), nullable=False)  # 'time' or 'material'
+    printer_id = db.Column(db.Integer, db.ForeignKey('printers.id'), nullable=False)
+    material_type = db.Column(db.String(20), nullable=False)
+    count = db.Column(db.Integer, default=0, nullable=False)
+    sum_log = db.Column(db.Float, default=0.0, nullable=False)
+    sum_log_sq = db.Column(db.Float, default=0.0, nullable=False)
+
 class AuditLog(db.Model):
     __tablename__ = 'audit_logs'
     id = db.Column(db.Integer, primary_key=True)
@@ -1,13 +1,29 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+import os
+import re
+from datetime import datetime, timedelta
+from flask import Blueprint, Response, render_template, redirect, url_for, flash, request, send_file, abort, jsonify
 from flask_login import login_required, current_user
 
 from app.extensions import db
-from app.models import Order, PrintJob, Printer, UserRole, JobStatus, PrinterStatus
+from app.models import Order, PrintJob, Printer, Plate, UserRole, JobStatus, PrinterStatus, PlateStatus
 from app.auth.decorators import role_required
-from app.services.workflow import start_job, finish_job, fail_job, assign_job
+from app.services.workflow import (start_job, finish_job, fail_job, assign_job, assign_job_parallel,
+                                   assign_plate, start_plate, finish_plate, fail_plate, dissolve_plate)
+from app.services.nesting import build_plates, plate_layout
+from app.services.scheduler import run_scheduler, plan_current_queue, plan_summary
+from app.services.audit import log_action
+from app.services.thumbnails import thumbnail_path
+from app.services import events, telemetry_history
+from app.services.job_board import load_board, board_page, DEFAULT_PAGE_SIZE
+from app.services.telemetry import latest_sample
 
 operator_bp = Blueprint('operator', __name__)
 
+# Thumbnails are keyed by content hash, so a URL's image never changes
+THUMBNAIL_MAX_AGE = 365 * 24 * 3600
+# The telemetry history keeps 15-minute buckets for 90 days
+MAX_TELEMETRY_HOURS = 90 * 24
+
 @operator_bp.route('/dashboard')
 @login_required
 @role_required(UserRole.OPERATOR, UserRole.ADMIN)
@@ -32,21 +48,60 @@ def dashboard():
 @login_required
 @role_required(UserRole.OPERATOR, UserRole.ADMIN)
 def jobs():
-    # Filter options could be added here
-    waiting_jobs = PrintJob.query.filter_by(status=JobStatus.WAITING).order_by(PrintJob.order_id.asc()).all()
-    queued_jobs = PrintJob.query.filter_by(status=JobStatus.QUEUED).all()
-    printing_jobs = PrintJob.query.filter_by(status=JobStatus.PRINTING).all()
-    failed_jobs = PrintJob.query.filter_by(status=JobStatus.FAILED).all()
-    
-    printers = Printer.query.all()
-    
+    board, printers = load_board()
     return render_template('operator/jobs.html', 
-                           waiting_jobs=waiting_jobs, 
-                           queued_jobs=queued_jobs,
-                           printing_jobs=printing_jobs,
-                           failed_jobs=failed_jobs,
+                           waiting_jobs=board[JobStatus.WAITING], 
+                           queued_jobs=board[JobStatus.QUEUED],
+                           printing_jobs=board[JobStatus.PRINTING],
+                           failed_jobs=board[JobStatus.FAILED],
                            printers=printers)
 
+@operator_bp.route('/api/jobs')
+@login_required
+@role_required(UserRole.OPERATOR, UserRole.ADMIN)
+def jobs_api():
+    """The job board as JSON: ?status=waiting|queued|printing|failed&page=1&per_page=50."""
+    try:
+        return jsonify(board_page(request.args.get('status') or None,
+                                  request.args.get('page', 1, type=int),
+                                  request.args.get('per_page', DEFAULT_PAGE_SIZE, type=int)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@operator_bp.route('/events')
+@login_required
+@role_required(UserRole.OPERATOR, UserRole.ADMIN)
+def live_events():
+    """Server-Sent Events stream of job and printer changes for the operator pages."""
+    path = events.log_path()
+    if not path:
+        abort(404)
+    after_id = request.headers.get('Last-Event-ID', type=int)
+    if after_id is None:
+        after_id = events.latest_event_id(path)
+    response = Response(events.stream(path, after_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Tell nginx not to buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@operator_bp.route('/thumbnails/<sha256>.png')
+@login_required
+@role_required(UserRole.OPERATOR, UserRole.ADMIN)
+def thumbnail(sha256):
+    if not re.fullmatch(r'[0-9a-f]{64}', sha256):
+        abort(404)
+    path = thumbnail_path(sha256)
+    if not os.path.exists(path):
+        # Not rendered yet (the worker does it after upload)
+        abort(404)
+    response = send_file(path, mimetype='image/png', max_age=THUMBNAIL_MAX_AGE)
+    # Behind login: browsers may keep it, shared caches may not
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
 @operator_bp.route('/jobs/<int:job_id>/action', methods=['POST'])
 @login_required
 @role_required(UserRole.OPERATOR, UserRole.ADMIN)
@@ -55,6 +110,9 @@ def job_action(job_id):
     action = request.form.get('action')
     
     try:
+        if job.plate_id and action in ('assign', 'split_assign', 'start', 'finish', 'fail'):
+            raise ValueError(f'Job #{job_id} is nested on plate #{job.plate_id}. Use the Plates page.')
+
         if action == 'assign':
             printer_id = request.form.get('printer_id')
             assign_job(job, printer_id, current_user.id)
@@ -62,12 +120,19 @@ def job_action(job_id):
             db.session.commit()
             flash(f'Job #{job_id} assigned to printer.', 'success')
             
+        elif action == 'split_assign':
+            runs = assign_job_parallel(job, current_user.id)
+            flash(f'Job #{job_id} split into {len(runs)} run(s) across idle printers.', 'success')
+            
         elif action == 'start':
             start_job(job, current_user.id)
             flash(f'Job #{job_id} started.', 'success')
             
         elif action == 'finish':
-            finish_job(job, current_user.id)
+            actual_grams = request.form.get('actual_grams', type=float)
+            if actual_grams is not None and actual_grams <= 0:
+                raise ValueError('Actual grams must be positive')
+            finish_job(job, current_user.id, actual_grams=actual_grams)
             flash(f'Job #{job_id} marked as completed.', 'success')
             
         elif action == 'fail':
@@ -88,6 +153,80 @@ def job_action(job_id):
         
     return redirect(url_for('operator.jobs'))
 
+@operator_bp.route('/jobs/auto-assign', methods=['POST'])
+@login_required
+@role_required(UserRole.OPERATOR, UserRole.ADMIN)
+def auto_assign():
+    try:
+        assigned = run_scheduler(current_user.id)
+        if assigned:
+            flash(f'Auto-assigned {len(assigned)} job(s) to idle printers.', 'success')
+        else:
+            flash('Nothing to assign: no waiting jobs or no idle printers.', 'info')
+    except Exception as e:
+        flash(str(e), 'danger')
+
+    return redirect(url_for('operator.jobs'))
+
+@operator_bp.route('/jobs/sequencing')
+@login_required
+@role_required(UserRole.OPERATOR, UserRole.ADMIN)
+def sequencing():
+    # Read-only preview of what the scheduler would do right now
+    plan = plan_current_queue()
+    return render_template('operator/sequencing.html', plan=plan, summary=plan_summary(plan))
+
+@operator_bp.route('/plates')
+@login_required
+@role_required(UserRole.OPERATOR, UserRole.ADMIN)
+def plates():
+    active = Plate.query.filter(
+        Plate.status.in_([PlateStatus.PLANNED, PlateStatus.QUEUED, PlateStatus.PRINTING])
+    ).order_by(Plate.id.asc()).all()
+    printers = Printer.query.all()
+    layouts = {plate.id: plate_layout(plate) for plate in active}
+    return render_template('operator/plates.html', plates=active, printers=printers, layouts=layouts)
+
+@operator_bp.route('/plates/build', methods=['POST'])
+@login_required
+@role_required(UserRole.OPERATOR, UserRole.ADMIN)
+def plates_build():
+    printer = Printer.query.get_or_404(request.form.get('printer_id', type=int))
+    new_plates = build_plates(printer.bed_width_mm, printer.bed_depth_mm, current_user.id)
+    if new_plates:
+        flash(f'Built {len(new_plates)} plate(s) for a {printer.bed_width_mm:g}x{printer.bed_depth_mm:g}mm bed.', 'success')
+    else:
+        flash('No small waiting jobs could be nested together.', 'info')
+    return redirect(url_for('operator.plates'))
+
+@operator_bp.route('/plates/<int:plate_id>/action', methods=['POST'])
+@login_required
+@role_required(UserRole.OPERATOR, UserRole.ADMIN)
+def plate_action(plate_id):
+    plate = Plate.query.get_or_404(plate_id)
+    action = request.form.get('action')
+
+    try:
+        if action == 'assign':
+            assign_plate(plate, request.form.get('printer_id', type=int), current_user.id)
+            flash(f'Plate #{plate_id} assigned to printer.', 'success')
+        elif action == 'start':
+            start_plate(plate, current_user.id)
+            flash(f'Plate #{plate_id} started.', 'success')
+        elif action == 'finish':
+            finish_plate(plate, current_user.id)
+            flash(f'Plate #{plate_id} completed. {len(plate.jobs)} job(s) done.', 'success')
+        elif action == 'fail':
+            fail_plate(plate, current_user.id)
+            flash(f'Plate #{plate_id} failed. Retry its jobs from the Job Queue.', 'warning')
+        elif action == 'dissolve':
+            dissolve_plate(plate, current_user.id)
+            flash(f'Plate #{plate_id} dissolved.', 'info')
+    except Exception as e:
+        flash(str(e), 'danger')
+
+    return redirect(url_for('operator.plates'))
+
 @operator_bp.route('/printers')
 @login_required
 @role_required(UserRole.OPERATOR, UserRole.ADMIN)
@@ -101,4 +240,29 @@ def printers():
 def printer_detail(id):
     printer = Printer.query.get_or_404(id)
     history = PrintJob.query.filter_by(assigned_printer_id=id).order_by(PrintJob.id.desc()).limit(10).all()
-    return render_template('operator/printer_detail.html', printer=printer, history=history)
+    return render_template('operator/printer_detail.html', printer=printer, history=history,
+                           telemetry=latest_sample(printer.id))
+
+@operator_bp.route('/printers/<int:id>/telemetry')
+@login_required
+@role_required(UserRole.OPERATOR, UserRole.ADMIN)
+def printer_telemetry(id):
+    """Chart-ready telemetry history of the last `hours` (up to the 90 days kept)."""
+    printer = Printer.query.get_or_404(id)
+    hours = max(1, min(request.args.get('hours', 24, type=int), MAX_TELEMETRY_HOURS))
+    end = datetime.utcnow()
+    return jsonify(telemetry_history.query(printer.id, end - timedelta(hours=hours), end))
+
+@operator_bp.route('/printers/<int:id>/spool', methods=['POST'])
+@login_required
+@role_required(UserRole.OPERATOR, UserRole.ADMIN)
+def printer_spool(id):
+    printer = Printer.query.get_or_404(id)
+    before = {'material': printer.loaded_material, 'color': printer.loaded_color}
+    printer.loaded_material = request.form.get('material_type') or None
+    printer.loaded_color = request.form.get('color') or None
+    log_action(current_user.id, "load_spool", "Printer", printer.id,
+               before=before, after={'material': printer.loaded_material, 'color': printer.loaded_color})
+    db.session.commit()
+    flash(f'Loaded spool updated for {printer.name}.', 'success')
+    return redirect(url_for('operator.printer_detail', id=printer.id))
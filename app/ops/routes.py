@@ -8,6 +8,7 @@ from app.auth.decorators import role_required
 from app.services.inventory import check_filament_stock, get_reorder_suggestions
 from app.services.workflow import create_shipment
 from app.services.audit import log_action
+from app.services.simulation import what_if
 
 ops_bp = Blueprint('ops', __name__)
 
@@ -76,3 +77,12 @@ def shipments():
 def reorder():
     suggestions = get_reorder_suggestions()
     return render_template('ops/reorder.html', suggestions=suggestions)
+
+@ops_bp.route('/capacity')
+@login_required
+@role_required(UserRole.OPS_MANAGER, UserRole.ADMIN)
+def capacity():
+    # What-if runs on a snapshot only, so this page never writes anything
+    extra_printers = max(0, min(request.args.get('extra_printers', 5, type=int), 100))
+    result = what_if(extra_printers)
+    return render_template('ops/capacity.html', result=result, extra_printers=extra_printers)
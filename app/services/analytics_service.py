@@ -1,9 +1,59 @@
+import hashlib
+import json
+import time
+from collections import Counter
 from datetime import datetime, timedelta
-from sqlalchemy import func
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
 from app.extensions import db
-from app.models import Order, PrintJob, Filament, OrderStatus, JobStatus, Printer
+from app.models import Order, PrintJob, Printer, DailyOrderStat, DailyJobStat, ROLLUP_JOB_ATTRS
+from app.services.utilization import printer_utilization
+
+# Other processes' writes show up within this long; this process's own
+# commits clear the cache at once (see _note_rollup_changes)
+STATS_TTL_SECONDS = 60
+MAX_STATS_DAYS = 366
+
+# (days, printer_id) -> {'data', 'etag', 'last_modified', 'expires'}
+_stats_cache = {}
+
+
+@event.listens_for(Session, 'after_flush')
+def _note_rollup_changes(session, flush_context):
+    """Flags the transaction if it changed anything the dashboard shows."""
+    for obj in session.new | session.deleted:
+        if isinstance(obj, (Order, PrintJob)):
+            session.info['analytics_stale'] = True
+            return
+    for obj in session.dirty:
+        if isinstance(obj, (Order, Printer)):
+            attrs = ('status',)
+        else:
+            attrs = ROLLUP_JOB_ATTRS if isinstance(obj, PrintJob) else ()
+        state = db.inspect(obj)
+        if any(state.attrs[name].history.has_changes() for name in attrs):
+            session.info['analytics_stale'] = True
+            return
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    if session.info.pop('analytics_stale', False):
+        _stats_cache.clear()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_on_rollback(session):
+    session.info.pop('analytics_stale', None)
+
 
 class AnalyticsService:
+    """
+    Dashboard numbers, read from the daily rollup tables (DailyOrderStat,
+    DailyJobStat) so each query touches a few rows per day instead of the
+    whole order history. The rollups are maintained as orders and jobs are
+    written; rebuild_rollups recomputes them from scratch.
+    """
     @staticmethod
     def get_orders_per_day(days=30, printer_id=None):
         """
@@ -12,33 +62,24 @@ class AnalyticsService:
         end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=days - 1)
         start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
-        
-        query = db.session.query(
-            func.date(Order.created_at).label('date'),
-            func.count(Order.id).label('count')
-        ).filter(Order.created_at >= start_date)
 
         if printer_id:
-            # If printer_id is specified, we filter orders that have at least one job assigned to this printer
-            # or strictly we could look at jobs, but "Orders per day" is an Order metric.
-            # To make it printer specific, maybe we switch to "Jobs per day" or filter orders containing jobs for this printer.
-            # Let's filter orders that have jobs assigned to this printer.
-            query = query.join(PrintJob).filter(PrintJob.assigned_printer_id == printer_id)
-
-        stats = query.group_by('date').all()
-        
-        # Fill in missing days
-        results = {}
-        for s in stats:
-            date_key = s.date
-            if not isinstance(date_key, str):
-                date_key = date_key.strftime('%Y-%m-%d')
-            results[date_key] = s.count
+            # Orders counted once per job they have on this printer
+            query = db.session.query(DailyJobStat.day, func.sum(DailyJobStat.jobs))\
+                .filter(DailyJobStat.printer_id == printer_id, DailyJobStat.day >= start_date.date())\
+                .group_by(DailyJobStat.day)
+        else:
+            query = db.session.query(DailyOrderStat.day, func.sum(DailyOrderStat.orders))\
+                .filter(DailyOrderStat.day >= start_date.date())\
+                .group_by(DailyOrderStat.day)
+        stats = query.all()
+
+        results = {day.strftime('%Y-%m-%d'): int(count or 0) for day, count in stats}
         data = []
         for i in range(days):
             day = (start_date + timedelta(days=i)).strftime('%Y-%m-%d')
             data.append({'date': day, 'count': results.get(day, 0)})
-            
+
         return data
 
     @staticmethod
@@ -46,16 +87,14 @@ class AnalyticsService:
         """
         Returns a breakdown of orders by status.
         """
-        query = db.session.query(
-            Order.status,
-            func.count(Order.id).label('count')
-        )
-
         if printer_id:
-            query = query.join(PrintJob).filter(PrintJob.assigned_printer_id == printer_id)
-
-        stats = query.group_by(Order.status).all()
-        return [{'status': s.status, 'count': s.count} for s in stats]
+            stats = db.session.query(DailyJobStat.order_status, func.sum(DailyJobStat.jobs))\
+                .filter(DailyJobStat.printer_id == printer_id)\
+                .group_by(DailyJobStat.order_status).all()
+        else:
+            stats = db.session.query(DailyOrderStat.status, func.sum(DailyOrderStat.orders))\
+                .group_by(DailyOrderStat.status).all()
+        return [{'status': status, 'count': int(count)} for status, count in stats if count]
 
     @staticmethod
     def get_filament_usage_stats(printer_id=None):
@@ -63,27 +102,97 @@ class AnalyticsService:
         Returns distribution of material types requested in jobs.
         """
         query = db.session.query(
-            PrintJob.material_type,
-            func.sum(PrintJob.estimated_material_grams).label('total_grams')
+            DailyJobStat.material_type,
+            func.sum(DailyJobStat.grams).label('total_grams'),
+            func.sum(DailyJobStat.jobs).label('jobs')
         )
-        
+
         if printer_id:
-            query = query.filter(PrintJob.assigned_printer_id == printer_id)
-            
-        stats = query.group_by(PrintJob.material_type).all()
-        # Filter out None if any
-        return [{'material': s.material_type, 'grams': float(s.total_grams or 0)} for s in stats if s.material_type]
+            query = query.filter(DailyJobStat.printer_id == printer_id)
+
+        stats = query.group_by(DailyJobStat.material_type).all()
+        return [{'material': s.material_type, 'grams': float(s.total_grams or 0)} for s in stats if s.jobs]
 
     @staticmethod
-    def get_printer_utilization():
+    def get_printer_utilization(days=30):
         """
-        Returns job counts per printer.
+        Returns per printer the jobs assigned and the busy / idle /
+        maintenance percentages of the last `days` (services/utilization).
         """
-        query = db.session.query(
-            Printer.name,
-            func.count(PrintJob.id).label('job_count')
-        ).outerjoin(PrintJob, Printer.id == PrintJob.assigned_printer_id)\
-         .group_by(Printer.id)
-         
-        stats = query.all()
-        return [{'printer': s.name, 'jobs': s.job_count} for s in stats]
+        counts = dict(db.session.query(DailyJobStat.printer_id, func.sum(DailyJobStat.jobs))
+                      .group_by(DailyJobStat.printer_id).all())
+        printers = Printer.query.order_by(Printer.id).all()
+        end = datetime.utcnow()
+        totals = printer_utilization(end - timedelta(days=days), end, 'day', [p.id for p in printers])['totals']
+        return [dict({'printer': p.name, 'jobs': int(counts.get(p.id) or 0)}, **totals[p.id])
+                for p in printers]
+
+    @staticmethod
+    def get_stats(days=30, printer_id=None):
+        """
+        All four dashboard series in one dict, cached per (days, printer_id)
+        for STATS_TTL_SECONDS. Returns {'data', 'etag', 'last_modified'};
+        the ETag is a hash of the data, so a recompute that finds nothing
+        new keeps the validators the client already has.
+        """
+        days = max(1, min(int(days), MAX_STATS_DAYS))
+        key = (days, printer_id)
+        now = time.monotonic()
+        entry = _stats_cache.get(key)
+        if entry is not None and entry['expires'] > now:
+            return entry
+
+        data = {
+            'orders_per_day': AnalyticsService.get_orders_per_day(days, printer_id),
+            'order_status': AnalyticsService.get_order_status_distribution(printer_id),
+            'filament_usage': AnalyticsService.get_filament_usage_stats(printer_id),
+            'printer_utilization': AnalyticsService.get_printer_utilization(days)
+        }
+        etag = hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+        if entry is not None and entry['etag'] == etag:
+            last_modified = entry['last_modified']
+        else:
+            last_modified = datetime.utcnow().replace(microsecond=0)
+        entry = _stats_cache[key] = {'data': data, 'etag': etag, 'last_modified': last_modified,
+                                     'expires': now + STATS_TTL_SECONDS}
+        return entry
+
+    @staticmethod
+    def invalidate_stats():
+        """Drops every cached series; commits that change orders or jobs do this themselves."""
+        _stats_cache.clear()
+
+    @staticmethod
+    def rebuild_rollups(batch_size=1000):
+        """
+        Recomputes both rollup tables from orders and jobs in one streaming
+        pass each. The listeners keep them current; run this after a bulk
+        import or nightly to repair any drift. Returns the rows written.
+        """
+        orders = Counter()
+        for created_at, status in db.session.query(Order.created_at, Order.status).yield_per(batch_size):
+            orders[(created_at.date(), status)] += 1
+
+        jobs = Counter()
+        grams = Counter()
+        rows = db.session.query(Order.created_at, Order.status, PrintJob.assigned_printer_id,
+                                PrintJob.material_type, PrintJob.estimated_material_grams)\
+            .join(PrintJob, PrintJob.order_id == Order.id).yield_per(batch_size)
+        for created_at, status, printer_id, material_type, estimate in rows:
+            key = (created_at.date(), printer_id or 0, material_type, status)
+            jobs[key] += 1
+            grams[key] += estimate or 0.0
+
+        DailyOrderStat.query.delete()
+        DailyJobStat.query.delete()
+        if orders:
+            db.session.execute(DailyOrderStat.__table__.insert(), [
+                {'day': day, 'status': status, 'orders': n} for (day, status), n in orders.items()])
+        if jobs:
+            db.session.execute(DailyJobStat.__table__.insert(), [
+                {'day': key[0], 'printer_id': key[1], 'material_type': key[2], 'order_status': key[3],
+                 'jobs': n, 'grams': grams[key]}
+                for key, n in jobs.items()])
+        db.session.commit()
+        AnalyticsService.invalidate_stats()
+        return len(orders) + len(jobs)
@@ -0,0 +1,214 @@
+import math
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.models import CalibrationCell, PrintJob, Printer, JobStatus
+from app.services.geometry import profile_time_factor
+
+# The model: log(actual / estimate) = printer term + material term, fitted
+# by ridge-regularised least squares. PRIOR_WEIGHT pseudo-observations pull
+# every term towards 0 (factor 1), so a printer with two jobs moves little.
+METRICS = ('time', 'material')
+PRIOR_WEIGHT = 5.0
+# Ratios beyond this (4x either way) are typos or forgotten clicks, not signal
+MAX_ABS_LOG_RATIO = math.log(4.0)
+
+# metric -> (cells stamp, fit); refitted when the cells change
+_fits = {}
+
+
+def _log_ratio(actual, estimate):
+    if not actual or not estimate or actual <= 0 or estimate <= 0:
+        return None
+    return max(-MAX_ABS_LOG_RATIO, min(MAX_ABS_LOG_RATIO, math.log(actual / estimate)))
+
+
+def job_log_ratios(job):
+    """
+    {metric: log(actual / estimate)} for a finished job, per unit. Time is
+    compared with the estimate scaled to the printer's speed profile, so the
+    printer term only learns what the profile does not already say. Plate
+    jobs print together, so their shared duration says nothing about one job.
+    """
+    printer = job.printer
+    quantity = job.quantity or 1
+    ratios = {}
+    if job.started_at and job.finished_at and job.plate_id is None and job.model_time_minutes:
+        minutes = (job.finished_at - job.started_at).total_seconds() / 60.0 / quantity
+        expected = job.model_time_minutes * profile_time_factor(printer.speed_profile if printer else None)
+        ratios['time'] = _log_ratio(minutes, expected)
+    if job.actual_material_grams and job.model_material_grams:
+        ratios['material'] = _log_ratio(job.actual_material_grams / quantity, job.model_material_grams)
+    return {k: v for k, v in ratios.items() if v is not None}
+
+
+def _add_to_cell(metric, printer_id, material_type, value):
+    table = CalibrationCell.__table__
+    updated = db.session.execute(
+        table.update()
+        .where(table.c.metric == metric, table.c.printer_id == printer_id, table.c.material_type == material_type)
+        .values(count=table.c.count + 1, sum_log=table.c.sum_log + value, sum_log_sq=table.c.sum_log_sq + value * value)
+    ).rowcount
+    if updated:
+        return
+    try:
+        # Savepoint: another request may create the same cell first
+        with db.session.begin_nested():
+            db.session.add(CalibrationCell(metric=metric, printer_id=printer_id, material_type=material_type,
+                                           count=1, sum_log=value, sum_log_sq=value * value))
+    except IntegrityError:
+        _add_to_cell(metric, printer_id, material_type, value)
+
+
+def record_actuals(job):
+    """Adds a finished job to the running sums (caller commits). O(1) per job."""
+    if job.assigned_printer_id is None:
+        return
+    for metric, value in job_log_ratios(job).items():
+        _add_to_cell(metric, job.assigned_printer_id, job.material_type, value)
+
+
+def _group_cells(metric, printer_ids, materials, values):
+    """Sums per (printer, material) with bincount instead of a Python loop over jobs."""
+    material_names, material_codes = np.unique(materials, return_inverse=True)
+    keys, inverse = np.unique(printer_ids * len(material_names) + material_codes.ravel(), return_inverse=True)
+    inverse = inverse.ravel()
+    counts = np.bincount(inverse)
+    sums = np.bincount(inverse, weights=values)
+    squares = np.bincount(inverse, weights=values * values)
+    for key, n, total, sq in zip(keys.tolist(), counts.tolist(), sums.tolist(), squares.tolist()):
+        printer_id, code = divmod(key, len(material_names))
+        yield CalibrationCell(metric=metric, printer_id=printer_id, material_type=str(material_names[code]),
+                              count=n, sum_log=total, sum_log_sq=sq)
+
+
+def rebuild_calibration():
+    """
+    Recomputes every cell from the whole job history, as arrays: one query
+    for the columns, then NumPy for the ratios and per-cell sums. Only
+    needed after changing the model; finishing a job keeps the cells
+    current through record_actuals.
+    """
+    rows = (db.session.query(PrintJob.assigned_printer_id, PrintJob.material_type, PrintJob.quantity,
+                             PrintJob.started_at, PrintJob.finished_at, PrintJob.plate_id,
+                             PrintJob.model_time_minutes, PrintJob.model_material_grams,
+                             PrintJob.actual_material_grams, Printer.speed_profile)
+            .join(Printer, Printer.id == PrintJob.assigned_printer_id)
+            .filter(PrintJob.status == JobStatus.DONE).all())
+    CalibrationCell.query.delete()
+    if rows:
+        (printer_ids, materials, quantity, started, finished, plate_ids,
+         model_minutes, model_grams, actual_grams, profiles) = zip(*rows)
+        printer_ids = np.array(printer_ids)
+        materials = np.array(materials)
+        quantity = np.array([q or 1 for q in quantity], dtype=float)
+        minutes = np.array([(f - s).total_seconds() / 60.0 if s and f else np.nan
+                            for s, f in zip(started, finished)])
+        factors = {p: profile_time_factor(p) for p in set(profiles)}
+        expected = np.array(model_minutes, dtype=float) * np.array([factors[p] for p in profiles])
+        on_plate = np.array([p is not None for p in plate_ids])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratios = {
+                'time': np.log(minutes / quantity / expected),
+                'material': np.log(np.array(actual_grams, dtype=float) / quantity / np.array(model_grams, dtype=float)),
+            }
+        ratios['time'][on_plate] = np.nan
+        for metric, values in ratios.items():
+            keep = np.isfinite(values)
+            if keep.any():
+                values = np.clip(values[keep], -MAX_ABS_LOG_RATIO, MAX_ABS_LOG_RATIO)
+                db.session.add_all(_group_cells(metric, printer_ids[keep], materials[keep], values))
+    db.session.commit()
+    _fits.clear()
+
+
+def fit(cells):
+    """
+    Solves the normal equations for the per-printer and per-material log
+    factors from (printer_id, material, count, sum_log) cells. The design
+    matrix is never built: each cell adds its count to four entries of
+    X'X and its sum to two of X'y, so the system is (P+M) square however
+    many jobs went in.
+    """
+    if not cells:
+        return {'printer': {}, 'material': {}, 'printer_mean': 0.0}
+    printers = sorted({c[0] for c in cells})
+    materials = sorted({c[1] for c in cells})
+    p_index = {p: i for i, p in enumerate(printers)}
+    m_index = {m: len(printers) + i for i, m in enumerate(materials)}
+    p = np.array([p_index[c[0]] for c in cells])
+    m = np.array([m_index[c[1]] for c in cells])
+    n = np.array([c[2] for c in cells], dtype=float)
+    s = np.array([c[3] for c in cells], dtype=float)
+
+    size = len(printers) + len(materials)
+    xtx = np.eye(size) * PRIOR_WEIGHT
+    np.add.at(xtx, (p, p), n)
+    np.add.at(xtx, (m, m), n)
+    np.add.at(xtx, (p, m), n)
+    np.add.at(xtx, (m, p), n)
+    xty = np.zeros(size)
+    np.add.at(xty, p, s)
+    np.add.at(xty, m, s)
+    beta = np.linalg.solve(xtx, xty)
+
+    printer_terms = beta[:len(printers)]
+    printer_counts = np.bincount(p, weights=n, minlength=len(printers))
+    return {
+        'printer': dict(zip(printers, printer_terms.tolist())),
+        'material': dict(zip(materials, beta[len(printers):].tolist())),
+        # The printer term expected when nobody knows yet which printer runs the job
+        'printer_mean': float(printer_terms @ printer_counts / printer_counts.sum()),
+    }
+
+
+def current_fit(metric):
+    """The fit for `metric`, refitted only when some cell has changed."""
+    stamp = db.session.query(func.count(CalibrationCell.id), func.sum(CalibrationCell.count),
+                             func.sum(CalibrationCell.sum_log)).filter_by(metric=metric).one()
+    cached = _fits.get(metric)
+    if cached is None or cached[0] != tuple(stamp):
+        cells = db.session.query(CalibrationCell.printer_id, CalibrationCell.material_type,
+                                 CalibrationCell.count, CalibrationCell.sum_log).filter_by(metric=metric).all()
+        cached = _fits[metric] = (tuple(stamp), fit([tuple(c) for c in cells]))
+    return cached[1]
+
+
+def correction_factor(metric, material_type, printer_id=None):
+    """Multiplier for an estimate; without a printer, the average printer's."""
+    model = current_fit(metric)
+    printer_term = model['printer'].get(printer_id, model['printer_mean'])
+    return math.exp(printer_term + model['material'].get(material_type, 0.0))
+
+
+def printer_time_factors():
+    """
+    {printer_id: factor} by which a printer runs slower than the average one
+    (beyond its speed profile). Job estimates already include the average.
+    """
+    model = current_fit('time')
+    return {pid: math.exp(term - model['printer_mean']) for pid, term in model['printer'].items()}
+
+
+def calibration_version():
+    """Changes whenever either fit would; part of cache keys for calibrated numbers."""
+    for metric in METRICS:
+        current_fit(metric)
+    return tuple(_fits[metric][0] for metric in METRICS)
+
+
+def calibrated_estimate(grams, minutes, material_type):
+    """Per-unit (grams, minutes) corrected for the material and the average printer."""
+    return (round(grams * correction_factor('material', material_type), 1),
+            max(1, int(round(minutes * correction_factor('time', material_type)))))
+
+
+def apply_calibration(job, grams, minutes):
+    """Sets a job's per-unit estimates from an uncalibrated (grams, minutes)."""
+    job.model_material_grams = grams
+    job.model_time_minutes = minutes
+    job.estimated_material_grams, job.estimated_time_minutes = calibrated_estimate(grams, minutes, job.material_type)
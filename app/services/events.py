@@ -0,0 +1,155 @@
+import json
+import os
+import sqlite3
+import time
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+
+# Live state changes for operator pages (Server-Sent Events). Every worker
+# process appends to one local SQLite file and every open stream tails it,
+# so an event published by one gunicorn worker reaches clients of all of
+# them. Events are queued on the session and written only once it commits.
+
+RETENTION_SECONDS = 3600
+POLL_SECONDS = 0.5
+HEARTBEAT_SECONDS = 15
+# Streams end after this long and the browser reconnects with Last-Event-ID,
+# so a worker is never tied up by one tab indefinitely
+STREAM_SECONDS = 300
+RETRY_MS = 2000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    kind TEXT NOT NULL,
+    data TEXT NOT NULL
+)
+"""
+
+
+def log_path():
+    """The event log file, or None when live events are off (as in tests)."""
+    return current_app.config.get('EVENT_LOG_PATH')
+
+
+# Log files (path, inode) this process has already set up
+_ready = set()
+
+
+def _connect(path):
+    """Opens the log; WAL mode and the table are set up once per file, not per connection."""
+    conn = sqlite3.connect(path, timeout=5)
+    key = (path, os.stat(path).st_ino)
+    if key not in _ready:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(_SCHEMA)
+        _ready.add(key)
+    return conn
+
+
+def emit(kind, **data):
+    """Queues an event; it is published when the current transaction commits."""
+    db.session.info.setdefault('pending_events', []).append((kind, data))
+
+
+def publish(events, path):
+    """Appends (kind, data) events to the log now. Returns the last id written."""
+    now = time.time()
+    conn = _connect(path)
+    try:
+        with conn:
+            cursor = conn.executemany('INSERT INTO events (created_at, kind, data) VALUES (?, ?, ?)',
+                                      [(now, kind, json.dumps(data)) for kind, data in events])
+            last_id = conn.execute('SELECT max(id) FROM events').fetchone()[0]
+            if last_id % 100 < cursor.rowcount:
+                conn.execute('DELETE FROM events WHERE created_at < ?', (now - RETENTION_SECONDS,))
+        return last_id
+    finally:
+        conn.close()
+
+
+def read_events(path, after_id, limit=100):
+    """[(id, kind, data)] published after `after_id`, oldest first."""
+    if not os.path.exists(path):
+        return []
+    conn = _connect(path)
+    try:
+        return _select_events(conn, after_id, limit)
+    finally:
+        conn.close()
+
+
+def _select_events(conn, after_id, limit=100):
+    rows = conn.execute('SELECT id, kind, data FROM events WHERE id > ? ORDER BY id LIMIT ?',
+                        (after_id, limit)).fetchall()
+    return [(id_, kind, json.loads(data)) for id_, kind, data in rows]
+
+
+def latest_event_id(path):
+    if not os.path.exists(path):
+        return 0
+    conn = _connect(path)
+    try:
+        return conn.execute('SELECT coalesce(max(id), 0) FROM events').fetchone()[0]
+    finally:
+        conn.close()
+
+
+def format_event(id_, kind, data):
+    return f"id: {id_}\nevent: {kind}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream(path, after_id, lifetime=STREAM_SECONDS, clock=time.monotonic, sleep=time.sleep):
+    """
+    Yields the SSE text for every event after `after_id` as it is
+    published, with a comment line as heartbeat, for `lifetime` seconds.
+    Needs no app context or database session, so it can outlive the request.
+    One connection serves every poll of the stream.
+    """
+    yield f"retry: {RETRY_MS}\n\n"
+    deadline = clock() + lifetime
+    quiet_since = clock()
+    conn = None
+    try:
+        while clock() < deadline:
+            if conn is None and os.path.exists(path):
+                conn = _connect(path)
+            events = _select_events(conn, after_id) if conn is not None else []
+            for id_, kind, data in events:
+                yield format_event(id_, kind, data)
+                after_id = id_
+            if events:
+                quiet_since = clock()
+            elif clock() - quiet_since >= HEARTBEAT_SECONDS:
+                yield ": keep-alive\n\n"
+                quiet_since = clock()
+            if len(events) < 100:
+                sleep(POLL_SECONDS)
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_on_commit(session):
+    events = session.info.pop('pending_events', None)
+    if not events:
+        return
+    path = log_path()
+    if not path:
+        return
+    try:
+        publish(events, path)
+    except sqlite3.Error:
+        # Pages fall back to a manual refresh; the committed change stands
+        current_app.logger.warning("Could not publish %d live event(s)", len(events), exc_info=True)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_on_rollback(session):
+    session.info.pop('pending_events', None)
@@ -0,0 +1,378 @@
+import asyncio
+import json
+import math
+import os
+import time
+from urllib.parse import urlsplit
+
+from app.extensions import db
+from app.models import Printer, PrintJob, PrinterStatus, JobStatus
+from app.services.events import emit
+from app.services import telemetry
+from app.services.watchdog import fail_over
+
+# Polls each printer's own HTTP API (Moonraker or OctoPrint) from one
+# asyncio loop, so a few hundred printers cost one process and no threads.
+# Requests are HTTP/1.1 (or HTTPS) on kept-alive connections, at most
+# MAX_CONNECTIONS in flight. What the firmware reports is written back to
+# Printer.status / current_job_id in one transaction per cycle.
+
+POLL_SECONDS = 5.0
+REQUEST_TIMEOUT_SECONDS = 3.0
+MAX_CONNECTIONS = 32
+# A printer that fails is retried after 5s, 10s, 20s... up to this
+BACKOFF_MAX_SECONDS = 300.0
+# Consecutive failures before an unreachable printer is marked ERROR
+OFFLINE_AFTER_FAILURES = 3
+# Printers (and their API settings) are re-read from the database this often
+RELOAD_SECONDS = 60.0
+MAX_RESPONSE_BYTES = 1024 * 1024
+# Schemes a printer's API URL may use, with their default ports
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# What the poller reduces every firmware's answer to
+STATE_IDLE = 'idle'
+STATE_PRINTING = 'printing'
+STATE_ERROR = 'error'
+# Telemetry error_code recorded while the firmware reports an error
+FIRMWARE_ERROR_CODE = 1
+
+
+class PollError(Exception):
+    pass
+
+
+def parse_api_url(api_url):
+    """(host, port, tls, path prefix) of a printer API URL; ValueError unless it is http(s)://host..."""
+    url = urlsplit(api_url)
+    if url.scheme not in DEFAULT_PORTS or not url.hostname:
+        raise ValueError("The API URL must look like http://host:port or https://host")
+    # .port raises ValueError itself for a port out of range
+    return url.hostname, url.port or DEFAULT_PORTS[url.scheme], url.scheme == 'https', url.path.rstrip('/')
+
+
+class HttpConnection:
+    """One kept-alive HTTP/1.1 connection to a printer, over TLS if `tls`; reopened when dropped."""
+    def __init__(self, host, port, tls=False):
+        self.host = host
+        self.port = port
+        self.tls = tls
+        self.reader = self.writer = None
+
+    async def get(self, path, headers=None):
+        """(status, body bytes) of a GET. Raises PollError on any protocol or socket failure."""
+        try:
+            if self.writer is None or self.writer.is_closing():
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port,
+                                                                         ssl=True if self.tls else None)
+            lines = [f'GET {path} HTTP/1.1', f'Host: {self.host}:{self.port}', 'Accept: application/json',
+                     'Connection: keep-alive']
+            lines += [f'{name}: {value}' for name, value in (headers or {}).items()]
+            self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+            await self.writer.drain()
+            return await self._read_response()
+        except (OSError, EOFError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError) as e:
+            self.close()
+            raise PollError(f'{type(e).__name__}: {e}') from e
+
+    async def _read_response(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise EOFError('connection closed')
+        parts = status_line.decode('latin-1').split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+            raise ValueError(f'bad status line {status_line[:40]!r}')
+        status = int(parts[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n'):
+                break
+            if not line:
+                raise EOFError('connection closed in headers')
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = bytearray()
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                body += await self.reader.readexactly(size + 2)
+                del body[-2:]
+                if len(body) > MAX_RESPONSE_BYTES:
+                    raise ValueError('response too large')
+            body = bytes(body)
+        elif 'content-length' in headers:
+            length = int(headers['content-length'])
+            if length > MAX_RESPONSE_BYTES:
+                raise ValueError('response too large')
+            body = await self.reader.readexactly(length)
+        else:
+            body = await self.reader.read(MAX_RESPONSE_BYTES)
+            self.close()
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, body
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+# --- Firmware APIs: the path to GET and how to read the answer ---
+
+def _number(value):
+    return float(value) if isinstance(value, (int, float)) else math.nan
+
+
+def parse_moonraker(status, body):
+    if status == 503:
+        # Klippy is shut down or not ready: the printer itself is in trouble
+        return {'state': STATE_ERROR}
+    if status != 200:
+        raise PollError(f'HTTP {status}')
+    objects = json.loads(body)['result']['status']
+    print_stats = objects.get('print_stats', {})
+    state = {'printing': STATE_PRINTING, 'paused': STATE_PRINTING, 'error': STATE_ERROR}.get(
+        print_stats.get('state'), STATE_IDLE)
+    progress = objects.get('display_status', {}).get('progress')
+    return {
+        'state': state,
+        'filename': print_stats.get('filename') or None,
+        'nozzle_c': _number(objects.get('extruder', {}).get('temperature')),
+        'bed_c': _number(objects.get('heater_bed', {}).get('temperature')),
+        'progress': _number(progress) * 100 if progress is not None else math.nan,
+    }
+
+
+def parse_octoprint(status, body):
+    if status != 200:
+        raise PollError(f'HTTP {status}')
+    data = json.loads(body)
+    text = data.get('state') or ''
+    if 'Error' in text or text.startswith('Offline'):
+        state = STATE_ERROR
+    elif text.startswith(('Printing', 'Paused', 'Pausing', 'Resuming', 'Finishing', 'Cancelling', 'Starting')):
+        state = STATE_PRINTING
+    else:
+        state = STATE_IDLE
+    return {
+        'state': state,
+        'filename': ((data.get('job') or {}).get('file') or {}).get('name'),
+        'nozzle_c': math.nan,
+        'bed_c': math.nan,
+        'progress': _number((data.get('progress') or {}).get('completion')),
+    }
+
+
+# api_type -> (path, parser)
+FIRMWARE_APIS = {
+    'moonraker': ('/printer/objects/query?print_stats&display_status&extruder&heater_bed', parse_moonraker),
+    'octoprint': ('/api/job', parse_octoprint),
+}
+
+
+# --- Writing what was seen back to the database ---
+
+def _match_job(filename, jobs):
+    """The ERP job a printing printer is running: its started job, else a queued one by file name."""
+    for job in jobs:
+        if job.status == JobStatus.PRINTING:
+            return job.id
+    printing = os.path.splitext(os.path.basename(filename or ''))[0].lower()
+    for job in jobs:
+        stem = os.path.splitext(job.original_filename or '')[0].lower()
+        # Slicers keep the model name in the G-code file name, e.g. bracket_0.2mm_PLA.gcode
+        if stem and stem in printing:
+            return job.id
+    return None
+
+
+def reconcile(printer, state, filename=None, jobs=()):
+    """
+    The (status, current_job_id) a printer should have given what its
+    firmware reports. MAINTENANCE belongs to the operators and is never
+    changed. An assigned printer stays PRINTING (reserved) while the
+    firmware is idle, since the operator starts the job by hand.
+    """
+    status, job_id = printer.status, printer.current_job_id
+    if status == PrinterStatus.MAINTENANCE:
+        return status, job_id
+    if state == STATE_ERROR:
+        return PrinterStatus.ERROR, job_id
+    if state == STATE_PRINTING:
+        return PrinterStatus.PRINTING, job_id or _match_job(filename, jobs)
+    if status == PrinterStatus.ERROR:
+        return (PrinterStatus.PRINTING if job_id else PrinterStatus.IDLE), job_id
+    if status == PrinterStatus.PRINTING and job_id is None:
+        # A print started at the printer itself has ended
+        return PrinterStatus.IDLE, None
+    return status, job_id
+
+
+def apply_readings(readings, offline=()):
+    """
+    Writes one cycle's results in a single transaction: readings is
+    {printer_id: parsed reading}, offline the ids that stopped answering.
+    Also feeds temperatures and progress to services/telemetry. Returns the
+    number of printers whose status or job changed.
+    """
+    ids = set(readings) | set(offline)
+    if not ids:
+        return 0
+    printers = Printer.query.filter(Printer.id.in_(ids)).all()
+    jobs = {}
+    for job in PrintJob.query.filter(PrintJob.assigned_printer_id.in_(ids),
+                                     PrintJob.status.in_([JobStatus.PRINTING, JobStatus.QUEUED])):
+        jobs.setdefault(job.assigned_printer_id, []).append(job)
+
+    changed = 0
+    for printer in printers:
+        reading = readings.get(printer.id) or {'state': STATE_ERROR}
+        status, job_id = reconcile(printer, reading['state'], reading.get('filename'), jobs.get(printer.id, ()))
+        if (status, job_id) != (printer.status, printer.current_job_id):
+            printer.status, printer.current_job_id = status, job_id
+            emit('printer', id=printer.id, status=status, current_job_id=job_id)
+            changed += 1
+    db.session.commit()
+
+    if telemetry.telemetry_folder():
+        now = time.time()
+        samples = [{'printer_id': pid, 'ts': now,
+                    **{f: (None if math.isnan(r.get(f, math.nan)) else r[f]) for f in telemetry.FLOAT_FIELDS},
+                    'error_code': FIRMWARE_ERROR_CODE if r['state'] == STATE_ERROR else 0}
+                   for pid, r in readings.items()]
+        if samples:
+            telemetry.ingest(samples)
+    return changed
+
+
+class FleetPoller:
+    """
+    Polls every printer with an api_url once per cycle. Each printer has
+    its own timeout and, after failures, an exponential backoff; the
+    results of a cycle are written together by apply_readings.
+    """
+    def __init__(self, max_connections=MAX_CONNECTIONS, timeout=REQUEST_TIMEOUT_SECONDS,
+                 clock=time.monotonic, watchdog=None):
+        self.timeout = timeout
+        self.clock = clock
+        # services/watchdog.Watchdog; successful polls are its heartbeats
+        self.watchdog = watchdog
+        self.watched = set()
+        self.slots = asyncio.Semaphore(max_connections)
+        self.targets = {}
+        self.connections = {}
+
+    def load_targets(self):
+        """(Re)reads which printers to poll, keeping the backoff state of known ones."""
+        rows = db.session.query(Printer.id, Printer.api_type, Printer.api_url, Printer.api_key)\
+            .filter(Printer.api_url.isnot(None), Printer.api_url != '').all()
+        targets = {}
+        for printer_id, api_type, api_url, api_key in rows:
+            if api_type not in FIRMWARE_APIS:
+                continue
+            try:
+                host, port, tls, prefix = parse_api_url(api_url)
+            except ValueError:
+                continue
+            previous = self.targets.get(printer_id, {})
+            targets[printer_id] = dict(previous, id=printer_id, api_type=api_type, host=host, port=port,
+                                       tls=tls, prefix=prefix, api_key=api_key)
+            targets[printer_id].setdefault('failures', 0)
+            targets[printer_id].setdefault('next_poll', 0.0)
+            if previous and (previous['host'], previous['port'], previous['tls']) != (host, port, tls):
+                self._drop_connection(printer_id)
+        for printer_id in set(self.connections) - set(targets):
+            self._drop_connection(printer_id)
+        self.targets = targets
+        if self.watchdog is not None:
+            # Printers that only post telemetry are watched too
+            watched = set(targets) | set(telemetry.reporting_printer_ids())
+            self.watchdog.forget(self.watched - watched)
+            self.watchdog.watch(watched)
+            self.watched = watched
+        return len(targets)
+
+    def _drop_connection(self, printer_id):
+        connection = self.connections.pop(printer_id, None)
+        if connection is not None:
+            connection.close()
+
+    async def poll_printer(self, target):
+        """The parsed reading of one printer; raises PollError if it cannot be had in time."""
+        path, parse = FIRMWARE_APIS[target['api_type']]
+        connection = self.connections.get(target['id'])
+        if connection is None:
+            connection = HttpConnection(target['host'], target['port'], target['tls'])
+            self.connections[target['id']] = connection
+        headers = {'X-Api-Key': target['api_key']} if target['api_key'] else None
+        async with self.slots:
+            try:
+                status, body = await asyncio.wait_for(connection.get(target['prefix'] + path, headers),
+                                                      self.timeout)
+            except asyncio.TimeoutError:
+                connection.close()
+                raise PollError('timed out')
+        try:
+            return parse(status, body)
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise PollError(f'unreadable response: {e}') from e
+
+    async def poll_once(self):
+        """
+        Polls every printer that is due, writes the results, then fails
+        over printers the watchdog has not heard from in time. Returns
+        {'polled', 'failed', 'changed', 'failed_over'}.
+        """
+        now = self.clock()
+        due = [t for t in self.targets.values() if t['next_poll'] <= now]
+        results = await asyncio.gather(*(self.poll_printer(t) for t in due), return_exceptions=True)
+
+        readings, offline, failed = {}, set(), 0
+        for target, result in zip(due, results):
+            if isinstance(result, PollError):
+                failed += 1
+                target['failures'] += 1
+                target['next_poll'] = now + min(BACKOFF_MAX_SECONDS, POLL_SECONDS * 2 ** (target['failures'] - 1))
+                if target['failures'] >= OFFLINE_AFTER_FAILURES:
+                    offline.add(target['id'])
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                target['failures'] = 0
+                target['next_poll'] = now
+                readings[target['id']] = result
+        changed = apply_readings(readings, offline)
+
+        failed_over = {}
+        if self.watchdog is not None:
+            for printer_id in readings:
+                self.watchdog.beat(printer_id)
+            failed_over = fail_over(self.watchdog.stale())
+        return {'polled': len(due), 'failed': failed, 'changed': changed, 'failed_over': len(failed_over)}
+
+    async def run(self, interval=POLL_SECONDS, cycles=None, on_cycle=None):
+        """Polls every `interval` seconds, for `cycles` cycles or forever."""
+        loaded_at = None
+        done = 0
+        while cycles is None or done < cycles:
+            started = self.clock()
+            if loaded_at is None or started - loaded_at >= RELOAD_SECONDS:
+                self.load_targets()
+                loaded_at = started
+            result = await self.poll_once()
+            db.session.remove()
+            if on_cycle:
+                on_cycle(result, self.clock() - started)
+            done += 1
+            if cycles is None or done < cycles:
+                await asyncio.sleep(max(0.0, interval - (self.clock() - started)))
+
+    def close(self):
+        for printer_id in list(self.connections):
+            self._drop_connection(printer_id)
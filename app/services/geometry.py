@@ -0,0 +1,272 @@
+import mmap
+import os
+import re
+
+import numpy as np
+
+# Binary STL: 80 byte header, uint32 triangle count, then 50 byte records
+STL_HEADER_BYTES = 84
+STL_RECORD_DTYPE = np.dtype([
+    ('normal', '<f4', (3,)),
+    ('vertices', '<f4', (3, 3)),
+    ('attr', '<u2'),
+])
+
+_ASCII_VERTEX_LINE = re.compile(rb'vertex\s+([^\r\n]+)')
+
+# Triangles processed per step when scanning a file (~3MB of records), and
+# bytes of text read per step for ASCII files. Peak memory is bounded by
+# these, not by the size of the upload.
+CHUNK_TRIANGLES = 65536
+ASCII_BLOCK_BYTES = 4 * 1024 * 1024
+
+# g/cm^3
+MATERIAL_DENSITY = {
+    'PLA': 1.24,
+    'PETG': 1.27,
+    'ABS': 1.04,
+}
+DEFAULT_DENSITY = 1.24
+
+# Slicer assumptions used to turn solid volume into extruded volume
+WALL_THICKNESS_MM = 1.2   # perimeters + top/bottom skins
+INFILL_FRACTION = 0.20
+
+# Per-printer speed profiles (Printer.speed_profile)
+SPEED_PROFILES = {
+    'slow': {'volumetric_mm3_s': 5.0, 'layer_height_mm': 0.2, 'layer_overhead_s': 6.0, 'setup_minutes': 5},
+    'standard': {'volumetric_mm3_s': 8.0, 'layer_height_mm': 0.2, 'layer_overhead_s': 4.0, 'setup_minutes': 5},
+    'fast': {'volumetric_mm3_s': 15.0, 'layer_height_mm': 0.2, 'layer_overhead_s': 2.5, 'setup_minutes': 5},
+}
+DEFAULT_PROFILE = 'standard'
+
+
+class STLError(ValueError):
+    pass
+
+
+def _is_binary_stl(data, size=None):
+    """`data` holds at least the 84 byte header; `size` is the full length."""
+    if len(data) < STL_HEADER_BYTES:
+        return False
+    count = int(np.frombuffer(data, dtype='<u4', count=1, offset=80)[0])
+    return (len(data) if size is None else size) == STL_HEADER_BYTES + count * STL_RECORD_DTYPE.itemsize
+
+
+def _is_ascii_stl(data):
+    return data.lstrip()[:5].lower() == b'solid'
+
+
+def _parse_ascii_coords(text):
+    joined = b' '.join(_ASCII_VERTEX_LINE.findall(text))
+    try:
+        return np.array(joined.split(), dtype=np.float64)
+    except ValueError:
+        # e.g. "vertex 0 1 1e": a bad number must fail the file, not truncate it
+        raise STLError("Not a valid STL file")
+
+
+def parse_stl_bytes(data):
+    """
+    Parses binary or ASCII STL into an (n, 3, 3) float32 array of triangles.
+    Size decides the format: some exporters start binary headers with
+    "solid", so the text prefix alone is not trustworthy.
+    """
+    if _is_binary_stl(data):
+        records = np.frombuffer(data, dtype=STL_RECORD_DTYPE, offset=STL_HEADER_BYTES)
+        return records['vertices']
+
+    if _is_ascii_stl(data):
+        coords = _parse_ascii_coords(data)
+        if coords.size and coords.size % 9 == 0:
+            return coords.astype(np.float32).reshape(-1, 3, 3)
+
+    raise STLError("Not a valid STL file")
+
+
+def load_triangles(path):
+    """
+    Whole mesh as an (n, 3, 3) array. Binary files come back as a read-only
+    memory map, so nothing is read until the array is used.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header = f.read(STL_HEADER_BYTES)
+    if _is_binary_stl(header, size):
+        count = (size - STL_HEADER_BYTES) // STL_RECORD_DTYPE.itemsize
+        if count == 0:
+            return np.empty((0, 3, 3), dtype=np.float32)
+        return np.memmap(path, dtype=STL_RECORD_DTYPE, mode='r',
+                         offset=STL_HEADER_BYTES, shape=(count,))['vertices']
+    with open(path, 'rb') as f:
+        return parse_stl_bytes(f.read())
+
+
+def _release_pages(mm, start, end):
+    """Drops mapped pages in [start, end) from RSS; they refault from the page cache if touched again."""
+    if not hasattr(mm, 'madvise') or not hasattr(mmap, 'MADV_DONTNEED'):
+        return start
+    end -= end % mmap.PAGESIZE
+    if end > start:
+        mm.madvise(mmap.MADV_DONTNEED, start, end - start)
+        return end
+    return start
+
+
+def _scan_binary(f, count, fn):
+    """
+    Applies `fn` to CHUNK_TRIANGLES-sized zero-copy views of the mapped file.
+    Pages are released behind the scan, so resident memory stays at about
+    one chunk however large the file is.
+    """
+    results = []
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        records = np.frombuffer(mm, dtype=STL_RECORD_DTYPE, count=count, offset=STL_HEADER_BYTES)
+        released = 0
+        for start in range(0, count, CHUNK_TRIANGLES):
+            results.append(fn(records['vertices'][start:start + CHUNK_TRIANGLES]))
+            end = STL_HEADER_BYTES + (start + CHUNK_TRIANGLES) * STL_RECORD_DTYPE.itemsize
+            released = _release_pages(mm, released, end)
+        # The map can't close while a view into it is alive
+        del records
+    return results
+
+
+def _scan_ascii(f, fn):
+    """Applies `fn` to triangles parsed from ASCII_BLOCK_BYTES blocks of text."""
+    results = []
+    tail = b''
+    pending = np.empty(0)
+    while True:
+        block = f.read(ASCII_BLOCK_BYTES)
+        text = tail + block
+        if block:
+            # Only parse whole lines; the rest waits for the next block
+            cut = text.rfind(b'\n') + 1
+            text, tail = text[:cut], text[cut:]
+        coords = np.concatenate([pending, _parse_ascii_coords(text)])
+        usable = coords.size - coords.size % 9
+        if usable:
+            results.append(fn(coords[:usable].astype(np.float32).reshape(-1, 3, 3)))
+        pending = coords[usable:]
+        if not block:
+            break
+    if pending.size:
+        raise STLError("Not a valid STL file")
+    return results
+
+
+def scan_stl(path, fn):
+    """
+    Streams an STL file through `fn` in bounded chunks of (k, 3, 3)
+    triangles and returns the list of results. Binary files are memory
+    mapped and never copied; ASCII files are parsed block by block.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header = f.read(STL_HEADER_BYTES)
+        if _is_binary_stl(header, size):
+            count = (size - STL_HEADER_BYTES) // STL_RECORD_DTYPE.itemsize
+            return _scan_binary(f, count, fn)
+        if _is_ascii_stl(header):
+            f.seek(0)
+            return _scan_ascii(f, fn)
+    raise STLError("Not a valid STL file")
+
+
+def bounding_box(triangles):
+    """Returns (min_xyz, max_xyz) as float arrays."""
+    points = triangles.reshape(-1, 3)
+    return points.min(axis=0).astype(float), points.max(axis=0).astype(float)
+
+
+def _partial_metrics(triangles):
+    """
+    Volume/area/bounds sums for a block of triangles. Cross products are
+    written out per component: np.cross is several times slower on large
+    arrays, and so is min/max over several axes at once, hence per-axis
+    bounds. Sums accumulate in float64.
+    """
+    v0 = triangles[:, 0]
+    e1 = triangles[:, 1] - v0
+    e2 = triangles[:, 2] - v0
+    cx = e1[:, 1] * e2[:, 2] - e1[:, 2] * e2[:, 1]
+    cy = e1[:, 2] * e2[:, 0] - e1[:, 0] * e2[:, 2]
+    cz = e1[:, 0] * e2[:, 1] - e1[:, 1] * e2[:, 0]
+    return {
+        # Signed tetrahedron volumes against the origin: v0 . (e1 x e2) / 6
+        'volume': float((v0[:, 0] * cx + v0[:, 1] * cy + v0[:, 2] * cz).sum(dtype=np.float64)) / 6.0,
+        'area': float(np.sqrt(cx * cx + cy * cy + cz * cz).sum(dtype=np.float64)) / 2.0,
+        'min': np.array([triangles[:, :, k].min() for k in range(3)], dtype=float),
+        'max': np.array([triangles[:, :, k].max() for k in range(3)], dtype=float),
+        'triangles': int(len(triangles)),
+    }
+
+
+def _combine_metrics(parts):
+    parts = [p for p in parts if p['triangles']]
+    if not parts:
+        raise STLError("STL file has no triangles")
+    lo = np.min([p['min'] for p in parts], axis=0)
+    hi = np.max([p['max'] for p in parts], axis=0)
+    return {
+        'volume_mm3': abs(sum(p['volume'] for p in parts)),
+        'surface_area_mm2': sum(p['area'] for p in parts),
+        'bbox_min': lo.tolist(),
+        'bbox_max': hi.tolist(),
+        'size_mm': (hi - lo).tolist(),
+        'triangles': sum(p['triangles'] for p in parts),
+    }
+
+
+def mesh_metrics(triangles):
+    """
+    Volume (mm^3), surface area (mm^2), bounding box and triangle count of
+    a closed mesh given as an (n, 3, 3) array.
+    """
+    return _combine_metrics([_partial_metrics(triangles)])
+
+
+def analyze_stl(path):
+    """mesh_metrics for a file on disk, computed chunk by chunk."""
+    return _combine_metrics(scan_stl(path, _partial_metrics))
+
+
+def profile_time_factor(profile):
+    """How much longer than the standard profile a printer takes."""
+    rate = SPEED_PROFILES.get(profile or DEFAULT_PROFILE, SPEED_PROFILES[DEFAULT_PROFILE])['volumetric_mm3_s']
+    return SPEED_PROFILES[DEFAULT_PROFILE]['volumetric_mm3_s'] / rate
+
+
+def estimate_from_metrics(metrics, material_type, profile=DEFAULT_PROFILE):
+    """
+    Turns mesh metrics into per-unit (grams, minutes).
+
+    Extruded volume is the outer shell (surface area x wall thickness, capped
+    at the solid volume) plus sparse infill of what remains. Time is that
+    volume at the profile's volumetric flow plus a per-layer overhead for
+    travel and layer changes.
+
+    Pre-sliced files (see services/printfiles) already carry the filament
+    volume and print time; only the material density is applied, and the
+    profile is ignored because the G-code fixes the speeds.
+    """
+    if 'filament_mm3' in metrics:
+        grams = metrics['filament_mm3'] / 1000.0 * MATERIAL_DENSITY.get(material_type, DEFAULT_DENSITY)
+        return round(grams, 1), max(1, int(round(metrics['sliced_seconds'] / 60.0)))
+
+    speed = SPEED_PROFILES.get(profile or DEFAULT_PROFILE, SPEED_PROFILES[DEFAULT_PROFILE])
+    volume = metrics['volume_mm3']
+    shell = min(volume, metrics['surface_area_mm2'] * WALL_THICKNESS_MM)
+    extruded = shell + (volume - shell) * INFILL_FRACTION
+
+    density = MATERIAL_DENSITY.get(material_type, DEFAULT_DENSITY)
+    grams = extruded / 1000.0 * density
+
+    layers = metrics['size_mm'][2] / speed['layer_height_mm']
+    seconds = extruded / speed['volumetric_mm3_s'] + layers * speed['layer_overhead_s']
+    minutes = speed['setup_minutes'] + seconds / 60.0
+
+    return round(grams, 1), max(1, int(round(minutes)))
@@ -0,0 +1,65 @@
+from sqlalchemy.orm import joinedload
+
+from app.models import PrintJob, Printer, JobStatus
+
+# The operator queue's sections, in page order
+BOARD_STATUSES = (JobStatus.FAILED, JobStatus.WAITING, JobStatus.QUEUED, JobStatus.PRINTING)
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def _board_query(statuses):
+    # Rows reference their printer's name; load it in the same SELECT
+    return (PrintJob.query.options(joinedload(PrintJob.printer))
+            .filter(PrintJob.status.in_(statuses))
+            .order_by(PrintJob.order_id, PrintJob.id))
+
+
+def load_board():
+    """
+    Every job on the operator queue, {status: [jobs]}, plus the printers to
+    assign them to. Two queries however long the queue is: the jobs (with
+    their printers joined) are partitioned by status here, not per section.
+    """
+    board = {status: [] for status in BOARD_STATUSES}
+    for job in _board_query(BOARD_STATUSES):
+        board[job.status].append(job)
+    return board, Printer.query.order_by(Printer.id).all()
+
+
+def job_summary(job):
+    """The JSON form of a board row."""
+    return {
+        'id': job.id,
+        'order_id': job.order_id,
+        'parent_job_id': job.parent_job_id,
+        'plate_id': job.plate_id,
+        'status': job.status,
+        'file': job.original_filename,
+        'file_hash': job.file_hash,
+        'material_type': job.material_type,
+        'color': job.color,
+        'quantity': job.quantity,
+        'estimated_time_minutes': job.estimated_time_minutes,
+        'printer': {'id': job.printer.id, 'name': job.printer.name} if job.printer else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+    }
+
+
+def board_page(status=None, page=1, per_page=DEFAULT_PAGE_SIZE):
+    """
+    One page of board rows, optionally of one status, as a JSON-ready dict
+    with the total count. A count and a page query, whatever the page size.
+    """
+    if status is not None and status not in BOARD_STATUSES:
+        raise ValueError(f"Unknown job board status: {status}")
+    per_page = max(1, min(int(per_page), MAX_PAGE_SIZE))
+    query = _board_query([status] if status else BOARD_STATUSES)
+    result = query.paginate(page=max(1, int(page)), per_page=per_page, error_out=False)
+    return {
+        'jobs': [job_summary(job) for job in result.items],
+        'page': result.page,
+        'per_page': result.per_page,
+        'pages': result.pages,
+        'total': result.total,
+    }
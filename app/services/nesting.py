@@ -0,0 +1,138 @@
+import json
+
+from app.extensions import db
+from app.models import Plate, PlateStatus
+from app.services.audit import log_action
+from app.services.geometry import STLError
+from app.services.scheduler import get_waiting_jobs, order_jobs_for_planning
+from app.services.storage import analyze_job_file
+
+# Gap kept between parts (and honoured as a part's own clearance)
+SPACING_MM = 5.0
+# Parts bigger than this share of the bed get their own print
+SMALL_PART_MAX_BED_FRACTION = 0.5
+
+
+class PlatePacker:
+    """
+    Incremental first-fit shelf packer for one build plate.
+
+    Parts are laid out left to right on shelves; a new shelf opens above the
+    tallest part of the previous one. Each part may be rotated 90 degrees.
+    Spacing is handled by growing every part and the bed by SPACING_MM, so
+    parts are spaced from each other but may sit on the bed edge.
+    """
+
+    def __init__(self, width, depth):
+        self.width = width + SPACING_MM
+        self.depth = depth + SPACING_MM
+        self.shelves = []  # [y, height, used_width]
+        self.placements = []
+
+    def _snapshot(self):
+        return [list(s) for s in self.shelves], list(self.placements)
+
+    def _place_unit(self, job_id, w, d):
+        options = [(w + SPACING_MM, d + SPACING_MM, False), (d + SPACING_MM, w + SPACING_MM, True)]
+
+        # Best fit into an existing shelf: least wasted shelf height
+        best = None
+        for shelf in self.shelves:
+            for pw, pd, rotated in options:
+                if shelf[2] + pw <= self.width and pd <= shelf[1]:
+                    waste = shelf[1] - pd
+                    if best is None or waste < best[0]:
+                        best = (waste, shelf, pw, pd, rotated)
+        if best:
+            _, shelf, pw, pd, rotated = best
+        else:
+            top = sum(s[1] for s in self.shelves)
+            # New shelf: lowest orientation that fits the width
+            fitting = [o for o in options if o[0] <= self.width and top + o[1] <= self.depth]
+            if not fitting:
+                return False
+            pw, pd, rotated = min(fitting, key=lambda o: o[1])
+            shelf = [top, pd, 0.0]
+            self.shelves.append(shelf)
+
+        self.placements.append({
+            'job_id': job_id,
+            'x': round(shelf[2], 1),
+            'y': round(shelf[0], 1),
+            'w': round(pw - SPACING_MM, 1),
+            'd': round(pd - SPACING_MM, 1),
+            'rotated': rotated,
+        })
+        shelf[2] += pw
+        return True
+
+    def try_add(self, job_id, w, d, count):
+        """Places all `count` units of a job, or none of them."""
+        saved = self._snapshot()
+        for _ in range(count):
+            if not self._place_unit(job_id, w, d):
+                self.shelves, self.placements = saved
+                return False
+        return True
+
+    @property
+    def job_ids(self):
+        return {p['job_id'] for p in self.placements}
+
+
+def job_footprint(job):
+    """(width_mm, depth_mm) the part occupies on the bed, as uploaded."""
+    try:
+        width, depth, _ = analyze_job_file(job)['size_mm']
+        return width, depth
+    except (OSError, STLError):
+        return None
+
+
+def build_plates(bed_width, bed_depth, user_id):
+    """
+    Nests small waiting jobs onto shared plates for a bed of the given size.
+    Only jobs with the same material and color share a plate, and a plate
+    is only created when it holds at least two jobs. Returns the new plates.
+    """
+    bed_area = bed_width * bed_depth
+    packers = {}
+
+    for job in order_jobs_for_planning(get_waiting_jobs()):
+        size = job_footprint(job)
+        if size is None:
+            continue
+        w, d = size
+        if w * d > SMALL_PART_MAX_BED_FRACTION * bed_area:
+            continue
+
+        spool = (job.material_type, job.color)
+        group = packers.setdefault(spool, [])
+        if not any(p.try_add(job.id, w, d, job.quantity or 1) for p in group):
+            packer = PlatePacker(bed_width, bed_depth)
+            if packer.try_add(job.id, w, d, job.quantity or 1):
+                group.append(packer)
+
+    jobs_by_id = {j.id: j for j in get_waiting_jobs()}
+    plates = []
+    for (material, color), group in packers.items():
+        for packer in group:
+            if len(packer.job_ids) < 2:
+                continue
+            plate = Plate(material_type=material, color=color,
+                          bed_width_mm=bed_width, bed_depth_mm=bed_depth,
+                          status=PlateStatus.PLANNED,
+                          layout_json=json.dumps(packer.placements))
+            db.session.add(plate)
+            db.session.flush()
+            for job_id in packer.job_ids:
+                jobs_by_id[job_id].plate_id = plate.id
+            log_action(user_id, "build_plate", "Plate", plate.id, after={'jobs': sorted(packer.job_ids)})
+            plates.append(plate)
+
+    db.session.commit()
+    return plates
+
+
+def plate_layout(plate):
+    return json.loads(plate.layout_json or '[]')
@@ -1,15 +1,112 @@
-def calculate_estimate(grams, minutes, quantity=1):
-    """
-    Simple deterministic pricing estimator.
-    """
-    RATE_PER_GRAM = 0.50  # cents/money unit per gram
-    RATE_PER_MINUTE = 0.10 # cents/money unit per minute
-    BASE_FEE = 5.00       # Setup fee per job
-    
-    material_cost = grams * RATE_PER_GRAM
-    time_cost = minutes * RATE_PER_MINUTE
-    
-    single_unit_price = material_cost + time_cost + BASE_FEE
-    total_price = single_unit_price * quantity
-    
-    return round(total_price, 2)
+import numpy as np
+from sqlalchemy import func
+
+from app.extensions import db
+from app.models import PricingRule, PricingRuleKind
+
+# Used for anything the price list does not cover
+RATE_PER_GRAM = 0.50    # money unit per gram
+RATE_PER_MINUTE = 0.10  # money unit per minute
+BASE_FEE = 5.00         # setup fee per unit
+
+# (rules stamp, RateTable); rebuilt when any rule changes
+_compiled = {}
+
+
+class RateTable:
+    """
+    The active pricing rules compiled into arrays, so pricing N lines is a
+    handful of NumPy operations instead of N rule lookups.
+
+    rates[material_index[m]] is (per gram, per minute, base fee) for
+    material m; row 0 is the default. Quantity breaks are sorted for searchsorted.
+    """
+    def __init__(self, rules):
+        default = next((r for r in rules if r.kind == PricingRuleKind.MATERIAL and r.material_type is None), None)
+        default_row = [
+            default.rate_per_gram if default and default.rate_per_gram is not None else RATE_PER_GRAM,
+            default.rate_per_minute if default and default.rate_per_minute is not None else RATE_PER_MINUTE,
+            default.base_fee if default and default.base_fee is not None else BASE_FEE,
+        ]
+        rows = [default_row]
+        self.material_index = {}
+        for rule in rules:
+            if rule.kind == PricingRuleKind.MATERIAL and rule.material_type:
+                self.material_index[rule.material_type] = len(rows)
+                rows.append([
+                    default_row[0] if rule.rate_per_gram is None else rule.rate_per_gram,
+                    default_row[1] if rule.rate_per_minute is None else rule.rate_per_minute,
+                    default_row[2] if rule.base_fee is None else rule.base_fee,
+                ])
+        self.rates = np.array(rows, dtype=float)
+
+        breaks = sorted((r.min_quantity, r.percent or 0.0) for r in rules
+                        if r.kind == PricingRuleKind.QUANTITY_BREAK and r.min_quantity)
+        self.break_quantities = np.array([q for q, _ in breaks], dtype=np.int64)
+        # Index 0: below the first break
+        self.break_discounts = np.array([0.0] + [p for _, p in breaks]) / 100.0
+
+        self.rush_surcharge = sum(r.percent or 0.0 for r in rules if r.kind == PricingRuleKind.RUSH) / 100.0
+        self.customer_discounts = {r.customer_user_id: (r.percent or 0.0) / 100.0 for r in rules
+                                   if r.kind == PricingRuleKind.CUSTOMER and r.customer_user_id}
+        # Set by rate_table to the rules stamp it was compiled from
+        self.version = None
+
+    def price(self, grams, minutes, quantity, material_types=None, customer_id=None, rush=False):
+        """Vectorized line totals; every argument may be a scalar or an array."""
+        grams = np.asarray(grams, dtype=float)
+        minutes = np.asarray(minutes, dtype=float)
+        quantity = np.maximum(np.asarray(quantity, dtype=np.int64), 1)
+        if material_types is None or isinstance(material_types, str):
+            rows = self.material_index.get(material_types, 0)
+        else:
+            rows = np.array([self.material_index.get(m, 0) for m in material_types], dtype=np.int64)
+        rates = self.rates[rows]
+
+        unit = grams * rates[..., 0] + minutes * rates[..., 1] + rates[..., 2]
+        tier = np.searchsorted(self.break_quantities, quantity, side='right')
+        multiplier = (1.0 - self.break_discounts[tier]) * (1.0 + self.rush_surcharge * np.asarray(rush, dtype=float))
+        multiplier = multiplier * (1.0 - self.customer_discounts.get(customer_id, 0.0))
+        return np.round(unit * quantity * multiplier, 2)
+
+
+def rate_table():
+    """The compiled price list, recompiled only when a rule was added, changed or removed."""
+    stamp = tuple(db.session.query(func.count(PricingRule.id), func.max(PricingRule.id),
+                                   func.max(PricingRule.updated_at)).one())
+    cached = _compiled.get('table')
+    if cached is None or cached[0] != stamp:
+        table = RateTable(PricingRule.query.filter_by(active=True).all())
+        table.version = stamp
+        cached = _compiled['table'] = (stamp, table)
+    return cached[1]
+
+
+def price_lines(grams, minutes, quantity, material_types=None, customer_id=None, rush=False):
+    """
+    Prices many quote lines in one call. Returns an array of totals, each
+    rounded to cents: (unit material + time + base fee) x quantity, less
+    the quantity break and customer discount, plus the rush surcharge.
+    """
+    return rate_table().price(grams, minutes, quantity, material_types, customer_id, rush)
+
+
+def price_jobs(jobs, customer_id=None, rush=False):
+    """Line totals for PrintJobs (estimates are per unit), in order, as floats."""
+    if not jobs:
+        return []
+    return price_lines([j.estimated_material_grams or 0 for j in jobs],
+                       [j.estimated_time_minutes or 0 for j in jobs],
+                       [j.quantity or 1 for j in jobs],
+                       [j.material_type for j in jobs], customer_id, rush).tolist()
+
+
+def price_order(order):
+    """{job_id: price} for every job of an order, with its customer's discount and rush."""
+    prices = price_jobs(order.jobs, order.customer_user_id, bool(order.priority))
+    return {job.id: price for job, price in zip(order.jobs, prices)}
+
+
+def calculate_estimate(grams, minutes, quantity=1, material_type=None, customer_id=None, rush=False):
+    """Price of a single line; see price_lines."""
+    return float(price_lines(grams, minutes, quantity, material_type, customer_id, rush))
@@ -0,0 +1,349 @@
+import math
+import os
+import re
+import zipfile
+import zlib
+from array import array
+from xml.etree import ElementTree
+
+import numpy as np
+
+from app.services.geometry import (STLError, CHUNK_TRIANGLES, analyze_stl, load_triangles,
+                                   _partial_metrics, _combine_metrics)
+
+STL_EXTENSION = '.stl'
+GCODE_EXTENSIONS = ('.gcode', '.gco', '.g')
+THREEMF_EXTENSION = '.3mf'
+# Files with a mesh to analyze and draw
+MESH_EXTENSIONS = (STL_EXTENSION, THREEMF_EXTENSION)
+UPLOAD_EXTENSIONS = (STL_EXTENSION, '.gcode', THREEMF_EXTENSION)
+
+DEFAULT_FILAMENT_DIAMETER_MM = 1.75
+# Feed rate assumed until the file sets one (mm/min)
+DEFAULT_FEED_MM_MIN = 1500.0
+
+# 3MF <model unit="..."> in millimetres
+THREEMF_UNITS = {
+    'micron': 0.001,
+    'millimeter': 1.0,
+    'centimeter': 10.0,
+    'inch': 25.4,
+    'foot': 304.8,
+    'meter': 1000.0,
+}
+
+
+class PrintFileError(STLError):
+    """An unreadable G-code or 3MF upload. Subclasses STLError so every caller that skips bad meshes skips these too."""
+    pass
+
+# What a damaged 3MF raises while it is read: broken XML, missing or
+# malformed attributes (x="1e", v1="a"), corrupt zip members
+_BAD_3MF_ERRORS = (ElementTree.ParseError, KeyError, TypeError, ValueError, zipfile.BadZipFile, zlib.error)
+
+
+def _duration_seconds(text):
+    """'1d 2h 3m 4s', '1 hours 2 minutes' or a plain number of seconds."""
+    parts = re.findall(rb'(\d+(?:\.\d+)?)\s*([dhms])', text, re.IGNORECASE)
+    if not parts:
+        return float(text.split()[0])
+    unit = {b'd': 86400, b'h': 3600, b'm': 60, b's': 1}
+    return sum(float(value) * unit[u.lower()] for value, u in parts)
+
+
+def _sum_numbers(text):
+    # Multi-extruder files list one value per extruder
+    return sum(float(v) for v in re.findall(rb'\d+(?:\.\d+)?', text))
+
+
+# What slicers write about the print in comments: (field, pattern, parser).
+# The first match of a field wins.
+GCODE_HEADERS = [
+    # Cura, ideaMaker
+    ('seconds', re.compile(rb';TIME:(\d+(?:\.\d+)?)'), float),
+    ('seconds', re.compile(rb';Print Time:\s*(\d+(?:\.\d+)?)'), float),
+    ('length_mm', re.compile(rb';Filament used:\s*([\d.,m ]+)'), lambda t: _sum_numbers(t) * 1000.0),
+    # PrusaSlicer, SuperSlicer, OrcaSlicer
+    ('seconds', re.compile(rb';\s*estimated printing time(?: \(normal mode\))?\s*=\s*(.+)'), _duration_seconds),
+    ('length_mm', re.compile(rb';\s*filament used \[mm\]\s*=\s*(.+)'), _sum_numbers),
+    ('volume_mm3', re.compile(rb';\s*filament used \[cm3\]\s*=\s*(.+)'), lambda t: _sum_numbers(t) * 1000.0),
+    ('diameter_mm', re.compile(rb';\s*filament_diameter\s*=\s*(\d+(?:\.\d+)?)'), float),
+    # Bambu Studio
+    ('seconds', re.compile(rb';.*total estimated time:\s*([\d dhms]+)'), _duration_seconds),
+    ('length_mm', re.compile(rb';\s*total filament length \[mm\]\s*:\s*(.+)'), _sum_numbers),
+    # Simplify3D
+    ('seconds', re.compile(rb';\s*Build time:\s*(.+)'), _duration_seconds),
+    ('length_mm', re.compile(rb';\s*Filament length:\s*(\d+(?:\.\d+)?)\s*mm'), float),
+]
+
+_MOVES = {b'G0', b'G1', b'G00', b'G01'}
+_ARCS = {b'G2', b'G3', b'G02', b'G03'}
+
+
+def _parse_header(line, found):
+    for field, pattern, parse in GCODE_HEADERS:
+        if field in found:
+            continue
+        m = pattern.match(line)
+        if m:
+            try:
+                found[field] = parse(m.group(1))
+            except (ValueError, IndexError):
+                pass
+
+
+def _arc_length(x, y, nx, ny, i, j, clockwise):
+    cx, cy = x + i, y + j
+    r = math.hypot(i, j)
+    sweep = math.atan2(ny - cy, nx - cx) - math.atan2(y - cy, x - cx)
+    if clockwise and sweep >= 0:
+        sweep -= 2 * math.pi
+    elif not clockwise and sweep <= 0:
+        sweep += 2 * math.pi
+    return r * abs(sweep)
+
+
+def scan_gcode(lines):
+    """
+    One streaming pass over G-code lines (bytes). Collects what the slicer
+    reported in its comments and, as a fallback, adds up the moves itself:
+    time is each move's length at its feed rate (acceleration ignored, so
+    it runs short), filament is the sum of forward E. Bounds cover where
+    extruding moves end, i.e. the printed part.
+    """
+    found = {}
+    absolute = e_absolute = True
+    x = y = z = e = 0.0
+    feed = DEFAULT_FEED_MM_MIN
+    seconds = extruded = 0.0
+    inf = math.inf
+    lox = loy = loz = inf
+    hix = hiy = hiz = -inf
+
+    for line in lines:
+        if line[:1] == b';':
+            _parse_header(line.strip(), found)
+            continue
+        if b';' in line:
+            line = line.split(b';', 1)[0]
+        words = line.upper().split()
+        if not words:
+            continue
+        cmd = words[0]
+
+        if cmd in _MOVES or cmd in _ARCS:
+            nx, ny, nz, ne = x, y, z, e
+            i = j = 0.0
+            for word in words[1:]:
+                axis = word[:1]
+                try:
+                    value = float(word[1:])
+                except ValueError:
+                    continue
+                if axis == b'X':
+                    nx = value if absolute else x + value
+                elif axis == b'Y':
+                    ny = value if absolute else y + value
+                elif axis == b'E':
+                    ne = value if e_absolute else e + value
+                elif axis == b'Z':
+                    nz = value if absolute else z + value
+                elif axis == b'F':
+                    if value > 0:
+                        feed = value
+                elif axis == b'I':
+                    i = value
+                elif axis == b'J':
+                    j = value
+
+            if cmd in _ARCS and (i or j):
+                planar = _arc_length(x, y, nx, ny, i, j, cmd in (b'G2', b'G02'))
+                distance = math.hypot(planar, nz - z)
+            else:
+                distance = math.hypot(nx - x, ny - y, nz - z)
+            # Retractions and primes move only the extruder
+            seconds += (distance or abs(ne - e)) * 60.0 / feed
+            if ne > e:
+                extruded += ne - e
+                if distance:
+                    # Comparisons inline: min()/max() calls dominated the loop
+                    if nx < lox:
+                        lox = nx
+                    if nx > hix:
+                        hix = nx
+                    if ny < loy:
+                        loy = ny
+                    if ny > hiy:
+                        hiy = ny
+                    if nz < loz:
+                        loz = nz
+                    if nz > hiz:
+                        hiz = nz
+            x, y, z, e = nx, ny, nz, ne
+        elif cmd == b'G92':
+            for word in words[1:]:
+                try:
+                    value = float(word[1:])
+                except ValueError:
+                    continue
+                if word[:1] == b'X':
+                    x = value
+                elif word[:1] == b'Y':
+                    y = value
+                elif word[:1] == b'Z':
+                    z = value
+                elif word[:1] == b'E':
+                    e = value
+        elif cmd == b'G4':
+            for word in words[1:]:
+                try:
+                    if word[:1] == b'P':
+                        seconds += float(word[1:]) / 1000.0
+                    elif word[:1] == b'S':
+                        seconds += float(word[1:])
+                except ValueError:
+                    pass
+        elif cmd == b'G28':
+            axes = {w[:1] for w in words[1:]} or {b'X', b'Y', b'Z'}
+            x = 0.0 if b'X' in axes else x
+            y = 0.0 if b'Y' in axes else y
+            z = 0.0 if b'Z' in axes else z
+        elif cmd == b'G90':
+            absolute = e_absolute = True
+        elif cmd == b'G91':
+            absolute = e_absolute = False
+        elif cmd == b'M82':
+            e_absolute = True
+        elif cmd == b'M83':
+            e_absolute = False
+
+    if 'seconds' not in found and not extruded:
+        raise PrintFileError("No print moves found in G-code")
+
+    diameter = found.get('diameter_mm', DEFAULT_FILAMENT_DIAMETER_MM)
+    length = found.get('length_mm', extruded)
+    volume = found.get('volume_mm3', length * math.pi * (diameter / 2) ** 2)
+    lo, hi = [lox, loy, loz], [hix, hiy, hiz]
+    if lox == inf:
+        lo = hi = [0.0, 0.0, 0.0]
+    return {
+        'source': 'gcode',
+        # Slicer figures are exact; ours only fill in what it left out
+        'sliced_seconds': found.get('seconds', seconds),
+        'filament_length_mm': length,
+        'filament_mm3': volume,
+        'bbox_min': list(lo),
+        'bbox_max': list(hi),
+        'size_mm': [b - a for a, b in zip(lo, hi)],
+    }
+
+
+def analyze_gcode(path):
+    with open(path, 'rb') as f:
+        return scan_gcode(f)
+
+
+def _model_members(zf):
+    return [n for n in zf.namelist() if n.lower().endswith('.model')]
+
+
+def iter_3mf_meshes(zf):
+    """
+    Streams the XML of every model part in an open 3MF zip and yields each
+    <mesh> as (vertices (n, 3) float32 in mm, triangles (m, 3) indices).
+    Parsed elements are cleared as they go, so memory holds one mesh at a
+    time. Build transforms and component instancing are not applied.
+    """
+    for name in _model_members(zf):
+        scale = 1.0
+        vertices, triangles = array('d'), array('q')
+        with zf.open(name) as stream:
+            for event, elem in ElementTree.iterparse(stream, events=('start', 'end')):
+                tag = elem.tag.rpartition('}')[2]
+                if event == 'start':
+                    if tag == 'model':
+                        scale = THREEMF_UNITS.get(elem.get('unit', 'millimeter'), 1.0)
+                    continue
+                if tag == 'vertex':
+                    vertices.extend((float(elem.get('x')), float(elem.get('y')), float(elem.get('z'))))
+                elif tag == 'triangle':
+                    triangles.extend((int(elem.get('v1')), int(elem.get('v2')), int(elem.get('v3'))))
+                elif tag in ('vertices', 'triangles'):
+                    elem.clear()
+                elif tag == 'mesh':
+                    v = (np.frombuffer(vertices, dtype=np.float64).reshape(-1, 3) * scale).astype(np.float32)
+                    t = np.frombuffer(triangles, dtype=np.int64).reshape(-1, 3)
+                    if t.size and (t.min() < 0 or t.max() >= len(v)):
+                        raise PrintFileError(f"3MF mesh in {name} has a bad vertex index")
+                    yield v, t
+                    vertices, triangles = array('d'), array('q')
+                    elem.clear()
+
+
+def _embedded_gcode(zf):
+    """Sliced 3MF projects (Bambu Studio, PrusaSlicer) carry the G-code inside."""
+    names = sorted(n for n in zf.namelist() if n.lower().endswith('.gcode'))
+    return names[0] if names else None
+
+
+def _open_3mf(path):
+    try:
+        return zipfile.ZipFile(path)
+    except zipfile.BadZipFile:
+        raise PrintFileError("Not a valid 3MF file")
+
+
+def analyze_3mf(path):
+    """
+    G-code figures when the project was sliced, otherwise mesh_metrics of
+    every mesh in it, computed CHUNK_TRIANGLES at a time. Nothing is
+    extracted to disk: members are decompressed as they are read.
+    """
+    with _open_3mf(path) as zf:
+        try:
+            gcode = _embedded_gcode(zf)
+            if gcode:
+                with zf.open(gcode) as stream:
+                    return scan_gcode(stream)
+            parts = []
+            for v, t in iter_3mf_meshes(zf):
+                for start in range(0, len(t), CHUNK_TRIANGLES):
+                    parts.append(_partial_metrics(v[t[start:start + CHUNK_TRIANGLES]]))
+        except PrintFileError:
+            raise
+        except _BAD_3MF_ERRORS as e:
+            raise PrintFileError(f"Not a valid 3MF file: {e}")
+    if not parts:
+        raise PrintFileError("3MF file has no meshes")
+    return _combine_metrics(parts)
+
+
+def load_3mf_triangles(path):
+    """All meshes in a 3MF as one (n, 3, 3) array."""
+    with _open_3mf(path) as zf:
+        try:
+            meshes = [v[t] for v, t in iter_3mf_meshes(zf)]
+        except PrintFileError:
+            raise
+        except _BAD_3MF_ERRORS as e:
+            raise PrintFileError(f"Not a valid 3MF file: {e}")
+    if not meshes:
+        return np.empty((0, 3, 3), dtype=np.float32)
+    return np.concatenate(meshes)
+
+
+def analyze_print_file(path):
+    """Metrics for an uploaded STL, G-code or 3MF file, by extension."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in GCODE_EXTENSIONS:
+        return analyze_gcode(path)
+    if ext == THREEMF_EXTENSION:
+        return analyze_3mf(path)
+    return analyze_stl(path)
+
+
+def load_mesh(path):
+    """(n, 3, 3) triangles of an STL or 3MF file, for drawing."""
+    if os.path.splitext(path)[1].lower() == THREEMF_EXTENSION:
+        return load_3mf_triangles(path)
+    return load_triangles(path)
@@ -0,0 +1,86 @@
+import re
+from functools import lru_cache
+
+from app.extensions import db
+from app.models import StoredFile, Upload, PrintJob, Order
+from app.services.calibration import calibrated_estimate, calibration_version
+from app.services.geometry import estimate_from_metrics, STLError
+from app.services.pricing import calculate_estimate, rate_table
+from app.services.storage import cached_analysis, analyze_stored_file
+
+QUOTE_CACHE_SIZE = 4096
+# Stored files are immutable, so their metrics never go stale
+METRICS_CACHE_SIZE = 1024
+MAX_QUOTE_FILES = 50
+MAX_QUOTE_QUANTITY = 10000
+_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+
+@lru_cache(maxsize=METRICS_CACHE_SIZE)
+def file_metrics(sha256):
+    """
+    Analysis of stored contents: the worker's cached result if there is
+    one, otherwise computed here without saving it. Failures raise and are
+    not cached.
+    """
+    metrics = cached_analysis(sha256)
+    if metrics is None:
+        stored = StoredFile.query.filter_by(sha256=sha256).first()
+        if stored is None:
+            raise LookupError(sha256)
+        metrics = analyze_stored_file(stored.rel_path)
+    return metrics
+
+
+@lru_cache(maxsize=QUOTE_CACHE_SIZE)
+def quote_line(sha256, material_type, quantity, customer_id, rush, version):
+    """
+    One priced line. `version` (pricing rules + calibration) is only part of
+    the key: when either changes, old entries stop matching and age out.
+    """
+    grams, minutes = calibrated_estimate(*estimate_from_metrics(file_metrics(sha256), material_type),
+                                         material_type)
+    return {
+        'hash': sha256,
+        'estimated_material_grams': grams,
+        'estimated_time_minutes': minutes,
+        'price': calculate_estimate(grams, minutes, quantity, material_type, customer_id, rush),
+    }
+
+
+def owned_hashes(user_id, hashes):
+    """The subset of `hashes` this customer has uploaded or ordered before."""
+    uploaded = db.session.query(Upload.file_hash).filter(
+        Upload.customer_user_id == user_id, Upload.file_hash.in_(hashes))
+    ordered = db.session.query(PrintJob.file_hash).join(Order).filter(
+        Order.customer_user_id == user_id, PrintJob.file_hash.in_(hashes))
+    return {sha for (sha,) in uploaded.union(ordered)}
+
+
+def quote(user_id, hashes, material_type, quantity, rush=False):
+    """
+    Prices files the customer already uploaded without creating an order.
+    Read-only: nothing is written to the database. Returns a dict with
+    per-file lines (or a per-file error) and the total of the priced ones.
+    """
+    if not hashes or len(hashes) > MAX_QUOTE_FILES:
+        raise ValueError(f"Quote between 1 and {MAX_QUOTE_FILES} files")
+    if not all(isinstance(h, str) and _SHA256.match(h) for h in hashes):
+        raise ValueError("Invalid file hash")
+    if not 1 <= quantity <= MAX_QUOTE_QUANTITY:
+        raise ValueError("Invalid quantity")
+    unknown = set(hashes) - owned_hashes(user_id, set(hashes))
+    if unknown:
+        raise LookupError(sorted(unknown)[0])
+
+    version = (rate_table().version, calibration_version())
+    lines = []
+    for sha256 in hashes:
+        try:
+            lines.append(dict(quote_line(sha256, material_type, quantity, user_id, bool(rush), version)))
+        except (OSError, STLError, LookupError):
+            lines.append({'hash': sha256, 'error': 'File could not be analyzed'})
+    return {
+        'lines': lines,
+        'total': round(sum(line.get('price', 0) for line in lines), 2),
+    }
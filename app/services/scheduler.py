@@ -0,0 +1,190 @@
+from sqlalchemy.orm import contains_eager
+from app.extensions import db
+from app.models import Order, PrintJob, Printer, OrderStatus, JobStatus, PrinterStatus
+from app.services.audit import log_action
+from app.services.workflow import assign_job, split_job
+from app.services.sequencing import changeover_minutes, job_minutes, job_spool, printer_spool, sequence_report
+from app.services.geometry import profile_time_factor
+from app.services.calibration import printer_time_factors
+
+# Orders in these states are not ready for the farm (draft or dead).
+UNSCHEDULABLE_ORDER_STATUSES = [OrderStatus.REVIEW, OrderStatus.CANCELLED]
+
+
+def order_jobs_for_planning(jobs):
+    """
+    Orders the waiting queue: rush orders first, then jobs grouped by
+    material/color so the same spool runs back to back. Groups are ordered
+    by their oldest order so grouping never starves an old order.
+    """
+    tiers = {True: [], False: []}
+    for job in jobs:
+        tiers[bool(job.order.priority)].append(job)
+
+    ordered = []
+    for tier in (tiers[True], tiers[False]):
+        groups = {}
+        for job in sorted(tier, key=lambda j: (j.order_id, j.id)):
+            groups.setdefault(job_spool(job), []).append(job)
+        for group in sorted(groups.values(), key=lambda g: (g[0].order_id, g[0].id)):
+            ordered.extend(group)
+    return ordered
+
+
+def build_plan(jobs, printers):
+    """
+    Plans the whole waiting queue over the printers in one pass.
+
+    Each usable printer is a lane. A printer that already holds a job starts
+    with that job's remaining estimate as its load, otherwise with whatever
+    spool is loaded. Jobs are placed greedily (list scheduling) on the lane
+    that becomes free first, counting changeover time when the spool
+    changes, which balances load by
+    estimated_time_minutes. A lane already running a job's spool keeps
+    taking that spool until it reaches its fair share of the total load, so
+    same-spool jobs stay together instead of being sprayed across printers.
+    Finally each lane is re-sequenced to minimise changeovers (see
+    app/services/sequencing.py).
+
+    Returns a list of lanes:
+    {'printer', 'load_minutes', 'last_spool', 'jobs', 'report'}.
+    """
+    printers = [p for p in printers if p.status in (PrinterStatus.IDLE, PrinterStatus.PRINTING)]
+    current_ids = [p.current_job_id for p in printers if p.current_job_id]
+    current_jobs = {}
+    if current_ids:
+        current_jobs = {j.id: j for j in PrintJob.query.filter(PrintJob.id.in_(current_ids)).all()}
+
+    calibrated = printer_time_factors()
+    lanes = []
+    for printer in printers:
+        current = current_jobs.get(printer.current_job_id)
+        spool = job_spool(current) if current else printer_spool(printer)
+        # Estimates are for the standard speed profile and the average
+        # printer; scale by profile and by how this one has actually done
+        factor = profile_time_factor(printer.speed_profile) * calibrated.get(printer.id, 1.0)
+        lanes.append({
+            'printer': printer,
+            'time_factor': factor,
+            'load_minutes': job_minutes(current) * factor if current else 0,
+            'start_spool': spool,
+            'last_spool': spool,
+            'jobs': [],
+        })
+
+    if not lanes:
+        return lanes
+
+    ordered = order_jobs_for_planning(jobs)
+    total = sum(job_minutes(j) for j in ordered) + sum(l['load_minutes'] for l in lanes)
+    fair_share = total / len(lanes)
+
+    for job in ordered:
+        spool = job_spool(job)
+        minutes = job_minutes(job)
+
+        def cost(lane):
+            # When this lane could start the job: current load plus any spool change
+            return lane['load_minutes'] + changeover_minutes(lane['last_spool'], spool)
+
+        same_spool = [l for l in lanes
+                      if l['last_spool'] == spool
+                      and l['load_minutes'] + minutes * l['time_factor'] <= fair_share]
+        lane = min(same_spool or lanes, key=cost)
+        lane['load_minutes'] = cost(lane) + minutes * lane['time_factor']
+        lane['last_spool'] = spool
+        lane['jobs'].append(job)
+
+    for lane in lanes:
+        lane['report'] = sequence_report(lane['jobs'], lane['start_spool'])
+        lane['jobs'] = lane['report']['sequence']
+
+    return lanes
+
+
+def plan_summary(plan):
+    """Farm-wide swap totals for a plan, sequenced vs FIFO by order id."""
+    reports = [lane['report'] for lane in plan]
+    return {
+        'swaps': sum(r['swaps'] for r in reports),
+        'setup_minutes': sum(r['setup_minutes'] for r in reports),
+        'fifo_swaps': sum(r['fifo_swaps'] for r in reports),
+        'fifo_setup_minutes': sum(r['fifo_setup_minutes'] for r in reports),
+        'minutes_saved': sum(r['minutes_saved'] for r in reports),
+    }
+
+
+def apply_plan(plan, user_id):
+    """
+    Assigns the head of every lane whose printer is free right now.
+    All assignments go out in a single commit. Lanes whose printer was taken
+    in the meantime (e.g. a manual assignment) are skipped.
+
+    Returns a list of (job, printer) tuples that were assigned.
+    """
+    assigned = []
+    try:
+        for lane in plan:
+            printer = lane['printer']
+            if not lane['jobs'] or printer.status != PrinterStatus.IDLE or printer.current_job_id is not None:
+                continue
+            job = lane['jobs'][0]
+            try:
+                assign_job(job, printer.id, user_id, commit=False)
+            except ValueError:
+                continue
+            job.status = JobStatus.QUEUED
+            log_action(user_id, "auto_assign", "PrintJob", job.id, after={'printer_id': printer.id})
+            assigned.append((job, printer))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return assigned
+
+
+def get_waiting_jobs():
+    return PrintJob.query.join(Order).filter(
+        PrintJob.status == JobStatus.WAITING,
+        PrintJob.assigned_printer_id.is_(None),
+        PrintJob.plate_id.is_(None),
+        Order.status.notin_(UNSCHEDULABLE_ORDER_STATUSES)
+    ).options(contains_eager(PrintJob.order)).order_by(PrintJob.order_id.asc(), PrintJob.id.asc()).all()
+
+
+def plan_current_queue():
+    """Builds a plan for the current waiting queue without changing anything."""
+    jobs = get_waiting_jobs()
+    printers = Printer.query.order_by(Printer.id.asc()).all()
+    return build_plan(jobs, printers)
+
+
+def split_for_idle_printers(jobs, idle_count, user_id):
+    """
+    When there are more idle printers than waiting jobs, splits the longest
+    multi-quantity jobs so the spare printers share their units.
+    Flushes but does not commit; apply_plan commits everything together.
+    """
+    spare = idle_count - len(jobs)
+    candidates = sorted((j for j in jobs if (j.quantity or 1) > 1),
+                        key=lambda j: (-job_minutes(j), j.order_id, j.id))
+    for job in candidates:
+        if spare <= 0:
+            break
+        runs = split_job(job, min(job.quantity, spare + 1), user_id, commit=False)
+        spare -= len(runs) - 1
+
+
+def run_scheduler(user_id=None):
+    """
+    Plans the current waiting queue and applies it. Safe to call on demand
+    from the operator UI or from the periodic tick (scripts/run_scheduler.py).
+    """
+    jobs = get_waiting_jobs()
+    idle_count = Printer.query.filter(
+        Printer.status == PrinterStatus.IDLE,
+        Printer.current_job_id.is_(None)
+    ).count()
+    if idle_count > len(jobs):
+        split_for_idle_printers(jobs, idle_count, user_id)
+    return apply_plan(plan_current_queue(), user_id)
@@ -0,0 +1,187 @@
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.models import PrintJob, Printer, JobStatus, PrinterStatus
+from app.services.scheduler import get_waiting_jobs, order_jobs_for_planning
+from app.services.sequencing import job_minutes
+
+DEFAULT_ITERATIONS = 2000
+# Spread of actual vs estimated print time (sigma of a lognormal multiplier)
+DURATION_SIGMA = 0.15
+# Share of a printing job still to go when it has no started_at (jobs
+# started before start_job recorded it)
+PRINTING_REMAINING_FRACTION = 0.5
+# Customer pages reuse one farm-wide run for this many seconds
+ETA_CACHE_SECONDS = 60
+
+_eta_cache = {}
+
+
+def historical_failure_rate():
+    """Share of finished attempts that ended FAILED."""
+    done = PrintJob.query.filter_by(status=JobStatus.DONE).count()
+    failed = PrintJob.query.filter_by(status=JobStatus.FAILED).count()
+    if done + failed == 0:
+        return 0.0
+    return failed / float(done + failed)
+
+
+def remaining_minutes(minutes, started_at, now):
+    """Estimated minutes left of a printing job; overdue prints count as finishing now."""
+    if started_at is None:
+        return minutes * PRINTING_REMAINING_FRACTION
+    return max(0.0, minutes - (now - started_at).total_seconds() / 60.0)
+
+
+def snapshot_farm():
+    """
+    Reads the current farm state into plain Python/NumPy structures.
+    Nothing returned here is attached to the session, so simulations and
+    what-if changes can never leak back into production data.
+    """
+    printers = Printer.query.filter(
+        Printer.status.in_([PrinterStatus.IDLE, PrinterStatus.PRINTING])
+    ).order_by(Printer.id.asc()).all()
+
+    committed = PrintJob.query.filter(
+        PrintJob.status.in_([JobStatus.QUEUED, JobStatus.PRINTING]),
+        PrintJob.assigned_printer_id.isnot(None)
+    ).all()
+    lane_of = {p.id: i for i, p in enumerate(printers)}
+    now = datetime.utcnow()
+
+    # Work already bound to a printer: (lane index, minutes, job id, order id)
+    bound = []
+    for job in committed:
+        if job.assigned_printer_id not in lane_of:
+            continue
+        minutes = float(job_minutes(job))
+        if job.status == JobStatus.PRINTING:
+            minutes = remaining_minutes(minutes, job.started_at, now)
+        bound.append((lane_of[job.assigned_printer_id], minutes, job.id, job.order_id))
+
+    waiting = order_jobs_for_planning(get_waiting_jobs())
+
+    return {
+        'printer_ids': [p.id for p in printers],
+        'bound': bound,
+        'waiting': [(j.id, j.order_id, float(job_minutes(j))) for j in waiting],
+        'failure_rate': historical_failure_rate(),
+        'taken_at': now,
+    }
+
+
+def _sample_durations(rng, minutes, failure_rate, iterations):
+    """Actual minutes for one job across all iterations, retries included."""
+    noise = rng.lognormal(mean=0.0, sigma=DURATION_SIGMA, size=iterations)
+    duration = minutes * noise
+    if failure_rate > 0:
+        attempts = rng.geometric(1.0 - min(failure_rate, 0.95), size=iterations)
+        # Each failed attempt burns a random share of a full print
+        wasted = (attempts - 1) * rng.uniform(0.0, 1.0, size=iterations) * duration
+        duration = duration + wasted
+    return duration
+
+
+def simulate(snapshot, iterations=DEFAULT_ITERATIONS, extra_printers=0, seed=None):
+    """
+    Monte-Carlo replay of the queue. All iterations advance together as
+    rows of a (iterations x printers) matrix of "printer free at" minutes,
+    so the Python loop is over jobs only.
+
+    Returns {'jobs': {job_id: samples}, 'orders': {order_id: samples},
+    'makespan': samples}, all in minutes from the snapshot time.
+    """
+    rng = np.random.default_rng(seed)
+    n_lanes = len(snapshot['printer_ids']) + max(0, int(extra_printers))
+    p_fail = snapshot['failure_rate']
+    rows = np.arange(iterations)
+
+    job_done = {}
+    order_done = {}
+
+    def finish(job_id, order_id, end):
+        job_done[job_id] = end
+        if order_id in order_done:
+            np.maximum(order_done[order_id], end, out=order_done[order_id])
+        else:
+            order_done[order_id] = end.copy()
+
+    if n_lanes == 0:
+        return {'jobs': job_done, 'orders': order_done, 'makespan': np.full(iterations, np.inf)}
+
+    free_at = np.zeros((iterations, n_lanes))
+    for lane, minutes, job_id, order_id in snapshot['bound']:
+        free_at[:, lane] += _sample_durations(rng, minutes, p_fail, iterations)
+        finish(job_id, order_id, free_at[:, lane].copy())
+
+    for job_id, order_id, minutes in snapshot['waiting']:
+        lane = np.argmin(free_at, axis=1)
+        end = free_at[rows, lane] + _sample_durations(rng, minutes, p_fail, iterations)
+        free_at[rows, lane] = end
+        finish(job_id, order_id, end)
+
+    return {'jobs': job_done, 'orders': order_done, 'makespan': free_at.max(axis=1)}
+
+
+def summarize(samples, taken_at):
+    """p50/p90 of a sample vector as absolute timestamps (None if unbounded)."""
+    if not np.all(np.isfinite(samples)):
+        return None
+    p50, p90 = np.percentile(samples, [50, 90])
+    return {
+        'p50_minutes': float(p50),
+        'p90_minutes': float(p90),
+        'p50': taken_at + timedelta(minutes=float(p50)),
+        'p90': taken_at + timedelta(minutes=float(p90)),
+    }
+
+
+def what_if(extra_printers, iterations=DEFAULT_ITERATIONS, seed=None):
+    """
+    Compares the current farm with the same farm plus extra idle printers.
+    Read-only: works from a snapshot, never touches the session.
+    """
+    snapshot = snapshot_farm()
+    base = simulate(snapshot, iterations, seed=seed)
+    scenario = simulate(snapshot, iterations, extra_printers=extra_printers, seed=seed)
+
+    orders = []
+    for order_id in sorted(base['orders']):
+        orders.append({
+            'order_id': order_id,
+            'current': summarize(base['orders'][order_id], snapshot['taken_at']),
+            'what_if': summarize(scenario['orders'][order_id], snapshot['taken_at']),
+        })
+
+    has_work = bool(snapshot['bound'] or snapshot['waiting'])
+    return {
+        'printers': len(snapshot['printer_ids']),
+        'extra_printers': extra_printers,
+        'failure_rate': snapshot['failure_rate'],
+        'current': summarize(base['makespan'], snapshot['taken_at']) if has_work else None,
+        'what_if': summarize(scenario['makespan'], snapshot['taken_at']) if has_work else None,
+        'orders': orders,
+    }
+
+
+def get_order_eta(order):
+    """
+    ETA for one order, from a farm-wide run shared for ETA_CACHE_SECONDS.
+    Returns None when the order has no outstanding work on the farm.
+    """
+    now = time.monotonic()
+    cached = _eta_cache.get('farm')
+    if cached is None or now - cached[0] > ETA_CACHE_SECONDS:
+        snapshot = snapshot_farm()
+        result = simulate(snapshot)
+        etas = {oid: summarize(s, snapshot['taken_at']) for oid, s in result['orders'].items()}
+        cached = (now, etas)
+        _eta_cache['farm'] = cached
+    return cached[1].get(order.id)
+
+
+def clear_eta_cache():
+    _eta_cache.clear()
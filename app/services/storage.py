@@ -1,40 +1,194 @@
 import os
-import uuid
+import gzip
+import json
+import shutil
+import hashlib
+import tempfile
 from werkzeug.utils import secure_filename
 from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from app.extensions import db
+from app.models import StoredFile
+from app.services.printfiles import analyze_print_file
 
-def save_file(file, order_id):
+# Content-addressed files live under uploads/blobs/<first 2 hex>/<sha256><ext>
+BLOB_DIR = 'blobs'
+HASH_CHUNK_BYTES = 1024 * 1024
+# Files of old orders are gzipped in place by storage_maintenance
+GZ_SUFFIX = '.gz'
+
+def get_file_path(rel_path, decompress=True):
+    """
+    Resolves a stored relative path (uploads/order_123/abc_file.stl)
+    back to an absolute path on disk. If only a gzipped copy is left,
+    it is restored first unless `decompress` is False.
+    """
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    # rel_path always starts with 'uploads/', which is the UPLOAD_FOLDER itself
+    parts = rel_path.replace('\\', '/').split('/')[1:]
+    path = os.path.join(upload_folder, *parts)
+    if decompress and not os.path.exists(path) and os.path.exists(path + GZ_SUFFIX):
+        decompress_file(path + GZ_SUFFIX)
+    return path
+
+def file_exists(rel_path):
+    """True if the file is on disk, plain or gzipped."""
+    path = get_file_path(rel_path, decompress=False)
+    return os.path.exists(path) or os.path.exists(path + GZ_SUFFIX)
+
+def touch_file(rel_path):
+    """
+    Bumps a stored file's mtime, plain or gzipped, so collect_garbage's
+    grace period covers a file just handed out again. False if it is gone.
+    """
+    path = get_file_path(rel_path, decompress=False)
+    for candidate in (path, path + GZ_SUFFIX):
+        try:
+            os.utime(candidate)
+            return True
+        except FileNotFoundError:
+            pass
+    return False
+
+def decompress_file(gz_path):
+    """Restores `x.gz` to `x` (via a temp file, so readers never see half a file) and drops the .gz."""
+    path = gz_path[:-len(GZ_SUFFIX)]
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out, gzip.open(gz_path, 'rb') as src:
+            shutil.copyfileobj(src, out, HASH_CHUNK_BYTES)
+        os.replace(tmp_path, path)
+    except FileNotFoundError:
+        # Another request restored it first
+        if not os.path.exists(path):
+            raise
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    if os.path.exists(gz_path):
+        os.remove(gz_path)
+    return path
+
+def compress_file(path):
+    """Gzips `path` to `path.gz` and removes the original. Returns bytes saved."""
+    gz_path = path + GZ_SUFFIX
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) as out, \
+                open(path, 'rb') as src:
+            shutil.copyfileobj(src, out, HASH_CHUNK_BYTES)
+        os.replace(tmp_path, gz_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    saved = os.path.getsize(path) - os.path.getsize(gz_path)
+    os.remove(path)
+    return saved
+
+def analyze_stored_file(rel_path):
+    """
+    Metrics for a stored upload. STLs are memory-mapped and scanned in
+    fixed-size chunks, so a 64MB upload costs a worker no more memory than
+    a small one; G-code and 3MF files are streamed (services/printfiles).
+    """
+    return analyze_print_file(get_file_path(rel_path))
+
+def _blob_rel_path(sha256, ext):
+    return '/'.join(['uploads', BLOB_DIR, sha256[:2], sha256 + ext])
+
+def blob_root():
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], BLOB_DIR)
+
+def copy_hashing(stream, out, limit=None):
     """
-    Saves an uploaded file to the uploads directory.
-    d:/.../app/uploads/order_{id}/{uuid}_{filename}
-    Returns relative path from app root for DB storage.
+    Copies `stream` to the open file `out` in HASH_CHUNK_BYTES pieces and
+    returns (sha256 hexdigest, bytes copied). Stops after `limit` bytes.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    while limit is None or size < limit:
+        chunk = stream.read(HASH_CHUNK_BYTES if limit is None else min(HASH_CHUNK_BYTES, limit - size))
+        if not chunk:
+            break
+        digest.update(chunk)
+        out.write(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def store_upload(file):
+    """
+    Streams an uploaded file into the content-addressed store, hashing it as
+    it is written, and returns its StoredFile. Identical contents are kept
+    once: a repeat upload just returns the existing record. The caller links
+    it to a PrintJob through file_hash, which is what counts the reference.
     """
     if not file:
         return None
-        
-    filename = secure_filename(file.filename)
-    
-    # Create order specific folder
-    upload_folder = current_app.config['UPLOAD_FOLDER']
-    order_folder = os.path.join(upload_folder, f'order_{order_id}')
-    
-    if not os.path.exists(order_folder):
-        os.makedirs(order_folder)
-        
-    # Generate unique filename to prevent overwrites
-    unique_name = f"{uuid.uuid4().hex[:8]}_{filename}"
-    file_path = os.path.join(order_folder, unique_name)
-    
-    file.save(file_path)
-    
-    # Return path relative to upload_folder for portability if needed, 
-    # but prompt requested absolute path or just file path. 
-    # Storing path relative to 'app/' or just the filename?
-    # Let's store relative path from app root so we can serve/find it later easily.
-    # relative: uploads/order_123/abc_file.stl
-    
-    rel_path = os.path.join('uploads', f'order_{order_id}', unique_name)
-    # normalize separators
-    rel_path = rel_path.replace('\\', '/')
-    
-    return rel_path
+
+    os.makedirs(blob_root(), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=blob_root(), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            sha256, size = copy_hashing(file.stream, out)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return ingest_file(tmp_path, sha256, size, file.filename)
+
+def ingest_file(tmp_path, sha256, size, filename):
+    """
+    Moves a fully written file (on the uploads filesystem) into the store
+    under its hash, or drops it if those contents are already stored.
+    Returns the StoredFile.
+    """
+    ext = os.path.splitext(secure_filename(filename))[1].lower()
+    try:
+        stored = StoredFile.query.filter_by(sha256=sha256).first()
+        if stored is not None and touch_file(stored.rel_path):
+            return stored
+
+        rel_path = stored.rel_path if stored else _blob_rel_path(sha256, ext)
+        final_path = get_file_path(rel_path)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(tmp_path, final_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    if stored is None:
+        stored = StoredFile(sha256=sha256, rel_path=rel_path, size_bytes=size, ref_count=0)
+        try:
+            # Savepoint: a concurrent upload of the same bytes may win the insert
+            with db.session.begin_nested():
+                db.session.add(stored)
+        except IntegrityError:
+            stored = StoredFile.query.filter_by(sha256=sha256).one()
+    return stored
+
+def cached_analysis(sha256):
+    """Metrics computed earlier for these contents, or None."""
+    stored = StoredFile.query.filter_by(sha256=sha256).first() if sha256 else None
+    if stored is None or not stored.analysis_json:
+        return None
+    return json.loads(stored.analysis_json)
+
+def analyze_job_file(job):
+    """
+    analyze_stored_file for a job, served from the per-hash cache when the
+    same contents were analyzed before. Fresh results are cached (caller
+    commits).
+    """
+    metrics = cached_analysis(job.file_hash)
+    if metrics is None:
+        metrics = analyze_stored_file(job.stl_path)
+        if job.file_hash:
+            stored = StoredFile.query.filter_by(sha256=job.file_hash).first()
+            stored.analysis_json = json.dumps(metrics)
+    return metrics
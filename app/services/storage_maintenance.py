@@ -0,0 +1,166 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app.extensions import db
+from app.models import PrintJob, Order, StoredFile, Upload, OrderStatus, UploadStatus
+from app.services.storage import GZ_SUFFIX, compress_file, file_exists, get_file_path
+from app.services.uploads import PARTIAL_DIR
+from app.services.thumbnails import THUMB_DIR
+
+# Files younger than this are never collected: they may belong to a
+# request that has written the file but not yet committed its row.
+GRACE_SECONDS = 3600
+# Chunked uploads nobody has touched for this long are abandoned
+ABANDONED_UPLOAD_DAYS = 2
+DEFAULT_COMPRESS_AFTER_DAYS = 30
+# Orders that will not print again; their files can be compressed
+ARCHIVED_ORDER_STATUSES = [OrderStatus.DONE, OrderStatus.SHIPPED, OrderStatus.COMPLETED, OrderStatus.CANCELLED]
+
+
+def iter_files(root):
+    """Streams (DirEntry, rel_path) for every file under `root` without listing it all up front."""
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    rel = os.path.relpath(entry.path, root).replace(os.sep, '/')
+                    yield entry, 'uploads/' + rel
+
+
+def _canonical(rel_path):
+    rel_path = rel_path.replace('\\', '/')
+    return rel_path[:-len(GZ_SUFFIX)] if rel_path.endswith(GZ_SUFFIX) else rel_path
+
+
+def referenced_paths():
+    """Every stored path something in the database still points at."""
+    refs = {_canonical(p) for (p,) in db.session.query(PrintJob.stl_path).distinct().yield_per(1000)}
+    # Completed chunked uploads waiting for their order to be placed
+    refs.update(_canonical(p) for (p,) in db.session.query(StoredFile.rel_path)
+                .join(Upload, Upload.file_hash == StoredFile.sha256)
+                .filter(Upload.status == UploadStatus.COMPLETE))
+    return refs
+
+
+def _claimed_since_scan(rel_path, newest_allowed):
+    """
+    Fresh look at one file about to be deleted: an upload of the same
+    contents may have reused it (bumping its mtime, see storage.ingest_file)
+    or committed a job pointing at it after referenced_paths() ran.
+    """
+    path = get_file_path(rel_path, decompress=False)
+    try:
+        if os.stat(path).st_mtime > newest_allowed:
+            return True
+    except FileNotFoundError:
+        return True
+    # End the read transaction so rows committed since are visible
+    db.session.commit()
+    canonical = _canonical(rel_path)
+    paths = [canonical, canonical + GZ_SUFFIX]
+    if db.session.query(PrintJob.id).filter(PrintJob.stl_path.in_(paths)).first() is not None:
+        return True
+    return db.session.query(StoredFile.sha256).filter(StoredFile.rel_path.in_(paths),
+                                                      StoredFile.ref_count > 0).first() is not None
+
+
+def _drop_abandoned_uploads(cutoff):
+    stale = Upload.query.filter(Upload.status == UploadStatus.RECEIVING, Upload.updated_at < cutoff).all()
+    for upload in stale:
+        db.session.delete(upload)
+    db.session.commit()
+    return len(stale)
+
+
+def _remove_empty_dirs(root):
+    for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+        if dirpath != root and not dirnames and not filenames:
+            try:
+                os.rmdir(dirpath)
+            except OSError:
+                pass
+
+
+def collect_garbage(dry_run=False, now=None):
+    """
+    Deletes files under UPLOAD_FOLDER that no PrintJob (or pending upload)
+    references, plus chunked uploads abandoned mid-transfer, and drops
+    StoredFile rows nothing points at any more. Returns a report dict.
+    """
+    now = now or datetime.utcnow()
+    root = current_app.config['UPLOAD_FOLDER']
+    report = {'files_deleted': 0, 'bytes_reclaimed': 0, 'uploads_abandoned': 0}
+    if not os.path.isdir(root):
+        return report
+
+    if not dry_run:
+        report['uploads_abandoned'] = _drop_abandoned_uploads(now - timedelta(days=ABANDONED_UPLOAD_DAYS))
+    receiving = {u.id for u in Upload.query.filter_by(status=UploadStatus.RECEIVING)}
+    refs = referenced_paths()
+    hashes = {sha for (sha,) in db.session.query(StoredFile.sha256).filter(StoredFile.ref_count > 0)}
+    newest_allowed = time.time() - GRACE_SECONDS
+
+    for entry, rel_path in iter_files(root):
+        if rel_path.startswith(f'uploads/{PARTIAL_DIR}/'):
+            if os.path.splitext(entry.name)[0] in receiving:
+                continue
+        elif rel_path.startswith(f'uploads/{THUMB_DIR}/'):
+            # Previews live as long as the file they show
+            if os.path.splitext(entry.name)[0] in hashes:
+                continue
+        elif _canonical(rel_path) in refs:
+            continue
+        stat = entry.stat(follow_symlinks=False)
+        if stat.st_mtime > newest_allowed:
+            continue
+        stored_blob = not rel_path.startswith((f'uploads/{PARTIAL_DIR}/', f'uploads/{THUMB_DIR}/'))
+        if not dry_run and stored_blob and _claimed_since_scan(rel_path, newest_allowed):
+            continue
+        report['files_deleted'] += 1
+        report['bytes_reclaimed'] += stat.st_size
+        if not dry_run:
+            os.remove(entry.path)
+
+    if not dry_run:
+        pending = db.session.query(Upload.file_hash).filter(Upload.status == UploadStatus.COMPLETE)
+        # A row whose file survived (e.g. reused since the scan) stays with it
+        orphans = [sha for (sha, rel_path) in db.session.query(StoredFile.sha256, StoredFile.rel_path)
+                   .filter(StoredFile.ref_count <= 0, ~StoredFile.sha256.in_(pending))
+                   if not file_exists(rel_path)]
+        if orphans:
+            # Consumed uploads are history only; let go of the row they point at
+            Upload.query.filter(Upload.file_hash.in_(orphans)).update({'file_hash': None}, synchronize_session=False)
+            StoredFile.query.filter(StoredFile.sha256.in_(orphans)).delete(synchronize_session=False)
+        db.session.commit()
+        _remove_empty_dirs(root)
+    return report
+
+
+def compress_old_files(days=DEFAULT_COMPRESS_AFTER_DAYS, dry_run=False, now=None):
+    """
+    Gzips the files of finished orders older than `days`. A file shared
+    with any newer or still active order is left alone. get_file_path
+    restores a compressed file on first access. Returns a report dict.
+    """
+    cutoff = (now or datetime.utcnow()) - timedelta(days=days)
+    archived = (Order.created_at < cutoff) & Order.status.in_(ARCHIVED_ORDER_STATUSES)
+
+    old = {p for (p,) in db.session.query(PrintJob.stl_path).join(Order).filter(archived).distinct()}
+    live = {p for (p,) in db.session.query(PrintJob.stl_path).join(Order).filter(~archived).distinct()}
+
+    report = {'files_compressed': 0, 'bytes_reclaimed': 0}
+    for rel_path in sorted(old - live):
+        path = get_file_path(rel_path, decompress=False)
+        if not os.path.exists(path):
+            continue  # already compressed, or missing
+        report['files_compressed'] += 1
+        if dry_run:
+            continue
+        report['bytes_reclaimed'] += compress_file(path)
+    return report
@@ -0,0 +1,148 @@
+import json
+import traceback
+from datetime import datetime
+
+from flask import current_app
+
+from app.extensions import db
+from app.models import Task, TaskStatus, PrintJob, Order, StoredFile, AnalysisStatus
+from app.services.geometry import estimate_from_metrics, STLError
+from app.services.pricing import price_order
+from app.services.calibration import apply_calibration
+from app.services.storage import analyze_job_file, get_file_path
+from app.services.thumbnails import render_thumbnail
+
+# A task that raises is retried until it has run this many times
+MAX_ATTEMPTS = 3
+
+HANDLERS = {}
+
+
+def task_handler(kind):
+    """Registers a function(payload) as the handler for tasks of `kind`."""
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def enqueue(kind, payload=None, commit=True):
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown task kind: {kind}")
+    task = Task(kind=kind, payload_json=json.dumps(payload or {}), status=TaskStatus.PENDING)
+    db.session.add(task)
+    if commit:
+        db.session.commit()
+    return task
+
+
+def claim_next():
+    """
+    Marks the oldest pending task RUNNING and returns its id, or None.
+    The conditional UPDATE makes the claim safe if two workers race.
+    """
+    while True:
+        task = Task.query.filter_by(status=TaskStatus.PENDING).order_by(Task.id).first()
+        if task is None:
+            return None
+        claimed = Task.query.filter_by(id=task.id, status=TaskStatus.PENDING).update(
+            {'status': TaskStatus.RUNNING, 'started_at': datetime.utcnow(), 'attempts': Task.attempts + 1},
+            synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return task.id
+
+
+def requeue_running():
+    """Puts tasks a dead worker left RUNNING back in the queue. Call at worker start."""
+    count = Task.query.filter_by(status=TaskStatus.RUNNING).update(
+        {'status': TaskStatus.PENDING}, synchronize_session=False)
+    db.session.commit()
+    return count
+
+
+def execute_task(task_id):
+    """Runs one claimed task inside the current app context and records the outcome."""
+    task = db.session.get(Task, task_id)
+    if task is None:
+        return None
+    try:
+        HANDLERS[task.kind](json.loads(task.payload_json or '{}'))
+        task.status = TaskStatus.DONE
+        task.error = None
+    except Exception:
+        db.session.rollback()
+        task = db.session.get(Task, task_id)
+        task.error = traceback.format_exc()
+        task.status = TaskStatus.PENDING if task.attempts < MAX_ATTEMPTS else TaskStatus.FAILED
+        current_app.logger.exception("Task %s (%s) failed", task.id, task.kind)
+    task.finished_at = datetime.utcnow()
+    db.session.commit()
+    return task.status
+
+
+def run_pending(limit=None):
+    """Drains the queue in this process. Returns the number of tasks run."""
+    ran = 0
+    while limit is None or ran < limit:
+        task_id = claim_next()
+        if task_id is None:
+            break
+        execute_task(task_id)
+        ran += 1
+    return ran
+
+
+# --- Handlers ---
+
+@task_handler('analyze_job')
+def analyze_job(payload):
+    """Mesh estimate for one uploaded job; reprices the order once its last job is in."""
+    job = db.session.get(PrintJob, payload['job_id'])
+    if job is None:
+        # Order was cancelled while the task waited
+        return
+    try:
+        metrics = analyze_job_file(job)
+        apply_calibration(job, *estimate_from_metrics(metrics, job.material_type))
+        job.analysis_status = AnalysisStatus.DONE
+    except (OSError, STLError):
+        # Keep the placeholder estimate so the order can still be reviewed
+        current_app.logger.warning("Could not analyze %s, using placeholder estimate", job.stl_path)
+        job.analysis_status = AnalysisStatus.FAILED
+
+    # Same transaction, so the page never sees every job done with a stale total
+    repriced = not any(j.analysis_status == AnalysisStatus.PENDING for j in job.order.jobs)
+    if repriced:
+        _reprice(job.order)
+    db.session.commit()
+
+    # A worker finishing a sibling job at the same moment saw this one pending
+    if not repriced and PrintJob.query.filter_by(
+            order_id=job.order_id, analysis_status=AnalysisStatus.PENDING).count() == 0:
+        enqueue('reprice_order', {'order_id': job.order_id})
+
+
+@task_handler('reprice_order')
+def reprice_order(payload):
+    order = db.session.get(Order, payload['order_id'])
+    if order is None:
+        return
+    _reprice(order)
+    db.session.commit()
+
+
+@task_handler('render_thumbnail')
+def render_thumbnail_task(payload):
+    stored = StoredFile.query.filter_by(sha256=payload['sha256']).first()
+    if stored is None:
+        return
+    try:
+        render_thumbnail(get_file_path(stored.rel_path), stored.sha256)
+    except (OSError, STLError):
+        # Nothing to draw; retrying will not help
+        current_app.logger.warning("Could not render a thumbnail for %s", stored.rel_path)
+
+
+def _reprice(order):
+    order.total_estimated_price = sum(price_order(order).values())
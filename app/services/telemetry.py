@@ -0,0 +1,227 @@
+import mmap
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, rings are then only safe within one process
+    fcntl = None
+
+import numpy as np
+from flask import current_app
+
+from app.extensions import db
+from app.models import Printer
+
+# Printer telemetry lives outside the SQL database: each printer has a
+# fixed-size ring of samples in a memory-mapped file under
+# TELEMETRY_FOLDER, shared by every worker process. Appending a batch is a
+# few array stores under a file lock; nothing grows and nothing is vacuumed.
+
+SAMPLE_DTYPE = np.dtype([
+    ('ts', '<f8'),          # unix time the printer took the sample
+    ('nozzle_c', '<f4'),    # NaN when not reported
+    ('bed_c', '<f4'),
+    ('progress', '<f4'),    # percent of the current print
+    ('error_code', '<i4'),  # 0 = no error
+])
+FLOAT_FIELDS = ('nozzle_c', 'bed_c', 'progress')
+HEADER_DTYPE = np.dtype([('magic', 'S4'), ('version', '<u4'), ('capacity', '<u4'), ('reserved', '<u4'),
+                         ('written', '<u8')])
+HEADER_BYTES = 64
+MAGIC = b'PFTL'
+VERSION = 1
+DEFAULT_CAPACITY = 3600  # an hour at 1 Hz
+MAX_BATCH = 10000
+# How long the set of valid printer ids is trusted before it is re-read
+PRINTER_IDS_TTL_SECONDS = 60
+# Sample timestamps must fall in this window around the server clock;
+# printers buffer offline for a while, but a year-old or far-future ts is
+# a bad clock and would overflow the history's datetime conversion
+MAX_SAMPLE_AGE_SECONDS = 366 * 86400
+MAX_SAMPLE_LEAD_SECONDS = 86400
+
+_rings = {}
+_rings_lock = threading.Lock()
+
+
+class TelemetryRing:
+    """
+    One printer's ring buffer file: a header holding the capacity and the
+    number of samples ever written, then `capacity` SAMPLE_DTYPE records.
+    Sample i lives at slot i % capacity, so the newest `capacity` survive.
+    """
+    def __init__(self, path, capacity=DEFAULT_CAPACITY):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.file = os.fdopen(fd, 'r+b')
+        with self._locked(exclusive=True):
+            if os.fstat(fd).st_size < HEADER_BYTES:
+                header = np.zeros((), HEADER_DTYPE)
+                header['magic'], header['version'], header['capacity'] = MAGIC, VERSION, capacity
+                self.file.truncate(HEADER_BYTES + capacity * SAMPLE_DTYPE.itemsize)
+                self.file.seek(0)
+                self.file.write(header.tobytes())
+                self.file.flush()
+            self.map = mmap.mmap(fd, 0)
+        self.header = np.ndarray((), HEADER_DTYPE, buffer=self.map)
+        if bytes(self.header['magic']) != MAGIC or int(self.header['version']) != VERSION:
+            raise ValueError(f"Not a telemetry ring: {path}")
+        self.capacity = int(self.header['capacity'])
+        self.records = np.ndarray((self.capacity,), SAMPLE_DTYPE, buffer=self.map, offset=HEADER_BYTES)
+        # flock does not exclude threads sharing this open file
+        self.thread_lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self, exclusive):
+        if fcntl is None:
+            yield
+            return
+        fcntl.flock(self.file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+
+    def append(self, samples):
+        samples = samples[-self.capacity:]
+        with self.thread_lock, self._locked(exclusive=True):
+            written = int(self.header['written'])
+            self.records[(written + np.arange(len(samples))) % self.capacity] = samples
+            self.header['written'] = written + len(samples)
+
+    def recent(self, limit=None):
+        """The newest `limit` samples (default: all held), oldest first."""
+        with self.thread_lock, self._locked(exclusive=False):
+            written = int(self.header['written'])
+            count = min(written, self.capacity, limit or self.capacity)
+            return self.records[np.arange(written - count, written) % self.capacity].copy()
+
+
+def telemetry_folder():
+    """The ring file directory, or None when telemetry is off (as in tests)."""
+    return current_app.config.get('TELEMETRY_FOLDER')
+
+
+def ring_for(printer_id):
+    """This process's open ring for a printer, creating the file on first use."""
+    folder = telemetry_folder()
+    if not folder:
+        raise ValueError("Telemetry storage is not configured")
+    path = os.path.join(folder, f'{int(printer_id)}.ring')
+    ring = _rings.get(path)
+    if ring is None:
+        with _rings_lock:
+            ring = _rings.get(path)
+            if ring is None:
+                os.makedirs(folder, exist_ok=True)
+                ring = _rings[path] = TelemetryRing(path, current_app.config.get('TELEMETRY_CAPACITY',
+                                                                                  DEFAULT_CAPACITY))
+    return ring
+
+
+def known_printer_ids():
+    """Printer ids, re-read at most every PRINTER_IDS_TTL_SECONDS rather than per batch."""
+    cache = current_app.extensions.setdefault('telemetry_printer_ids', {'ids': frozenset(), 'expires': 0.0})
+    now = time.monotonic()
+    if now >= cache['expires']:
+        cache['ids'] = frozenset(pid for (pid,) in db.session.query(Printer.id))
+        cache['expires'] = now + PRINTER_IDS_TTL_SECONDS
+    return cache['ids']
+
+
+def parse_samples(items, now=None):
+    """
+    (printer_ids, samples) arrays from a list of sample dicts:
+    {"printer_id": 3, "ts": 1760000000.5, "nozzle_c": 214.8, "bed_c": 60.1,
+     "progress": 42.0, "error_code": 0}. Only printer_id is required; ts
+    defaults to now and must otherwise be within MAX_SAMPLE_AGE_SECONDS
+    before and MAX_SAMPLE_LEAD_SECONDS after now. Missing readings are
+    stored as NaN.
+    """
+    if not isinstance(items, list) or not items:
+        raise ValueError("Expected a non-empty list of samples")
+    if len(items) > MAX_BATCH:
+        raise ValueError(f"At most {MAX_BATCH} samples per batch")
+    now = time.time() if now is None else now
+    printer_ids = np.empty(len(items), dtype=np.int64)
+    samples = np.empty(len(items), dtype=SAMPLE_DTYPE)
+    try:
+        for i, item in enumerate(items):
+            printer_ids[i] = int(item['printer_id'])
+            get = item.get
+            samples[i] = (now if get('ts') is None else float(get('ts')),
+                          *(np.nan if get(f) is None else float(get(f)) for f in FLOAT_FIELDS),
+                          int(get('error_code') or 0))
+    except (KeyError, TypeError, ValueError, AttributeError, OverflowError):
+        raise ValueError(f"Invalid sample at index {i}")
+    ts = samples['ts']
+    # NaN fails both comparisons, so non-finite ts is rejected here too
+    out_of_window = ~((ts >= now - MAX_SAMPLE_AGE_SECONDS) & (ts <= now + MAX_SAMPLE_LEAD_SECONDS))
+    if out_of_window.any():
+        raise ValueError(f"Invalid sample at index {int(np.argmax(out_of_window))}: ts is not a recent unix time")
+    return printer_ids, samples
+
+
+def ingest(items):
+    """
+    Appends a batch to the printers' rings and history segments, grouped
+    per printer and in time order. Samples for unknown printers are dropped. Returns
+    {'accepted': n, 'rejected': n}.
+    """
+    printer_ids, samples = parse_samples(items)
+    known = np.isin(printer_ids, np.fromiter(known_printer_ids(), dtype=np.int64))
+    rejected = int((~known).sum())
+    printer_ids, samples = printer_ids[known], samples[known]
+
+    order = np.lexsort((samples['ts'], printer_ids))
+    printer_ids, samples = printer_ids[order], samples[order]
+    bounds = np.flatnonzero(np.diff(printer_ids)) + 1
+    # Imported here: the history module builds on this one's sample layout
+    from app.services.telemetry_history import record_samples
+    for group in np.split(np.arange(len(printer_ids)), bounds):
+        if len(group):
+            printer_id = printer_ids[group[0]]
+            ring_for(printer_id).append(samples[group])
+            try:
+                record_samples(printer_id, samples[group])
+            except OSError:
+                # The live reading stands; only the long-term history misses this batch
+                current_app.logger.warning("Could not record telemetry history for printer %s", printer_id,
+                                           exc_info=True)
+    return {'accepted': len(printer_ids), 'rejected': rejected}
+
+
+def _as_dict(sample, now):
+    reading = {field: (None if np.isnan(sample[field]) else round(float(sample[field]), 2))
+               for field in FLOAT_FIELDS}
+    reading.update(ts=float(sample['ts']), error_code=int(sample['error_code']),
+                   age_seconds=max(0.0, round(now - float(sample['ts']), 1)))
+    return reading
+
+
+def latest_sample(printer_id, now=None):
+    """The newest reading of a printer as a dict, or None if it never reported."""
+    folder = telemetry_folder()
+    if not folder:
+        return None
+    path = os.path.join(folder, f'{int(printer_id)}.ring')
+    if path not in _rings and not os.path.exists(path):
+        return None
+    recent = ring_for(printer_id).recent(1)
+    return _as_dict(recent[0], time.time() if now is None else now) if len(recent) else None
+
+
+def reporting_printer_ids():
+    """Ids of the printers that have ever sent telemetry (those with a ring file)."""
+    folder = telemetry_folder()
+    if not folder or not os.path.isdir(folder):
+        return []
+    return sorted(int(name[:-5]) for name in os.listdir(folder) if name.endswith('.ring') and name[:-5].isdigit())
+
+
+def last_report_time(printer_id):
+    """Unix time of a printer's newest sample, or None."""
+    sample = latest_sample(printer_id)
+    return sample['ts'] if sample else None
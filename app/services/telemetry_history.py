@@ -0,0 +1,247 @@
+import math
+import os
+import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:  # Windows: segments are then only safe within one process
+    fcntl = None
+
+import numpy as np
+from flask import current_app
+
+from app.services.telemetry import SAMPLE_DTYPE, FLOAT_FIELDS
+
+# Long-term telemetry: per printer, one append-only segment file per UTC day
+# and resolution under TELEMETRY_FOLDER/history/<printer_id>/, e.g.
+# 2026-10-18.1s holds that day's raw samples. compact() turns closed days
+# into 1-minute and 15-minute min/max/avg segments and drops each level
+# once it is past its retention, so 90 days of history stay a few MB per
+# printer. Nothing here touches the SQL database.
+
+# (name, bucket seconds, days kept), finest first
+LEVELS = (('1s', 1, 2), ('1m', 60, 14), ('15m', 900, 90))
+AGGREGATE_DTYPE = np.dtype(
+    [('ts', '<f8'), ('count', '<u4'), ('error_code', '<i4')]
+    + [(f'{field}_{stat}', '<f4') for field in FLOAT_FIELDS for stat in ('min', 'max', 'avg')]
+    # How many samples reported each reading, to weight averages when merging
+    + [(f'{field}_n', '<u4') for field in FLOAT_FIELDS])
+DAY_SECONDS = 86400
+# A day is compacted once it has been over this long, so late samples still land in its raw segment
+COMPACT_AFTER_SECONDS = 3600
+DEFAULT_MAX_POINTS = 500
+SEGMENT_NAME = re.compile(r'^(\d{4}-\d{2}-\d{2})\.(1s|1m|15m)$')
+EPOCH = datetime(1970, 1, 1)
+
+
+def history_folder():
+    """The segment directory, or None when telemetry is off (as in tests)."""
+    folder = current_app.config.get('TELEMETRY_FOLDER')
+    return os.path.join(folder, 'history') if folder else None
+
+
+def segment_path(printer_id, day, level):
+    return os.path.join(history_folder(), str(int(printer_id)), f'{day.isoformat()}.{level}')
+
+
+def _dtype(level):
+    return SAMPLE_DTYPE if level == '1s' else AGGREGATE_DTYPE
+
+
+_segments_lock = threading.Lock()
+
+
+@contextmanager
+def _locked(f, exclusive):
+    """Holds a segment's lock until the block ends; closing f releases the flock."""
+    if fcntl is None:
+        with _segments_lock:
+            yield
+        return
+    fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+    yield
+
+
+def _read(path, dtype):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as f, _locked(f, exclusive=False):
+        data = f.read()
+    # A torn trailing record from a crashed writer is ignored
+    return np.frombuffer(data[:len(data) - len(data) % dtype.itemsize], dtype=dtype)
+
+
+def _write(path, records):
+    """Replaces a derived segment atomically."""
+    tmp = f'{path}.tmp'
+    records.tofile(tmp)
+    os.replace(tmp, path)
+
+
+def _to_datetime(seconds):
+    return EPOCH + timedelta(seconds=float(seconds))
+
+
+def _to_seconds(moment):
+    return (moment - EPOCH).total_seconds()
+
+
+def record_samples(printer_id, samples):
+    """Appends raw samples (SAMPLE_DTYPE) to the printer's day segments."""
+    if not history_folder() or not len(samples):
+        return
+    folder = os.path.dirname(segment_path(printer_id, EPOCH.date(), '1s'))
+    os.makedirs(folder, exist_ok=True)
+    days = np.floor(samples['ts'] / DAY_SECONDS).astype(np.int64)
+    for day in np.unique(days):
+        path = segment_path(printer_id, _to_datetime(day * DAY_SECONDS).date(), '1s')
+        with open(path, 'ab') as f, _locked(f, exclusive=True):
+            f.write(samples[days == day].tobytes())
+
+
+def as_aggregate(samples):
+    """Raw samples as one-sample buckets, so every level can be handled alike."""
+    records = np.zeros(len(samples), dtype=AGGREGATE_DTYPE)
+    records['ts'] = samples['ts']
+    records['count'] = 1
+    records['error_code'] = samples['error_code']
+    for field in FLOAT_FIELDS:
+        for stat in ('min', 'max', 'avg'):
+            records[f'{field}_{stat}'] = samples[field]
+        records[f'{field}_n'] = ~np.isnan(samples[field])
+    return records
+
+
+def downsample(records, step):
+    """
+    Merges AGGREGATE_DTYPE records into `step`-second buckets: min of the
+    minimums, max of the maximums, averages weighted by how many samples
+    reported the reading, and the highest error code seen. Buckets without
+    any sample are left out.
+    """
+    if not len(records):
+        return np.zeros(0, dtype=AGGREGATE_DTYPE)
+    records = records[np.argsort(records['ts'], kind='stable')]
+    buckets = np.floor(records['ts'] / step) * step
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+
+    out = np.zeros(len(starts), dtype=AGGREGATE_DTYPE)
+    out['ts'] = buckets[starts]
+    out['count'] = np.add.reduceat(records['count'], starts)
+    out['error_code'] = np.maximum.reduceat(records['error_code'], starts)
+    for field in FLOAT_FIELDS:
+        out[f'{field}_min'] = np.fmin.reduceat(records[f'{field}_min'], starts)
+        out[f'{field}_max'] = np.fmax.reduceat(records[f'{field}_max'], starts)
+        weights = records[f'{field}_n'].astype(np.float64)
+        totals = np.add.reduceat(np.nan_to_num(records[f'{field}_avg'].astype(np.float64)) * weights, starts)
+        out[f'{field}_n'] = counts = np.add.reduceat(records[f'{field}_n'], starts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out[f'{field}_avg'] = np.where(counts > 0, totals / counts, np.nan)
+    return out
+
+
+def _load_day(printer_id, day, level):
+    """A day's records at `level` as AGGREGATE_DTYPE, or None if that segment does not exist."""
+    records = _read(segment_path(printer_id, day, level), _dtype(level))
+    if records is None:
+        return None
+    return as_aggregate(records) if level == '1s' else records
+
+
+def compact(now=None):
+    """
+    Builds the 1m segment of every closed day from its raw samples and the
+    15m segment from the 1m one, then deletes segments older than their
+    level's retention (a level is only dropped once the next has been
+    built). Run nightly; returns counts of what was done.
+    """
+    result = {'segments_written': 0, 'segments_deleted': 0, 'bytes_reclaimed': 0}
+    root = history_folder()
+    if not root or not os.path.isdir(root):
+        return result
+    now = now or datetime.utcnow()
+    for printer_dir in sorted(os.listdir(root)):
+        if not printer_dir.isdigit():
+            continue
+        printer_id = int(printer_dir)
+        segments = {}
+        for name in os.listdir(os.path.join(root, printer_dir)):
+            match = SEGMENT_NAME.match(name)
+            if match:
+                day = datetime.strptime(match.group(1), '%Y-%m-%d').date()
+                segments.setdefault(day, set()).add(match.group(2))
+
+        for day, levels in sorted(segments.items()):
+            day_start = datetime.combine(day, datetime.min.time())
+            if (now - day_start).total_seconds() < DAY_SECONDS + COMPACT_AFTER_SECONDS:
+                continue
+            for (finer, _, _), (coarser, step, _) in zip(LEVELS, LEVELS[1:]):
+                if coarser not in levels and finer in levels:
+                    _write(segment_path(printer_id, day, coarser),
+                           downsample(_load_day(printer_id, day, finer), step))
+                    levels.add(coarser)
+                    result['segments_written'] += 1
+            for i, (level, _, keep_days) in enumerate(LEVELS):
+                expired = day < (now - timedelta(days=keep_days)).date()
+                superseded = i + 1 < len(LEVELS) and LEVELS[i + 1][0] in levels
+                if level in levels and expired and (superseded or i + 1 == len(LEVELS)):
+                    path = segment_path(printer_id, day, level)
+                    result['bytes_reclaimed'] += os.path.getsize(path)
+                    os.remove(path)
+                    levels.discard(level)
+                    result['segments_deleted'] += 1
+    return result
+
+
+def choose_step(span_seconds, max_points=DEFAULT_MAX_POINTS):
+    """The finest level step giving at most `max_points` buckets, or a multiple of the coarsest."""
+    for _, step, _ in LEVELS:
+        if span_seconds / step <= max_points:
+            return step
+    coarsest = LEVELS[-1][1]
+    return coarsest * math.ceil(span_seconds / max_points / coarsest)
+
+
+def query(printer_id, start, end, max_points=DEFAULT_MAX_POINTS):
+    """
+    Telemetry of one printer over [start, end) (naive UTC datetimes) in at
+    most about `max_points` buckets, ready for a chart:
+    {'resolution_seconds': step, 'ts': [unix seconds, ...],
+     'nozzle_c': {'min': [...], 'max': [...], 'avg': [...]}, 'bed_c': ...,
+     'progress': ..., 'error_code': [...]}. Each day is read from the
+    coarsest segment no coarser than the step, falling back to finer raw
+    data for days not compacted yet and to coarser data once it has expired.
+    """
+    if end <= start:
+        raise ValueError("The window must end after it starts")
+    step = choose_step((end - start).total_seconds(), max_points)
+    usable = [name for name, level_step, _ in LEVELS if step % level_step == 0]
+    # Preferred order: coarsest usable first, then finer, then anything coarser
+    order = usable[::-1] + [name for name, _, _ in LEVELS if name not in usable]
+
+    parts = []
+    day = start.date()
+    last_day = (end - timedelta(microseconds=1)).date() if history_folder() else day - timedelta(days=1)
+    while day <= last_day:
+        for level in order:
+            records = _load_day(printer_id, day, level)
+            if records is not None:
+                parts.append(records)
+                break
+        day += timedelta(days=1)
+
+    records = np.concatenate(parts) if parts else np.zeros(0, dtype=AGGREGATE_DTYPE)
+    records = records[(records['ts'] >= _to_seconds(start)) & (records['ts'] < _to_seconds(end))]
+    records = downsample(records, step)
+
+    def series(values):
+        return [None if math.isnan(v) else round(v, 2) for v in values.astype(np.float64).tolist()]
+
+    result = {'resolution_seconds': step, 'ts': records['ts'].tolist(),
+              'error_code': records['error_code'].tolist()}
+    for field in FLOAT_FIELDS:
+        result[field] = {stat: series(records[f'{field}_{stat}']) for stat in ('min', 'max', 'avg')}
+    return result
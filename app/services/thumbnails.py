@@ -0,0 +1,146 @@
+import os
+import struct
+import tempfile
+import zlib
+
+import numpy as np
+from flask import current_app
+
+from app.services.geometry import STLError
+from app.services.printfiles import load_mesh
+
+THUMB_DIR = 'thumbnails'
+THUMB_SIZE = 128
+# Rendered at this multiple and averaged down, for anti-aliased edges
+SUPERSAMPLE = 2
+# View: turned 35 degrees about Z, then tilted 30 degrees towards the camera
+VIEW_AZIMUTH_DEG = 35.0
+VIEW_ELEVATION_DEG = 30.0
+# In view space (x right, y into the screen, z up): from the upper left, in front
+LIGHT_DIR = np.array([-0.4, -0.6, 0.7])
+BASE_COLOR = np.array([86, 140, 201], dtype=np.float32)
+AMBIENT = 0.35
+
+
+def thumbnail_path(sha256):
+    """Cache location: previews are keyed by the file's content hash."""
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], THUMB_DIR, sha256[:2], sha256 + '.png')
+
+
+def _view_matrix():
+    az = np.radians(VIEW_AZIMUTH_DEG)
+    el = np.radians(VIEW_ELEVATION_DEG)
+    rot_z = np.array([[np.cos(az), -np.sin(az), 0], [np.sin(az), np.cos(az), 0], [0, 0, 1]])
+    # Looking along -Y' after the tilt: x right, z up, y into the screen
+    rot_x = np.array([[1, 0, 0], [0, np.cos(el), -np.sin(el)], [0, np.sin(el), np.cos(el)]])
+    return (rot_x @ rot_z).astype(np.float32)
+
+
+def _barycentric_grid(n):
+    """Sample weights (k, 3) covering a triangle with n steps per edge."""
+    if n == 0:
+        return np.full((1, 3), 1.0 / 3, dtype=np.float32)
+    i, j = np.meshgrid(np.arange(n + 1), np.arange(n + 1), indexing='ij')
+    keep = i + j <= n
+    a = i[keep] / n
+    b = j[keep] / n
+    return np.stack([1 - a - b, a, b], axis=1).astype(np.float32)
+
+
+def render_triangles(triangles, size=THUMB_SIZE):
+    """
+    Software-renders an (n, 3, 3) mesh to a (size, size, 4) uint8 RGBA image.
+
+    Each triangle is sampled on a barycentric grid fine enough to cover its
+    projected pixels (one sample for sub-pixel triangles, which is most of
+    them on a big mesh). A z-buffer resolved with np.minimum.at keeps the
+    nearest sample per pixel. Shading is flat Lambert, lit from both sides
+    because STL winding is unreliable.
+    """
+    if not len(triangles):
+        raise STLError("STL file has no triangles")
+    res = size * SUPERSAMPLE
+    tri = np.asarray(triangles, dtype=np.float32) @ _view_matrix().T
+
+    # Screen space: x right, z up; depth is +y (away from the camera)
+    xy = tri[:, :, [0, 2]]
+    lo = xy.reshape(-1, 2).min(axis=0)
+    hi = xy.reshape(-1, 2).max(axis=0)
+    scale = (res - 1) * 0.92 / max(float((hi - lo).max()), 1e-6)
+    offset = (res - 1 - (hi - lo) * scale) / 2
+    px = (xy - lo) * scale + offset
+    depth = tri[:, :, 1]
+
+    e1 = tri[:, 1] - tri[:, 0]
+    e2 = tri[:, 2] - tri[:, 0]
+    normal = np.stack([e1[:, 1] * e2[:, 2] - e1[:, 2] * e2[:, 1],
+                       e1[:, 2] * e2[:, 0] - e1[:, 0] * e2[:, 2],
+                       e1[:, 0] * e2[:, 1] - e1[:, 1] * e2[:, 0]], axis=1)
+    length = np.sqrt((normal * normal).sum(axis=1))
+    light = (LIGHT_DIR / np.linalg.norm(LIGHT_DIR)).astype(np.float32)
+    shade = AMBIENT + (1 - AMBIENT) * np.abs(normal @ light) / np.maximum(length, 1e-12)
+
+    # Longest projected edge decides how densely a triangle is sampled
+    edges = np.stack([px[:, 1] - px[:, 0], px[:, 2] - px[:, 1], px[:, 0] - px[:, 2]], axis=1)
+    steps = np.ceil(np.sqrt((edges * edges).sum(axis=2)).max(axis=1)).astype(np.int64)
+    steps[steps <= 1] = 0
+
+    sx, sy, sz, sshade = [], [], [], []
+    for n in np.unique(steps):
+        idx = np.nonzero(steps == n)[0]
+        w = _barycentric_grid(int(n))
+        sx.append((px[idx, :, 0] @ w.T).ravel())
+        sy.append((px[idx, :, 1] @ w.T).ravel())
+        sz.append((depth[idx] @ w.T).ravel())
+        sshade.append(np.repeat(shade[idx], len(w)))
+    sx = np.rint(np.concatenate(sx)).astype(np.int64)
+    sy = np.rint(np.concatenate(sy)).astype(np.int64)
+    sz = np.concatenate(sz)
+    sshade = np.concatenate(sshade)
+
+    pixel = (res - 1 - sy) * res + sx
+    zbuf = np.full(res * res, np.inf, dtype=np.float32)
+    np.minimum.at(zbuf, pixel, sz)
+    front = sz <= zbuf[pixel]
+    lum = np.zeros(res * res, dtype=np.float32)
+    lum[pixel[front]] = sshade[front]
+    covered = np.isfinite(zbuf).astype(np.float32)
+
+    # Average SUPERSAMPLE x SUPERSAMPLE blocks down to the output size
+    def down(a):
+        return a.reshape(size, SUPERSAMPLE, size, SUPERSAMPLE).mean(axis=(1, 3))
+    alpha = down(covered)
+    lum = down(lum) / np.maximum(alpha, 1e-6)
+
+    rgba = np.zeros((size, size, 4), dtype=np.uint8)
+    rgba[..., :3] = np.clip(lum[..., None] * BASE_COLOR, 0, 255).astype(np.uint8)
+    rgba[..., 3] = np.clip(alpha * 255, 0, 255).astype(np.uint8)
+    return rgba
+
+
+def encode_png(rgba):
+    """Minimal PNG encoder (8-bit RGBA, no filtering) using zlib and struct."""
+    height, width = rgba.shape[:2]
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    rows = np.concatenate([np.zeros((height, 1), dtype=np.uint8), rgba.reshape(height, -1)], axis=1)
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows.tobytes(), 6))
+            + chunk(b'IEND', b''))
+
+
+def render_thumbnail(mesh_path, sha256):
+    """Renders and caches the preview for one stored file. Returns its path."""
+    out_path = thumbnail_path(sha256)
+    if os.path.exists(out_path):
+        return out_path
+    png = encode_png(render_triangles(load_mesh(mesh_path)))
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(out_path), suffix='.part')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(png)
+    os.replace(tmp_path, out_path)
+    return out_path
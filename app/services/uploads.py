@@ -0,0 +1,115 @@
+import os
+from flask import current_app
+from werkzeug.utils import secure_filename
+
+from app.extensions import db
+from app.models import Upload, UploadStatus
+from app.services.storage import copy_hashing, file_sha256, ingest_file
+from app.services.printfiles import UPLOAD_EXTENSIONS
+
+PARTIAL_DIR = 'partial'
+# Largest chunk one request may carry; the browser sends 4MB
+MAX_CHUNK_BYTES = 8 * 1024 * 1024
+
+
+class UploadOffsetError(ValueError):
+    """A chunk arrived for the wrong offset; `offset` is where to resume."""
+    def __init__(self, offset):
+        super().__init__(f"Expected chunk at offset {offset}")
+        self.offset = offset
+
+
+def partial_path(upload):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], PARTIAL_DIR, f'{upload.id}.part')
+
+
+def create_upload(user_id, filename, size_bytes):
+    filename = secure_filename(filename or '')
+    if os.path.splitext(filename)[1].lower() not in UPLOAD_EXTENSIONS:
+        raise ValueError("STL, G-code or 3MF files only!")
+    size_bytes = int(size_bytes)
+    if size_bytes <= 0:
+        raise ValueError("File is empty")
+    if size_bytes > current_app.config['MAX_CONTENT_LENGTH']:
+        raise ValueError("File is too large")
+
+    upload = Upload(customer_user_id=user_id, filename=filename, size_bytes=size_bytes)
+    db.session.add(upload)
+    db.session.flush()
+    path = partial_path(upload)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    db.session.commit()
+    return upload
+
+
+def write_chunk(upload, offset, stream, checksum=None):
+    """
+    Streams one chunk from `stream` to the partial file at `offset`, which
+    must equal the bytes received so far. With `checksum` (hex SHA-256 of
+    the chunk) a mismatch discards the chunk. Returns the new offset.
+    """
+    if upload.status != UploadStatus.RECEIVING:
+        raise ValueError("Upload is already complete")
+    if offset != upload.received_bytes:
+        raise UploadOffsetError(upload.received_bytes)
+
+    limit = min(MAX_CHUNK_BYTES, upload.size_bytes - offset)
+    with open(partial_path(upload), 'r+b') as out:
+        out.seek(offset)
+        sha256, size = copy_hashing(stream, out, limit=limit)
+        if stream.read(1):
+            out.truncate(offset)
+            raise ValueError("Chunk is too large")
+        if checksum and checksum.lower() != sha256:
+            out.truncate(offset)
+            raise ValueError("Chunk checksum mismatch")
+        out.truncate(offset + size)
+
+    upload.received_bytes = offset + size
+    db.session.commit()
+    return upload.received_bytes
+
+
+def complete_upload(upload):
+    """Moves a fully received upload into the content-addressed store."""
+    if upload.status != UploadStatus.RECEIVING:
+        return upload
+    if upload.received_bytes != upload.size_bytes:
+        raise ValueError(f"Upload incomplete: {upload.received_bytes} of {upload.size_bytes} bytes")
+
+    path = partial_path(upload)
+    stored = ingest_file(path, file_sha256(path), upload.size_bytes, upload.filename)
+    upload.file_hash = stored.sha256
+    upload.status = UploadStatus.COMPLETE
+    db.session.commit()
+    return upload
+
+
+def consume_uploads(upload_ids, user_id):
+    """
+    Completed uploads for an order, in the given order. They are marked
+    consumed (caller commits) so one upload backs at most one order.
+    """
+    uploads = []
+    for upload_id in upload_ids:
+        upload = db.session.get(Upload, upload_id)
+        if upload is None or upload.customer_user_id != user_id:
+            raise ValueError("Unknown upload")
+        if upload.status != UploadStatus.COMPLETE:
+            raise ValueError(f"{upload.filename} has not finished uploading")
+        upload.status = UploadStatus.CONSUMED
+        uploads.append(upload)
+    return uploads
+
+
+def upload_state(upload):
+    return {
+        'id': upload.id,
+        'filename': upload.filename,
+        'size': upload.size_bytes,
+        'offset': upload.received_bytes,
+        'status': upload.status,
+        # For /customer/quote once complete
+        'file_hash': upload.file_hash,
+    }
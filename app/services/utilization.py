@@ -0,0 +1,250 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import case, select, type_coerce
+
+from app.extensions import db
+from app.models import (Printer, PrinterStatus, PrinterStatusChange, PrinterDayStat,
+                        PRINTER_DAY_COLUMNS, split_by_day)
+
+# What each printer status counts as; ERROR time is out of service like MAINTENANCE
+CATEGORIES = ('busy', 'idle', 'maintenance')
+STATUS_CATEGORY = {
+    PrinterStatus.PRINTING: 0,
+    PrinterStatus.IDLE: 1,
+    PrinterStatus.MAINTENANCE: 2,
+    PrinterStatus.ERROR: 2,
+}
+UNKNOWN = -1  # before a printer's first recorded status
+BUCKETS = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+# Hour buckets have no rollup and read the change log itself: ~470ms for
+# 90 days of a 100 printer farm, ~40ms for 14. Longer windows use days.
+MAX_HOUR_WINDOW = timedelta(days=14)
+
+
+def bucket_edges(start, end, bucket):
+    """Window edges in seconds from `start`: calendar hours or days, clipped to the window."""
+    step = BUCKETS[bucket]
+    first = start.replace(minute=0, second=0, microsecond=0)
+    if bucket == 'day':
+        first = first.replace(hour=0)
+    span = (end - start).total_seconds()
+    inner = np.arange(1, int((end - first) / step) + 2) * step.total_seconds() + (first - start).total_seconds()
+    return np.concatenate(([0.0], inner[(inner > 0) & (inner < span)], [span]))
+
+
+def interval_seconds(printer_index, times, codes, n_printers, edges):
+    """
+    Seconds each printer spent in each category within each bucket, as a
+    (printers, buckets, categories) array.
+
+    Rows are status changes: printer_index, time in seconds from the window
+    start (a change before the window may be negative) and category code,
+    sorted by printer then time. Each printer's timeline is laid end to end
+    on one axis, so a single cumulative sum and a single searchsorted over
+    all changes answer every bucket edge of every printer: the time in a
+    category up to t is the prefix sum before t's interval plus the part
+    of that interval before t. Cost is O((changes + buckets) log changes).
+    """
+    span = edges[-1]
+    printer_index = np.asarray(printer_index, dtype=np.int64)
+    # Every printer starts the window unknown, so each timeline has a first row
+    first = np.searchsorted(printer_index, np.arange(n_printers))
+    printer_index = np.insert(printer_index, first, np.arange(n_printers))
+    times = np.insert(np.clip(np.asarray(times, dtype=float), 0.0, span), first, 0.0)
+    codes = np.insert(np.asarray(codes, dtype=np.int64), first, UNKNOWN)
+
+    starts = times + printer_index * span
+    ends = np.append(starts[1:], n_printers * span)
+    durations = ends - starts
+
+    known = codes != UNKNOWN
+    onehot = np.zeros((len(codes), len(CATEGORIES)))
+    onehot[np.flatnonzero(known), codes[known]] = 1.0
+    cumulative = np.vstack((np.zeros(len(CATEGORIES)), np.cumsum(durations[:, None] * onehot, axis=0)))
+
+    points = (edges[None, :] + (np.arange(n_printers) * span)[:, None]).ravel()
+    row = np.searchsorted(starts, points, side='right') - 1
+    at_points = cumulative[row] + (points - starts[row])[:, None] * onehot[row]
+    return np.diff(at_points.reshape(n_printers, len(edges), len(CATEGORIES)), axis=1)
+
+
+def latest_changes(printer_ids, before=None):
+    """
+    Each printer's most recent change (before `before`, if given) as
+    (printer_id, status, changed_at) rows, by one index seek per printer.
+    """
+    table = PrinterStatusChange.__table__
+    latest_id = select(table.c.id).where(table.c.printer_id == Printer.id)
+    if before is not None:
+        latest_id = latest_id.where(table.c.changed_at < before)
+    latest_id = latest_id.order_by(table.c.changed_at.desc()).limit(1).correlate(Printer).scalar_subquery()
+    ids = select(latest_id).where(Printer.id.in_(printer_ids))
+    return db.session.execute(select(table.c.printer_id, table.c.status, table.c.changed_at)
+                              .where(table.c.id.in_(ids))).all()
+
+
+def load_changes(printer_ids, start, end):
+    """
+    (printer_index, seconds from start, category) arrays for the status
+    changes inside [start, end), plus each printer's last change before it.
+    Plain Core rows, with the category mapped in SQL and timestamps parsed
+    by NumPy, since the row count grows with the window.
+    """
+    table = PrinterStatusChange.__table__
+    category = case(STATUS_CATEGORY, value=table.c.status, else_=UNKNOWN)
+    # Raw text on SQLite, which NumPy parses far faster than the DateTime type would
+    changed_at = type_coerce(table.c.changed_at, db.String)
+    inside = (select(table.c.printer_id, category, changed_at)
+              .where(table.c.changed_at >= start, table.c.changed_at < end, table.c.printer_id.in_(printer_ids))
+              .order_by(table.c.printer_id, table.c.changed_at))
+
+    # Each printer's change before the window, then its changes in time order
+    before = [(pid, STATUS_CATEGORY.get(status, UNKNOWN), changed_at.isoformat(sep=' '))
+              for pid, status, changed_at in latest_changes(printer_ids, before=start)]
+    rows = before + db.session.execute(inside).all()
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0, dtype=np.int64)
+    ids, codes, stamps = zip(*rows)
+    sorted_ids = np.sort(np.asarray(printer_ids))
+    positions = np.searchsorted(sorted_ids, ids)
+    # Position in the caller's order, not sorted id order
+    printer_index = np.argsort(np.asarray(printer_ids), kind='stable')[positions]
+    order = np.argsort(printer_index, kind='stable')
+    times = (np.array(stamps, dtype='datetime64[us]') - np.datetime64(start, 'us')) / np.timedelta64(1, 's')
+    return printer_index[order], times[order], np.array(codes, dtype=np.int64)[order]
+
+
+def _raw_seconds(printer_ids, start, end, bucket):
+    """interval_seconds straight from the change log; for short windows."""
+    edges = bucket_edges(start, end, bucket)
+    return interval_seconds(*load_changes(printer_ids, start, end), len(printer_ids), edges)
+
+
+def _day_seconds(printer_ids, first_day, days):
+    """
+    (printers, days, categories) seconds for whole days from PrinterDayStat,
+    plus each printer's still open interval, which no row holds yet.
+    """
+    index = {pid: i for i, pid in enumerate(printer_ids)}
+    seconds = np.zeros((len(printer_ids), days, len(CATEGORIES)))
+    table = PrinterDayStat.__table__
+    rows = db.session.execute(
+        select(table.c.printer_id, type_coerce(table.c.day, db.String),
+               *[table.c[PRINTER_DAY_COLUMNS[status]] for status in STATUS_CATEGORY])
+        .where(table.c.day >= first_day, table.c.day < first_day + timedelta(days=days),
+               table.c.printer_id.in_(printer_ids))).all()
+    if rows:
+        ids, day_text, *by_status = zip(*rows)
+        day_index = (np.array(day_text, dtype='datetime64[D]') - np.datetime64(first_day, 'D')).astype(np.int64)
+        printer_index = [index[i] for i in ids]
+        for code, values in zip(STATUS_CATEGORY.values(), by_status):
+            np.add.at(seconds, (printer_index, day_index, code), np.array(values))
+
+    open_rows = sorted(latest_changes(printer_ids), key=lambda r: index[r[0]])
+    window_start = datetime.combine(first_day, datetime.min.time())
+    # Open until now, and no later than the window
+    window_end = min(window_start + timedelta(days=days), datetime.utcnow())
+    if open_rows and window_end > window_start:
+        edges = np.minimum(np.arange(days + 1) * 86400.0, (window_end - window_start).total_seconds())
+        seconds += interval_seconds([index[r[0]] for r in open_rows],
+                                    [(r[2] - window_start).total_seconds() for r in open_rows],
+                                    [STATUS_CATEGORY.get(r[1], UNKNOWN) for r in open_rows],
+                                    len(printer_ids), edges)
+    return seconds
+
+
+def utilization_seconds(printer_ids, start, end, bucket):
+    """
+    Seconds per (printer, bucket, category) over [start, end). Whole days
+    of a day-bucketed window come from the daily rollup; only the partial
+    days at either end, and hour buckets, read the change log itself.
+    """
+    if bucket != 'day':
+        return _raw_seconds(printer_ids, start, end, bucket)
+    midnight = datetime.combine(start.date(), datetime.min.time())
+    full_start = midnight if midnight == start else midnight + timedelta(days=1)
+    full_end = datetime.combine(end.date(), datetime.min.time())
+    if full_end <= full_start:
+        return _raw_seconds(printer_ids, start, end, bucket)
+    parts = []
+    if start < full_start:
+        parts.append(_raw_seconds(printer_ids, start, full_start, bucket))
+    parts.append(_day_seconds(printer_ids, full_start.date(), (full_end - full_start).days))
+    if full_end < end:
+        parts.append(_raw_seconds(printer_ids, full_end, end, bucket))
+    return np.concatenate(parts, axis=1)
+
+
+def printer_utilization(start, end=None, bucket='day', printer_ids=None):
+    """
+    Busy / idle / maintenance percentages per printer and bucket over the
+    window [start, end), each a share of the bucket's length. Time before a
+    printer's first recorded status counts as none of them. Returns
+    {'buckets': [iso start, ...], 'printers': {id: {category: [percent, ...]}},
+     'totals': {id: {category: percent}}}.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"Unknown bucket: {bucket}")
+    end = end or datetime.utcnow()
+    if end <= start:
+        raise ValueError("The window must end after it starts")
+    if bucket == 'hour' and end - start > MAX_HOUR_WINDOW:
+        raise ValueError(f"Hour buckets cover at most {MAX_HOUR_WINDOW.days} days; use day buckets")
+    if printer_ids is None:
+        printer_ids = [pid for (pid,) in db.session.query(Printer.id).order_by(Printer.id)]
+    edges = bucket_edges(start, end, bucket)
+    result = {'buckets': [(start + timedelta(seconds=float(e))).isoformat() for e in edges[:-1]],
+              'printers': {}, 'totals': {}}
+    if not printer_ids:
+        return result
+
+    seconds = utilization_seconds(printer_ids, start, end, bucket)
+    percent = np.round(100.0 * seconds / np.diff(edges)[None, :, None], 2)
+    totals = np.round(100.0 * seconds.sum(axis=1) / edges[-1], 2)
+    for i, pid in enumerate(printer_ids):
+        result['printers'][pid] = {c: percent[i, :, k].tolist() for k, c in enumerate(CATEGORIES)}
+        result['totals'][pid] = {c: float(totals[i, k]) for k, c in enumerate(CATEGORIES)}
+    return result
+
+
+def rebuild_printer_days(batch_size=1000):
+    """
+    Recomputes PrinterDayStat from the change log in one ordered pass, for
+    the initial backfill or after editing history. Returns the rows written.
+    """
+    totals = defaultdict(lambda: defaultdict(float))
+    previous = None
+    rows = (db.session.query(PrinterStatusChange.printer_id, PrinterStatusChange.status,
+                             PrinterStatusChange.changed_at)
+            .order_by(PrinterStatusChange.printer_id, PrinterStatusChange.changed_at).yield_per(batch_size))
+    for row in rows:
+        if previous is not None and previous[0] == row[0] and previous[1] in PRINTER_DAY_COLUMNS:
+            for day, seconds in split_by_day(previous[2], row[2]):
+                totals[(row[0], day)][PRINTER_DAY_COLUMNS[previous[1]]] += seconds
+        previous = row
+
+    PrinterDayStat.query.delete()
+    if totals:
+        db.session.execute(PrinterDayStat.__table__.insert(), [
+            dict({column: 0.0 for column in PRINTER_DAY_COLUMNS.values()},
+                 printer_id=printer_id, day=day, **by_column)
+            for (printer_id, day), by_column in totals.items()])
+    db.session.commit()
+    return len(totals)
+
+
+def seed_status_history(now=None):
+    """
+    Gives every printer without any status history a row for its current
+    status, so utilization is known from now on. Returns how many were added.
+    """
+    recorded = db.session.query(PrinterStatusChange.printer_id).distinct()
+    missing = Printer.query.filter(~Printer.id.in_(recorded)).all()
+    now = now or datetime.utcnow()
+    for printer in missing:
+        db.session.add(PrinterStatusChange(printer_id=printer.id, status=printer.status or PrinterStatus.IDLE,
+                                           changed_at=now))
+    db.session.commit()
+    return len(missing)
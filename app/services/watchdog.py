@@ -0,0 +1,155 @@
+import math
+import time
+
+from app.extensions import db
+from app.models import Printer, PrintJob, PrinterStatus, JobStatus, PlateStatus
+from app.services.audit import log_action
+from app.services.events import emit
+from app.services.workflow import fail_job, retry_job
+
+# A printer not heard from for this long is presumed dead: it is flagged
+# ERROR and its jobs go back to the waiting queue (fail_over). Heartbeats are
+# successful firmware polls and telemetry samples.
+HEARTBEAT_TIMEOUT_SECONDS = 60.0
+WHEEL_RESOLUTION_SECONDS = 1.0
+
+
+class TimerWheel:
+    """
+    Hashed timing wheel: `slots` buckets of `resolution` seconds each. A
+    timer sits in the bucket of its deadline, so advancing the clock visits
+    only the buckets whose time has come and a tick costs O(expired), not
+    O(timers). Timers more than a full turn ahead share a bucket with
+    nearer ones and are passed over until their turn; size the wheel to
+    span the usual timeout to avoid that.
+    """
+    def __init__(self, resolution=WHEEL_RESOLUTION_SECONDS, slots=128, now=0.0):
+        self.resolution = resolution
+        self.buckets = [{} for _ in range(slots)]
+        self.where = {}  # key -> bucket index
+        self.next_tick = int(now // resolution)
+
+    def __len__(self):
+        return len(self.where)
+
+    def __contains__(self, key):
+        return key in self.where
+
+    def schedule(self, key, deadline):
+        """Sets `key` to fire at `deadline`, replacing any timer it had."""
+        self.cancel(key)
+        tick = max(int(math.ceil(deadline / self.resolution)), self.next_tick)
+        index = tick % len(self.buckets)
+        self.buckets[index][key] = deadline
+        self.where[key] = index
+
+    def cancel(self, key):
+        index = self.where.pop(key, None)
+        if index is not None:
+            del self.buckets[index][key]
+
+    def advance(self, now):
+        """Removes and returns the keys whose deadline is at or before `now`."""
+        last = int(now // self.resolution)
+        expired = []
+        # Past a full turn every bucket has been visited once already
+        for tick in range(max(self.next_tick, last - len(self.buckets) + 1), last + 1):
+            bucket = self.buckets[tick % len(self.buckets)]
+            if not bucket:
+                continue
+            due = [key for key, deadline in bucket.items() if deadline <= now]
+            for key in due:
+                del bucket[key]
+                del self.where[key]
+            expired += due
+        self.next_tick = max(self.next_tick, last + 1)
+        return expired
+
+
+class Watchdog:
+    """
+    Last-seen times of the printers being watched, each with a timer on the
+    wheel at last_seen + timeout. `beat` re-arms a printer's timer in O(1);
+    `stale` returns the printers whose timer ran out. Heartbeats recorded
+    by another process are found through `last_seen`, a function of a
+    printer id, which is only consulted for printers whose timer expired.
+    """
+    def __init__(self, timeout=HEARTBEAT_TIMEOUT_SECONDS, clock=time.time, last_seen=None):
+        self.timeout = timeout
+        self.clock = clock
+        self.last_seen_elsewhere = last_seen
+        self.seen = {}
+        slots = max(64, int(math.ceil(2 * timeout / WHEEL_RESOLUTION_SECONDS)))
+        self.wheel = TimerWheel(WHEEL_RESOLUTION_SECONDS, slots, now=clock())
+
+    def beat(self, printer_id, at=None):
+        at = self.clock() if at is None else at
+        if at < self.seen.get(printer_id, -math.inf):
+            return
+        self.seen[printer_id] = at
+        self.wheel.schedule(printer_id, at + self.timeout)
+
+    def watch(self, printer_ids):
+        """Starts watching printers not heard from yet; each gets one timeout of grace."""
+        now = self.clock()
+        for printer_id in printer_ids:
+            if printer_id not in self.wheel:
+                self.wheel.schedule(printer_id, now + self.timeout)
+
+    def forget(self, printer_ids):
+        for printer_id in printer_ids:
+            self.wheel.cancel(printer_id)
+            self.seen.pop(printer_id, None)
+
+    def stale(self, now=None):
+        """
+        Printers whose heartbeat is overdue. They stop being watched until
+        they beat again, so each outage is reported once.
+        """
+        now = self.clock() if now is None else now
+        overdue = []
+        for printer_id in self.wheel.advance(now):
+            elsewhere = self.last_seen_elsewhere(printer_id) if self.last_seen_elsewhere else None
+            if elsewhere is not None and elsewhere + self.timeout > now:
+                self.beat(printer_id, elsewhere)
+            else:
+                overdue.append(printer_id)
+        return overdue
+
+
+def fail_over(printer_ids, user_id=None):
+    """
+    Flags printers that stopped answering as ERROR and hands their jobs
+    back: a started job is failed and retried like an operator would
+    (fail_job, retry_job), a reserved one is returned to WAITING, and a
+    plate being printed is marked failed. One transaction for all of them.
+    Printers in MAINTENANCE are left alone. Returns {printer_id: [job ids]}.
+    """
+    if not printer_ids:
+        return {}
+    printers = Printer.query.filter(Printer.id.in_(printer_ids),
+                                    Printer.status != PrinterStatus.MAINTENANCE).all()
+    jobs = {}
+    for job in PrintJob.query.filter(PrintJob.assigned_printer_id.in_([p.id for p in printers]),
+                                     PrintJob.status.in_([JobStatus.PRINTING, JobStatus.QUEUED]))\
+            .order_by(PrintJob.id):
+        jobs.setdefault(job.assigned_printer_id, []).append(job)
+
+    requeued = {}
+    for printer in printers:
+        printer_jobs = jobs.get(printer.id, [])
+        if printer.status == PrinterStatus.ERROR and not printer_jobs:
+            continue
+        for job in printer_jobs:
+            if job.plate is not None and job.plate.status in (PlateStatus.QUEUED, PlateStatus.PRINTING):
+                job.plate.status = PlateStatus.FAILED
+            if job.status == JobStatus.PRINTING:
+                fail_job(job, user_id, commit=False)
+            retry_job(job, user_id, commit=False)
+        printer.status = PrinterStatus.ERROR
+        printer.current_job_id = None
+        requeued[printer.id] = [job.id for job in printer_jobs]
+        log_action(user_id, "heartbeat_lost", "Printer", printer.id, after={'requeued_jobs': requeued[printer.id]})
+        emit('printer', id=printer.id, status=printer.status, current_job_id=None)
+    db.session.commit()
+    return requeued
@@ -1,8 +1,10 @@
 from datetime import datetime
 from app.extensions import db
-from app.models import Order, PrintJob, Printer, Shipment, OrderStatus, JobStatus, PrinterStatus, ShipmentStatus
+from app.models import Order, PrintJob, Printer, Shipment, OrderStatus, JobStatus, PrinterStatus, PlateStatus, ShipmentStatus
 from app.services.audit import log_action
 from app.services.inventory import consume_filament
+from app.services.calibration import record_actuals
+from app.services.events import emit
 
 def transition_order_status(order, new_status, user_id, commit=True):
     if order.status == new_status:
@@ -23,7 +25,14 @@ def transition_order_status(order, new_status, user_id, commit=True):
     if commit:
         db.session.commit()
 
-def assign_job(job, printer_id, user_id):
+def _emit_job(job, printer=None):
+    """Live events for operator pages; published on commit (services/events.py)."""
+    emit('job', id=job.id, status=job.status, printer_id=job.assigned_printer_id, order_id=job.order_id)
+    printer = printer or job.printer
+    if printer is not None:
+        emit('printer', id=printer.id, status=printer.status, current_job_id=printer.current_job_id)
+
+def assign_job(job, printer_id, user_id, commit=True):
     # Lock printer to prevent double assignment
     printer = Printer.query.filter_by(id=printer_id).with_for_update().first()
     
@@ -35,6 +44,9 @@ def assign_job(job, printer_id, user_id):
     
     if printer.current_job_id is not None:
         raise ValueError("Printer already has a job")
+
+    if job.plate_id is not None:
+        raise ValueError(f"Job is nested on plate #{job.plate_id}; assign the plate instead")
         
     job.assigned_printer_id = printer_id
     printer.current_job_id = job.id # Link back
@@ -47,25 +59,121 @@ def assign_job(job, printer_id, user_id):
     # The check `if printer.current_job_id is not None` handles this.
     
     # Log assignment?
-    db.session.commit()
+    _emit_job(job, printer)
+    if commit:
+        db.session.commit()
+
+def split_job(job, parts, user_id, commit=True):
+    """
+    Splits a WAITING job's quantity into `parts` runs that can print in
+    parallel. The original job keeps the first share; the other shares
+    become new WAITING jobs pointing back at it via parent_job_id.
+    Returns all runs, original first.
+    """
+    if job.status != JobStatus.WAITING or job.assigned_printer_id is not None:
+        raise ValueError("Only waiting, unassigned jobs can be split")
+
+    parts = min(int(parts), job.quantity or 1)
+    if parts < 2:
+        return [job]
+
+    base, extra = divmod(job.quantity, parts)
+    shares = [base + (1 if i < extra else 0) for i in range(parts)]
+    root_id = job.parent_job_id or job.id
+
+    job.quantity = shares[0]
+    runs = [job]
+    for share in shares[1:]:
+        run = PrintJob(
+            order_id=job.order_id,
+            stl_path=job.stl_path,
+            file_hash=job.file_hash,
+            original_filename=job.original_filename,
+            material_type=job.material_type,
+            color=job.color,
+            quantity=share,
+            estimated_time_minutes=job.estimated_time_minutes,
+            estimated_material_grams=job.estimated_material_grams,
+            model_time_minutes=job.model_time_minutes,
+            model_material_grams=job.model_material_grams,
+            status=JobStatus.WAITING,
+            parent_job_id=root_id,
+        )
+        db.session.add(run)
+        runs.append(run)
+    db.session.flush()
+
+    log_action(user_id, "split_job", "PrintJob", job.id,
+               after={'runs': [{'id': r.id, 'quantity': r.quantity} for r in runs]})
+    if commit:
+        db.session.commit()
+    return runs
 
-def start_job(job, user_id):
+def find_idle_printers(job=None):
+    """
+    Printers that can take a job right now. When a job is given, printers
+    already loaded with its material/color come first.
+    """
+    printers = Printer.query.filter(
+        Printer.status == PrinterStatus.IDLE,
+        Printer.current_job_id.is_(None)
+    ).order_by(Printer.id.asc()).all()
+    if job is not None:
+        printers.sort(key=lambda p: (p.loaded_material, p.loaded_color) != (job.material_type, job.color))
+    return printers
+
+def assign_job_parallel(job, user_id):
+    """
+    Splits a job over every compatible idle printer (at most one unit per
+    printer) and assigns each run, all in one transaction.
+    Returns a list of (run, printer) tuples.
+    """
+    printers = find_idle_printers(job)
+    if not printers:
+        raise ValueError("No idle printers available")
+
+    try:
+        runs = split_job(job, min(len(printers), job.quantity or 1), user_id, commit=False)
+        for run, printer in zip(runs, printers):
+            assign_job(run, printer.id, user_id, commit=False)
+            run.status = JobStatus.QUEUED
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return list(zip(runs, printers))
+
+def start_job(job, user_id, commit=True):
     if not job.printer:
         raise ValueError("Job not assigned to printer")
         
     job.status = JobStatus.PRINTING
+    job.started_at = datetime.utcnow()
+    job.finished_at = None
     job.printer.status = PrinterStatus.PRINTING
     job.printer.current_job_id = job.id
+    job.printer.loaded_material = job.material_type
+    job.printer.loaded_color = job.color
     
     # Also update order status if needed
     if job.order.status in [OrderStatus.NEW, OrderStatus.QUEUED, OrderStatus.REVIEW]:
         transition_order_status(job.order, OrderStatus.PRINTING, user_id, commit=False)
         
     log_action(user_id, "start_job", "PrintJob", job.id)
-    db.session.commit()
+    _emit_job(job)
+    if commit:
+        db.session.commit()
 
-def finish_job(job, user_id):
+def finish_job(job, user_id, commit=True, actual_grams=None):
+    """
+    Marks a job printed. `actual_grams` is what the whole run really used,
+    if the operator weighed it; it is deducted from stock instead of the
+    estimate and, with the print time, feeds services/calibration.
+    """
     job.status = JobStatus.DONE
+    job.finished_at = datetime.utcnow()
+    if actual_grams is not None:
+        job.actual_material_grams = actual_grams
     
     if job.printer:
         job.printer.status = PrinterStatus.IDLE
@@ -85,11 +193,14 @@ def finish_job(job, user_id):
     ).first()
     
     if filament:
-        consume_filament(filament.id, job.estimated_material_grams)
+        # Estimates are per unit
+        used = job.actual_material_grams or job.estimated_material_grams * (job.quantity or 1)
+        consume_filament(filament.id, used)
     else:
         # Log warning that stock couldn't be deducted?
         pass
 
+    record_actuals(job)
     log_action(user_id, "finish_job", "PrintJob", job.id)
     
     # Check if all jobs in order are done
@@ -99,9 +210,11 @@ def finish_job(job, user_id):
     if all_done:
         transition_order_status(job.order, OrderStatus.DONE, user_id, commit=False)
         
-    db.session.commit()
+    _emit_job(job)
+    if commit:
+        db.session.commit()
 
-def fail_job(job, user_id):
+def fail_job(job, user_id, commit=True):
     job.status = JobStatus.FAILED
     if job.printer:
         job.printer.status = PrinterStatus.MAINTENANCE
@@ -110,16 +223,86 @@ def fail_job(job, user_id):
                                           # So we should probably detach.
     
     log_action(user_id, "fail_job", "PrintJob", job.id)
-    db.session.commit()
+    _emit_job(job)
+    if commit:
+        db.session.commit()
 
-def retry_job(job, user_id):
+def retry_job(job, user_id, commit=True):
     """
     Resets a failed/cancelled job to WAITING status so it can be reassigned.
     """
     job.status = JobStatus.WAITING
     job.assigned_printer_id = None # Clear assignment to allow reassignment
+    job.plate_id = None # A failed plate's jobs come back as individual jobs
+    job.started_at = job.finished_at = None
     
     log_action(user_id, "retry_job", "PrintJob", job.id)
+    _emit_job(job)
+    if commit:
+        db.session.commit()
+
+def assign_plate(plate, printer_id, user_id):
+    """
+    Reserves a printer for a whole plate, like assign_job does for one job.
+    Every member job is bound to the printer and queued.
+    """
+    printer = Printer.query.filter_by(id=printer_id).with_for_update().first()
+
+    if not printer:
+        raise ValueError("Printer not found")
+
+    if printer.status != PrinterStatus.IDLE or printer.current_job_id is not None:
+        raise ValueError("Printer is not IDLE")
+
+    if plate.status != PlateStatus.PLANNED:
+        raise ValueError("Plate is already assigned")
+
+    if (printer.bed_width_mm or 0) < plate.bed_width_mm or (printer.bed_depth_mm or 0) < plate.bed_depth_mm:
+        raise ValueError("Plate does not fit this printer's bed")
+
+    for job in plate.jobs:
+        job.assigned_printer_id = printer.id
+        job.status = JobStatus.QUEUED
+    plate.assigned_printer_id = printer.id
+    plate.status = PlateStatus.QUEUED
+    printer.current_job_id = plate.jobs[0].id
+    printer.status = PrinterStatus.PRINTING
+
+    log_action(user_id, "assign_plate", "Plate", plate.id, after={'printer_id': printer.id})
+    db.session.commit()
+
+def start_plate(plate, user_id):
+    if plate.status != PlateStatus.QUEUED:
+        raise ValueError("Plate is not queued on a printer")
+    for job in plate.jobs:
+        start_job(job, user_id, commit=False)
+    plate.status = PlateStatus.PRINTING
+    db.session.commit()
+
+def finish_plate(plate, user_id):
+    if plate.status != PlateStatus.PRINTING:
+        raise ValueError("Plate is not printing")
+    for job in plate.jobs:
+        finish_job(job, user_id, commit=False)
+    plate.status = PlateStatus.DONE
+    db.session.commit()
+
+def fail_plate(plate, user_id):
+    if plate.status not in (PlateStatus.QUEUED, PlateStatus.PRINTING):
+        raise ValueError("Plate is not queued or printing")
+    for job in plate.jobs:
+        fail_job(job, user_id, commit=False)
+    plate.status = PlateStatus.FAILED
+    db.session.commit()
+
+def dissolve_plate(plate, user_id):
+    """Releases the jobs of a plate that has not been assigned yet."""
+    if plate.status != PlateStatus.PLANNED:
+        raise ValueError("Only planned plates can be dissolved")
+    for job in list(plate.jobs):
+        job.plate_id = None
+    log_action(user_id, "dissolve_plate", "Plate", plate.id)
+    db.session.delete(plate)
     db.session.commit()
 
 def create_shipment(order_id, carrier, tracking, user_id):
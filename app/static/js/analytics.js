@@ -27,8 +27,8 @@ document.addEventListener('DOMContentLoaded', function () {
 
         charts.printer = new Chart(ctxPrinter, {
             type: 'bar',
-            data: { labels: [], datasets: [{ label: 'Jobs Assigned', data: [], backgroundColor: '#6f42c1' }] },
-            options: { indexAxis: 'y', responsive: true, maintainAspectRatio: false }
+            data: { labels: [], datasets: [{ label: 'Busy %', data: [], backgroundColor: '#6f42c1' }] },
+            options: { indexAxis: 'y', responsive: true, maintainAspectRatio: false, scales: { x: { min: 0, max: 100 } } }
         });
     }
 
@@ -50,7 +50,7 @@ document.addEventListener('DOMContentLoaded', function () {
 
         // Printer
         charts.printer.data.labels = data.printer_utilization.map(d => d.printer);
-        charts.printer.data.datasets[0].data = data.printer_utilization.map(d => d.jobs);
+        charts.printer.data.datasets[0].data = data.printer_utilization.map(d => d.busy);
         charts.printer.update();
     }
 
@@ -8,3 +8,179 @@ document.addEventListener('DOMContentLoaded', function () {
     })
     toastList.forEach(function(toast){ toast.show() });
 });
+
+// Pages waiting on background work (e.g. upload analysis) poll until it is done, then reload
+document.addEventListener('DOMContentLoaded', function () {
+    var el = document.querySelector('[data-poll-url]');
+    if (!el) return;
+    var url = el.getAttribute('data-poll-url');
+    var poll = function () {
+        fetch(url, { credentials: 'same-origin' })
+            .then(function (r) { return r.json(); })
+            .then(function (data) {
+                if (data.pending === 0) { window.location.reload(); }
+                else { setTimeout(poll, 2000); }
+            })
+            .catch(function () { setTimeout(poll, 5000); });
+    };
+    setTimeout(poll, 1000);
+});
+
+// Operator pages: regions marked data-live-region="<name>" listen to the
+// data-live-events stream (SSE) and, after a burst of job/printer changes,
+// swap in the same region from a fresh copy of the page instead of reloading.
+// A region holding the focused input waits until the operator leaves it.
+document.addEventListener('DOMContentLoaded', function () {
+    var regions = [].slice.call(document.querySelectorAll('[data-live-region]'));
+    if (!regions.length || !window.EventSource) return;
+    var timer = null;
+    var stale = false;
+
+    var refresh = function () {
+        timer = null;
+        fetch(window.location.href, { credentials: 'same-origin' })
+            .then(function (r) { return r.text(); })
+            .then(function (html) {
+                var fresh = new DOMParser().parseFromString(html, 'text/html');
+                stale = false;
+                regions.forEach(function (region) {
+                    var replacement = fresh.querySelector('[data-live-region="' + region.getAttribute('data-live-region') + '"]');
+                    if (!replacement) return;
+                    if (region.contains(document.activeElement) && document.activeElement !== document.body) {
+                        stale = true;
+                        return;
+                    }
+                    region.innerHTML = replacement.innerHTML;
+                });
+            });
+    };
+    var schedule = function () {
+        if (!timer) { timer = setTimeout(refresh, 500); }
+    };
+
+    var source = new EventSource(regions[0].getAttribute('data-live-events'));
+    source.addEventListener('job', schedule);
+    source.addEventListener('printer', schedule);
+    document.addEventListener('focusout', function () {
+        if (stale) { setTimeout(schedule, 0); }
+    });
+});
+
+// Resumable chunked uploads for forms marked data-chunked-upload="<create url>".
+// Each file is sent in CHUNK_BYTES pieces with a SHA-256 per chunk; after a
+// dropped connection the server's offset says where to carry on. The form
+// is then submitted with the completed upload ids instead of the files.
+(function () {
+    var CHUNK_BYTES = 4 * 1024 * 1024;
+    var MAX_RETRIES = 5;
+
+    function hex(buffer) {
+        return Array.prototype.map.call(new Uint8Array(buffer), function (b) {
+            return ('0' + b.toString(16)).slice(-2);
+        }).join('');
+    }
+
+    function checksum(blob) {
+        // crypto.subtle only exists on https/localhost; the header is optional
+        if (!(window.crypto && window.crypto.subtle && blob.arrayBuffer)) { return Promise.resolve(null); }
+        return blob.arrayBuffer()
+            .then(function (buf) { return window.crypto.subtle.digest('SHA-256', buf); })
+            .then(hex);
+    }
+
+    function send(method, url, token, body, headers) {
+        var h = headers || {};
+        if (token) { h['X-CSRFToken'] = token; }
+        return fetch(url, { method: method, credentials: 'same-origin', headers: h, body: body })
+            .then(function (r) {
+                return r.json().then(function (data) {
+                    // 409 carries the offset to resume from, so it is not an error
+                    if (!r.ok && r.status !== 409) { throw new Error(data.error || r.statusText); }
+                    return data;
+                });
+            });
+    }
+
+    function uploadFile(file, createUrl, token, onProgress) {
+        var key = 'upload:' + file.name + ':' + file.size + ':' + file.lastModified;
+        var previous = window.sessionStorage.getItem(key);
+        var start = previous
+            ? send('GET', createUrl + '/' + previous, token).catch(function () { return null; })
+            : Promise.resolve(null);
+
+        return start.then(function (state) {
+            if (state && state.status === 'receiving') { return state; }
+            return send('POST', createUrl, token, JSON.stringify({ filename: file.name, size: file.size }),
+                        { 'Content-Type': 'application/json' });
+        }).then(function (state) {
+            window.sessionStorage.setItem(key, state.id);
+            var url = createUrl + '/' + state.id;
+            var failures = 0;
+
+            function next(offset) {
+                onProgress(offset);
+                if (offset >= file.size) { return send('POST', url + '/complete', token); }
+                var chunk = file.slice(offset, offset + CHUNK_BYTES);
+                return checksum(chunk).then(function (sum) {
+                    var headers = { 'Content-Type': 'application/octet-stream' };
+                    if (sum) { headers['X-Chunk-SHA256'] = sum; }
+                    return send('PUT', url + '?offset=' + offset, token, chunk, headers);
+                }).then(function (res) {
+                    failures = 0;
+                    return next(res.offset);
+                }, function (err) {
+                    if (++failures > MAX_RETRIES) { throw err; }
+                    return new Promise(function (resolve) { setTimeout(resolve, 1000 * failures); })
+                        .then(function () { return send('GET', url, token); })
+                        .then(function (s) { return next(s.offset); }, function () { return next(offset); });
+                });
+            }
+            return next(state.offset || 0);
+        }).then(function (done) {
+            window.sessionStorage.removeItem(key);
+            return done.id;
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        var form = document.querySelector('form[data-chunked-upload]');
+        if (!form || !window.fetch || !window.Promise || !window.sessionStorage) { return; }
+        var createUrl = form.getAttribute('data-chunked-upload');
+        var input = form.querySelector('input[type=file]');
+        var idsField = form.querySelector('input[name=upload_ids]');
+        var tokenField = form.querySelector('input[name=csrf_token]');
+        var progress = form.querySelector('[data-upload-progress]');
+        var bar = progress.querySelector('.progress-bar');
+        var errorBox = form.querySelector('[data-upload-error]');
+
+        form.addEventListener('submit', function (e) {
+            if (!input.files.length || idsField.value) { return; }
+            e.preventDefault();
+
+            var files = Array.prototype.slice.call(input.files);
+            var total = files.reduce(function (n, f) { return n + f.size; }, 0) || 1;
+            var sent = 0;
+            var ids = [];
+            var buttons = form.querySelectorAll('[type=submit]');
+            Array.prototype.forEach.call(buttons, function (b) { b.disabled = true; });
+            progress.classList.remove('d-none');
+            errorBox.classList.add('d-none');
+
+            files.reduce(function (chain, file) {
+                return chain.then(function () {
+                    return uploadFile(file, createUrl, tokenField && tokenField.value, function (offset) {
+                        bar.style.width = Math.round(100 * (sent + offset) / total) + '%';
+                    }).then(function (id) { ids.push(id); sent += file.size; });
+                });
+            }, Promise.resolve()).then(function () {
+                idsField.value = ids.join(',');
+                input.disabled = true;  // files are on the server already
+                form.submit();
+            }).catch(function (err) {
+                errorBox.textContent = 'Upload failed: ' + err.message + '. Submit again to resume.';
+                errorBox.classList.remove('d-none');
+                Array.prototype.forEach.call(buttons, function (b) { b.disabled = false; });
+            });
+        });
+    });
+})();
@@ -0,0 +1,55 @@
+document.addEventListener('DOMContentLoaded', function () {
+    const canvas = document.getElementById('telemetryChart');
+    const hoursFilter = document.getElementById('telemetryHours');
+
+    // Average lines, with the bucket's min/max as a shaded band behind them
+    function band(label, color, series) {
+        return [
+            { label: label + ' max', data: series.max, borderWidth: 0, pointRadius: 0, fill: '+1',
+              backgroundColor: color + '33', yAxisID: 'temp' },
+            { label: label + ' min', data: series.min, borderWidth: 0, pointRadius: 0, fill: false, yAxisID: 'temp' },
+            { label: label, data: series.avg, borderColor: color, borderWidth: 1.5, pointRadius: 0, yAxisID: 'temp' }
+        ];
+    }
+
+    const chart = new Chart(canvas.getContext('2d'), {
+        type: 'line',
+        data: { labels: [], datasets: [] },
+        options: {
+            responsive: true,
+            maintainAspectRatio: false,
+            animation: false,
+            spanGaps: false,
+            plugins: { legend: { labels: { filter: item => !/ (min|max)$/.test(item.text) } } },
+            scales: {
+                temp: { position: 'left', title: { display: true, text: '°C' } },
+                progress: { position: 'right', min: 0, max: 100, grid: { drawOnChartArea: false },
+                            title: { display: true, text: '%' } }
+            }
+        }
+    });
+
+    function fetchHistory() {
+        const params = new URLSearchParams({ hours: hoursFilter.value });
+        fetch(`${canvas.dataset.url}?${params}`)
+            .then(response => response.json())
+            .then(data => {
+                const longRange = data.resolution_seconds >= 3600;
+                chart.data.labels = data.ts.map(ts => {
+                    const when = new Date(ts * 1000);
+                    return longRange ? when.toLocaleString() : when.toLocaleTimeString();
+                });
+                chart.data.datasets = [
+                    ...band('Nozzle', '#dc3545', data.nozzle_c),
+                    ...band('Bed', '#0d6efd', data.bed_c),
+                    { label: 'Progress', data: data.progress.avg, borderColor: '#198754', borderWidth: 1,
+                      pointRadius: 0, yAxisID: 'progress' }
+                ];
+                chart.update();
+            })
+            .catch(error => console.error('Error fetching telemetry:', error));
+    }
+
+    hoursFilter.addEventListener('change', fetchHistory);
+    fetchHistory();
+});
@@ -0,0 +1,42 @@
+import sys
+import os
+import time
+import argparse
+
+# Add parent dir to path to find 'app'
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.services.calibration import fit, _group_cells
+
+# Estimates are recalibrated on every finished job; the fit must stay cheap
+TARGET_FIT_SECONDS = 0.05
+MATERIALS = ['PLA', 'PETG', 'ABS']
+
+def best_of(fn, runs=5):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time grouping job history into cells and fitting correction factors.")
+    parser.add_argument('--jobs', type=int, default=200000)
+    parser.add_argument('--printers', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    printers = rng.integers(1, args.printers + 1, size=args.jobs)
+    materials = rng.choice(MATERIALS, size=args.jobs)
+    values = rng.normal(0, 0.1, size=args.jobs) + printers * 0.01
+
+    group = best_of(lambda: list(_group_cells('time', printers, materials, values)))
+    cells = [(c.printer_id, c.material_type, c.count, c.sum_log)
+             for c in _group_cells('time', printers, materials, values)]
+    seconds = best_of(lambda: fit(cells))
+    print(f"{args.jobs} jobs, {len(cells)} cells: grouping {group * 1000:.1f}ms, "
+          f"fit {seconds * 1000:.2f}ms (target < {TARGET_FIT_SECONDS * 1000:.0f}ms)")
+    sys.exit(0 if seconds < TARGET_FIT_SECONDS else 1)
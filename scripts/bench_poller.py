@@ -0,0 +1,66 @@
+import sys
+import os
+import time
+import asyncio
+import argparse
+import multiprocessing
+
+# Add parent dir to path to find 'app' and the tests' fake printer server
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'tests'))
+
+from app import create_app, db
+from app.models import Printer
+from app.services.fleet_poller import FleetPoller
+from fake_printer import FakePrinterFarm
+
+def serve_farm(count, port_queue):
+    # The fake printers run in their own process so only the poller is measured
+    async def serve():
+        farm = await FakePrinterFarm().start()
+        for i in range(count):
+            farm.add(i, state='printing' if i % 2 else 'standby', nozzle_c=210.0, progress=0.5)
+        port_queue.put(farm.port)
+        await asyncio.Event().wait()
+    asyncio.run(serve())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time poll cycles against a farm of fake printers.")
+    parser.add_argument('--printers', type=int, default=200)
+    parser.add_argument('--cycles', type=int, default=20)
+    args = parser.parse_args()
+
+    ports = multiprocessing.Queue()
+    farm = multiprocessing.Process(target=serve_farm, args=(args.printers, ports), daemon=True)
+    farm.start()
+    port = ports.get(timeout=10)
+
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        db.session.add_all(Printer(name=f"P{i}", api_url=f"http://127.0.0.1:{port}/p/{i}")
+                           for i in range(args.printers))
+        db.session.commit()
+
+        cycles = []
+        def record(result, seconds):
+            cycles.append((seconds, result))
+
+        async def bench():
+            poller = FleetPoller()
+            try:
+                await poller.run(interval=0, cycles=args.cycles, on_cycle=record)
+            finally:
+                poller.close()
+
+        cpu = time.process_time()
+        asyncio.run(bench())
+        cpu = time.process_time() - cpu
+
+    walls = sorted(seconds for seconds, _ in cycles[1:])
+    print(f"{args.printers} printers, {args.cycles} cycles, failures: {sum(r['failed'] for _, r in cycles)}")
+    print(f"  cycle wall time: median {walls[len(walls) // 2] * 1000:.1f}ms, max {walls[-1] * 1000:.1f}ms")
+    print(f"  poller CPU per cycle: {cpu / args.cycles * 1000:.1f}ms "
+          f"({cpu / args.cycles / 5.0 * 100:.1f}% of one core at a 5s interval)")
+    farm.terminate()
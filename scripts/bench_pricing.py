@@ -0,0 +1,51 @@
+import sys
+import os
+import time
+import argparse
+
+# Add parent dir to path to find 'app'
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app import create_app, db
+from app.models import PricingRule, PricingRuleKind
+from app.services.pricing import price_lines, calculate_estimate, rate_table
+
+# A large order or a quote sweep is priced in one call; it must stay interactive
+TARGET_SECONDS = 0.05
+
+def best_of(fn, runs=5):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time batch pricing against per-line pricing.")
+    parser.add_argument('--lines', type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    grams = rng.uniform(1, 500, args.lines).round(1)
+    minutes = rng.integers(5, 900, args.lines)
+    quantity = rng.integers(1, 12, args.lines)
+    materials = rng.choice(['PLA', 'PETG', 'ABS'], args.lines).tolist()
+
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([
+            PricingRule(kind=PricingRuleKind.MATERIAL, material_type='ABS', rate_per_minute=0.2, base_fee=7),
+            PricingRule(kind=PricingRuleKind.QUANTITY_BREAK, min_quantity=5, percent=5)])
+        db.session.commit()
+        rate_table()  # compile once, as a warm worker would have
+
+        batch = best_of(lambda: price_lines(grams, minutes, quantity, materials))
+        single = best_of(lambda: [calculate_estimate(g, m, q, mat)
+                                  for g, m, q, mat in zip(grams, minutes, quantity, materials)], runs=1)
+    print(f"{args.lines} lines: batch {batch * 1000:.1f}ms (target < {TARGET_SECONDS * 1000:.0f}ms), "
+          f"one by one {single * 1000:.1f}ms")
+    sys.exit(0 if batch < TARGET_SECONDS else 1)
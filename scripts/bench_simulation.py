@@ -0,0 +1,43 @@
+import sys
+import os
+import time
+import argparse
+from datetime import datetime
+
+# Add parent dir to path to find 'app'
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.simulation import simulate, DEFAULT_ITERATIONS
+
+# Customer order pages run a farm-wide simulation; it must stay interactive
+TARGET_SECONDS = 1.0
+
+def best_of(fn, runs=3):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the Monte-Carlo ETA simulation over a synthetic queue.")
+    parser.add_argument('--printers', type=int, default=2)
+    parser.add_argument('--orders', type=int, default=30)
+    parser.add_argument('--jobs-per-order', type=int, default=10)
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS)
+    args = parser.parse_args()
+
+    # The shape snapshot_farm() returns, without needing a database
+    snapshot = {
+        'printer_ids': list(range(args.printers)),
+        'bound': [],
+        'waiting': [(order * args.jobs_per_order + i, order, 60.0)
+                    for order in range(args.orders) for i in range(args.jobs_per_order)],
+        'failure_rate': 0.05,
+        'taken_at': datetime.utcnow(),
+    }
+    seconds = best_of(lambda: simulate(snapshot, iterations=args.iterations, seed=1))
+    print(f"{args.printers} printers, {len(snapshot['waiting'])} waiting jobs, {args.iterations} iterations: "
+          f"{seconds * 1000:.1f}ms (target < {TARGET_SECONDS * 1000:.0f}ms)")
+    sys.exit(0 if seconds < TARGET_SECONDS else 1)
@@ -0,0 +1,87 @@
+import sys
+import os
+import json
+import time
+import argparse
+import resource
+import subprocess
+import tempfile
+
+# Add parent dir to path to find 'app'
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.services.geometry import STL_RECORD_DTYPE, STL_HEADER_BYTES, parse_stl_bytes, mesh_metrics, analyze_stl
+
+SIZES_MB = [1, 16, 64]
+# A mesh at the 64MB upload cap must analyze (mmap mode) within this
+TARGET_SECONDS_AT_CAP = 1.0
+CAP_MB = 64
+
+def peak_rss_kb():
+    # ru_maxrss is KB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+def current_rss_kb():
+    """Resident set right now (Linux); elsewhere fall back to the peak so far."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize() // 1024
+    except OSError:
+        return peak_rss_kb()
+
+def write_mesh(path, size_mb):
+    """Random binary STL of roughly size_mb, written in slices to keep this process small."""
+    count = (size_mb * 1024 * 1024 - STL_HEADER_BYTES) // STL_RECORD_DTYPE.itemsize
+    rng = np.random.default_rng(size_mb)
+    with open(path, 'wb') as f:
+        f.write(b'\0' * 80 + np.uint32(count).tobytes())
+        for start in range(0, count, 100000):
+            records = np.zeros(min(100000, count - start), dtype=STL_RECORD_DTYPE)
+            records['vertices'] = rng.uniform(0, 200, size=(len(records), 3, 3))
+            f.write(records.tobytes())
+
+def measure(mode, path):
+    """Runs in a fresh child process so peak RSS belongs to one parse only."""
+    baseline = current_rss_kb()
+    started = time.perf_counter()
+    if mode == 'read':
+        # The old path: whole file into memory, then one pass over it
+        with open(path, 'rb') as f:
+            metrics = mesh_metrics(parse_stl_bytes(f.read()))
+    else:
+        metrics = analyze_stl(path)
+    elapsed = time.perf_counter() - started
+    print(json.dumps({'seconds': elapsed, 'rss_kb': peak_rss_kb() - baseline, 'triangles': metrics['triangles']}))
+
+def run(mode, path):
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode, path],
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare peak RSS and wall time of full-read vs memory-mapped STL analysis.")
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'PATH'), help=argparse.SUPPRESS)
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES_MB, help="Mesh sizes in MB.")
+    args = parser.parse_args()
+
+    if args.child:
+        measure(*args.child)
+        sys.exit(0)
+
+    print(f"{'size':>6} {'triangles':>10} {'mode':>6} {'seconds':>8} {'peak RSS +MB':>13}")
+    over_target = False
+    with tempfile.TemporaryDirectory() as tmp:
+        for size_mb in args.sizes:
+            path = os.path.join(tmp, f'mesh_{size_mb}mb.stl')
+            write_mesh(path, size_mb)
+            for mode in ('read', 'mmap'):
+                r = run(mode, path)
+                print(f"{size_mb:>4}MB {r['triangles']:>10} {mode:>6} {r['seconds']:>8.3f} {r['rss_kb'] / 1024:>13.1f}")
+                if mode == 'mmap' and size_mb >= CAP_MB and r['seconds'] >= TARGET_SECONDS_AT_CAP:
+                    print(f"  over the {TARGET_SECONDS_AT_CAP:g}s target at the {CAP_MB}MB upload cap")
+                    over_target = True
+            os.remove(path)
+    sys.exit(1 if over_target else 0)
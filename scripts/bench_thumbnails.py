@@ -0,0 +1,33 @@
+import sys
+import os
+import time
+import argparse
+
+# Add parent dir to path to find 'app' and the tests' mesh fixtures
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'tests'))
+
+from app.services.thumbnails import render_triangles
+from stl_fixtures import sphere_triangles
+
+# The worker renders every new upload; a large mesh must not hold it up
+TARGET_SECONDS = 1.0
+
+def best_of(fn, runs=3):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time thumbnail rendering of a large mesh.")
+    parser.add_argument('--segments', type=int, default=500, help="Sphere of 2 * n * n triangles.")
+    args = parser.parse_args()
+
+    mesh = sphere_triangles(args.segments)
+    seconds = best_of(lambda: render_triangles(mesh))
+    print(f"{len(mesh)} triangles: {seconds * 1000:.1f}ms (target < {TARGET_SECONDS * 1000:.0f}ms)")
+    sys.exit(0 if seconds < TARGET_SECONDS else 1)
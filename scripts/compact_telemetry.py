@@ -0,0 +1,15 @@
+import sys
+import os
+
+# Add parent dir to path to find 'app'
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.services.telemetry_history import compact
+
+if __name__ == "__main__":
+    app = create_app('development')
+    with app.app_context():
+        result = compact()
+        print(f"Telemetry segments downsampled: {result['segments_written']}; expired segments deleted: "
+              f"{result['segments_deleted']} ({result['bytes_reclaimed'] / (1024 * 1024):.1f}MB)")
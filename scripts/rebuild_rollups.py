@@ -0,0 +1,20 @@
+import sys
+import os
+
+# Add parent dir to path to find 'app'
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.services.analytics_service import AnalyticsService
+from app.services.utilization import rebuild_printer_days, seed_status_history
+
+# Run nightly (or once after upgrading) to backfill and reconcile the
+# analytics rollup tables from the orders and jobs themselves.
+if __name__ == "__main__":
+    app = create_app('development')
+    with app.app_context():
+        rows = AnalyticsService.rebuild_rollups()
+        print(f"Analytics rollups rebuilt: {rows} rows")
+        seeded = seed_status_history()
+        print(f"Printer status history started for {seeded} printers; "
+              f"daily utilization rebuilt: {rebuild_printer_days()} rows")
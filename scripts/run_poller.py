@@ -0,0 +1,39 @@
+import sys
+import os
+import asyncio
+import argparse
+
+# Add parent dir to path to find 'app'
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.services.fleet_poller import FleetPoller, POLL_SECONDS, MAX_CONNECTIONS, REQUEST_TIMEOUT_SECONDS
+from app.services.telemetry import last_report_time
+from app.services.watchdog import Watchdog, HEARTBEAT_TIMEOUT_SECONDS
+
+def report(result, seconds):
+    if result['failed'] or result['changed'] or result['failed_over']:
+        print(f"Polled {result['polled']} printer(s) in {seconds:.2f}s: {result['failed']} failed, "
+              f"{result['changed']} changed, {result['failed_over']} failed over", flush=True)
+
+async def main(args):
+    watchdog = Watchdog(args.heartbeat_timeout, last_seen=last_report_time) if args.heartbeat_timeout > 0 else None
+    poller = FleetPoller(max_connections=args.connections, timeout=args.timeout, watchdog=watchdog)
+    try:
+        await poller.run(args.interval, cycles=1 if args.once else None, on_cycle=report)
+    finally:
+        poller.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Poll printers' firmware APIs and update their status.")
+    parser.add_argument('--interval', type=float, default=POLL_SECONDS, help="Seconds between polls of a printer.")
+    parser.add_argument('--connections', type=int, default=MAX_CONNECTIONS, help="Requests in flight at once.")
+    parser.add_argument('--timeout', type=float, default=REQUEST_TIMEOUT_SECONDS, help="Per-printer request timeout.")
+    parser.add_argument('--heartbeat-timeout', type=float, default=HEARTBEAT_TIMEOUT_SECONDS,
+                        help="Seconds without a heartbeat before a printer's jobs are failed over. 0 disables.")
+    parser.add_argument('--once', action='store_true', help="Poll every printer once and exit.")
+    args = parser.parse_args()
+
+    app = create_app('development')
+    with app.app_context():
+        asyncio.run(main(args))
@@ -0,0 +1,30 @@
+import sys
+import os
+import time
+import argparse
+
+# Add parent dir to path to find 'app'
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.services.scheduler import run_scheduler
+
+def tick(app):
+    with app.app_context():
+        assigned = run_scheduler(user_id=None)
+        for job, printer in assigned:
+            print(f"Assigned job #{job.id} (order #{job.order_id}) to {printer.name}")
+        print(f"Scheduler tick: {len(assigned)} job(s) assigned.")
+        db.session.remove()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assign waiting print jobs to idle printers.")
+    parser.add_argument('--interval', type=int, default=0,
+                        help="Seconds between ticks. 0 runs once and exits (for cron/systemd timers).")
+    args = parser.parse_args()
+
+    app = create_app('development')
+    tick(app)
+    while args.interval > 0:
+        time.sleep(args.interval)
+        tick(app)
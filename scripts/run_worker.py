@@ -0,0 +1,64 @@
+import sys
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# Add parent dir to path to find 'app'
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.services.tasks import claim_next, execute_task, requeue_running
+
+_child_app = None
+
+def init_child():
+    # Each pool process gets its own app and DB connections
+    global _child_app
+    _child_app = create_app('development')
+
+def run_in_child(task_id):
+    with _child_app.app_context():
+        try:
+            return task_id, execute_task(task_id)
+        finally:
+            db.session.remove()
+
+def serve(app, processes, poll_seconds, once):
+    with app.app_context():
+        requeued = requeue_running()
+        if requeued:
+            print(f"Requeued {requeued} task(s) left running by a previous worker.")
+
+    with ProcessPoolExecutor(max_workers=processes, initializer=init_child) as pool:
+        running = set()
+        while True:
+            # Keep every process busy; claiming happens here so a task is never run twice
+            with app.app_context():
+                while len(running) < processes:
+                    task_id = claim_next()
+                    if task_id is None:
+                        break
+                    running.add(pool.submit(run_in_child, task_id))
+                db.session.remove()
+
+            if not running:
+                if once:
+                    return
+                time.sleep(poll_seconds)
+                continue
+
+            done, running = wait(running, timeout=poll_seconds, return_when=FIRST_COMPLETED)
+            for future in done:
+                task_id, status = future.result()
+                print(f"Task #{task_id}: {status}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run background tasks (upload analysis, repricing) in a process pool.")
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1,
+                        help="Worker processes (default: one per CPU).")
+    parser.add_argument('--poll', type=float, default=1.0, help="Seconds between queue checks when idle.")
+    parser.add_argument('--once', action='store_true', help="Drain the queue and exit.")
+    args = parser.parse_args()
+
+    serve(create_app('development'), args.processes, args.poll, args.once)
@@ -0,0 +1,34 @@
+import sys
+import os
+import argparse
+
+# Add parent dir to path to find 'app'
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+from app.services.storage_maintenance import collect_garbage, compress_old_files, DEFAULT_COMPRESS_AFTER_DAYS
+
+def mb(n):
+    return f"{n / (1024 * 1024):.1f}MB"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete unreferenced uploads and compress files of old orders.")
+    parser.add_argument('--compress-after-days', type=int, default=DEFAULT_COMPRESS_AFTER_DAYS,
+                        help="Gzip files of finished orders older than this. 0 disables compression.")
+    parser.add_argument('--dry-run', action='store_true', help="Report what would be done without changing anything.")
+    args = parser.parse_args()
+
+    app = create_app('development')
+    with app.app_context():
+        gc = collect_garbage(dry_run=args.dry_run)
+        print(f"Unreferenced files {'found' if args.dry_run else 'deleted'}: {gc['files_deleted']} "
+              f"({mb(gc['bytes_reclaimed'])}); abandoned uploads dropped: {gc['uploads_abandoned']}")
+
+        reclaimed = gc['bytes_reclaimed']
+        if args.compress_after_days > 0:
+            packed = compress_old_files(args.compress_after_days, dry_run=args.dry_run)
+            print(f"Files {'to compress' if args.dry_run else 'compressed'}: {packed['files_compressed']} "
+                  f"({mb(packed['bytes_reclaimed'])} saved)")
+            reclaimed += packed['bytes_reclaimed']
+
+        print(f"Total reclaimed: {mb(reclaimed)}")
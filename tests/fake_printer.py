@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+# What a fake printer reports unless told otherwise
+DEFAULTS = {
+    'kind': 'moonraker',     # or 'octoprint'
+    'state': 'standby',      # Moonraker print_stats.state, or OctoPrint's state text
+    'filename': '',
+    'nozzle_c': 21.0,
+    'bed_c': 20.5,
+    'progress': 0.0,         # 0..1
+    'http_status': 200,
+    'delay': 0.0,            # seconds before answering
+    'chunked': False,
+}
+
+class FakePrinterFarm:
+    """
+    Many printers' firmware APIs (Moonraker or OctoPrint style) served on
+    one local port, printer `name` under /p/<name>. Speaks just enough
+    HTTP/1.1, with keep-alive, for services/fleet_poller. Counts requests
+    and connections so tests can check reuse.
+    """
+    def __init__(self):
+        self.printers = {}
+        self.requests = 0
+        self.connections = 0
+        self.server = None
+        self.port = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def add(self, name, **state):
+        """Adds (or resets) a printer and returns its API base URL."""
+        self.printers[str(name)] = dict(DEFAULTS, **state)
+        return f'http://127.0.0.1:{self.port}/p/{name}'
+
+    def body(self, printer):
+        if printer['kind'] == 'octoprint':
+            return {'state': printer['state'], 'job': {'file': {'name': printer['filename'] or None}},
+                    'progress': {'completion': printer['progress'] * 100}}
+        return {'result': {'eventtime': 1.0, 'status': {
+            'print_stats': {'state': printer['state'], 'filename': printer['filename']},
+            'display_status': {'progress': printer['progress']},
+            'extruder': {'temperature': printer['nozzle_c'], 'target': 0.0},
+            'heater_bed': {'temperature': printer['bed_c'], 'target': 0.0},
+        }}}
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                self.requests += 1
+                path = request_line.split()[1].decode()
+                name = path.split('/')[2] if path.startswith('/p/') else None
+                printer = self.printers.get(name)
+                if printer is None:
+                    status, payload, chunked = 404, b'{"error": "not found"}', False
+                else:
+                    if printer['delay']:
+                        await asyncio.sleep(printer['delay'])
+                    status, payload, chunked = (printer['http_status'], json.dumps(self.body(printer)).encode(),
+                                                printer['chunked'])
+                head = f'HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n'
+                if chunked:
+                    half = len(payload) // 2
+                    writer.write((head + 'Transfer-Encoding: chunked\r\n\r\n').encode())
+                    for part in (payload[:half], payload[half:]):
+                        writer.write(b'%x\r\n%s\r\n' % (len(part), part))
+                    writer.write(b'0\r\n\r\n')
+                else:
+                    writer.write((head + f'Content-Length: {len(payload)}\r\n\r\n').encode() + payload)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,80 @@
+import zipfile
+from io import BytesIO
+
+import numpy as np
+
+from app.services.geometry import STL_RECORD_DTYPE
+
+# Triangles of an axis-aligned box, as indexes into its 8 corners
+CUBE_FACES = [(0, 1, 3), (0, 3, 2), (4, 6, 7), (4, 7, 5), (0, 4, 5), (0, 5, 1),
+              (2, 3, 7), (2, 7, 6), (0, 2, 6), (0, 6, 4), (1, 5, 7), (1, 7, 3)]
+
+def box_triangles(w, d, h):
+    """(12, 3, 3) float32 triangles of a w x d x h box at the origin."""
+    v = np.array([(x, y, z) for x in (0, w) for y in (0, d) for z in (0, h)], dtype=np.float32)
+    return v[np.array(CUBE_FACES)]
+
+def sphere_triangles(n, r=30.0):
+    """UV sphere with 2 * n * n triangles."""
+    u, v = np.meshgrid(np.linspace(0, 2 * np.pi, n + 1), np.linspace(0, np.pi, n + 1), indexing='ij')
+    p = np.stack([r * np.cos(u) * np.sin(v), r * np.sin(u) * np.sin(v), r * np.cos(v)], axis=-1).astype(np.float32)
+    a, b, c, d = p[:-1, :-1], p[1:, :-1], p[1:, 1:], p[:-1, 1:]
+    return np.concatenate([np.stack([a, b, c], axis=-2).reshape(-1, 3, 3),
+                           np.stack([a, c, d], axis=-2).reshape(-1, 3, 3)])
+
+def to_binary_stl(triangles):
+    records = np.zeros(len(triangles), dtype=STL_RECORD_DTYPE)
+    records['vertices'] = triangles
+    return b'\0' * 80 + np.uint32(len(triangles)).tobytes() + records.tobytes()
+
+def to_ascii_stl(triangles):
+    lines = ['solid test']
+    for tri in triangles:
+        lines += ['  facet normal 0 0 0', '    outer loop']
+        lines += ['      vertex %g %g %g' % tuple(v) for v in tri]
+        lines += ['    endloop', '  endfacet']
+    lines.append('endsolid test')
+    return '\n'.join(lines).encode()
+
+def box_stl(w, d, h):
+    """Binary STL of an axis-aligned box (12 triangles)."""
+    return to_binary_stl(box_triangles(w, d, h))
+
+def cube_stl(size):
+    return box_stl(size, size, size)
+
+CUBE_3MF_MODEL = b"""<?xml version="1.0" encoding="UTF-8"?>
+<model unit="%s" xmlns="http://schemas.microsoft.com/3dmanufacturing/core/2015/02">
+ <resources><object id="1" type="model"><mesh>
+  <vertices>%s</vertices>
+  <triangles>%s</triangles>
+ </mesh></object></resources>
+ <build><item objectid="1"/></build>
+</model>
+"""
+
+def cube_3mf(size, unit='millimeter', gcode=None):
+    """3MF project holding a size mm cube, with sliced G-code inside if `gcode` is given."""
+    verts = [(x, y, z) for x in (0, size) for y in (0, size) for z in (0, size)]
+    model = CUBE_3MF_MODEL % (
+        unit.encode(),
+        b''.join(b'<vertex x="%g" y="%g" z="%g"/>' % v for v in verts),
+        b''.join(b'<triangle v1="%d" v2="%d" v3="%d"/>' % f for f in CUBE_FACES))
+    buf = BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr('[Content_Types].xml', '<Types/>')
+        zf.writestr('3D/3dmodel.model', model)
+        if gcode:
+            zf.writestr('Metadata/plate_1.gcode', gcode)
+    return buf.getvalue()
+
+def edit_3mf_model(data, old, new):
+    """A copy of a cube_3mf project with `old` replaced by `new` in its model XML."""
+    with zipfile.ZipFile(BytesIO(data)) as src:
+        members = {name: src.read(name) for name in src.namelist()}
+    members['3D/3dmodel.model'] = members['3D/3dmodel.model'].replace(old, new, 1)
+    buf = BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, content in members.items():
+            zf.writestr(name, content)
+    return buf.getvalue()
@@ -49,6 +49,19 @@ class TestAdminPrinters(unittest.TestCase):
         p_updated = Printer.query.get(p.id)
         self.assertEqual(p_updated.name, 'NewName')
 
+    def test_printer_api_url_must_be_http(self):
+        self.client.post('/admin/printers/new', data={'name': 'Odd', 'api_url': 'ftp://10.0.0.5'})
+        self.assertIsNone(Printer.query.filter_by(name='Odd').first())
+
+        p = Printer(name='Klipper', api_url='http://10.0.0.5:7125')
+        db.session.add(p)
+        db.session.commit()
+        self.client.post(f'/admin/printers/{p.id}/edit', data={'name': 'Klipper', 'api_url': '10.0.0.6'})
+        self.assertEqual(Printer.query.get(p.id).api_url, 'http://10.0.0.5:7125')
+
+        self.client.post(f'/admin/printers/{p.id}/edit', data={'name': 'Klipper', 'api_url': 'https://octo.lan'})
+        self.assertEqual(Printer.query.get(p.id).api_url, 'https://octo.lan')
+
     def test_delete_printer(self):
         p = Printer(name='ToDelete')
         db.session.add(p)
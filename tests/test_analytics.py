@@ -1,7 +1,9 @@
 import unittest
+from sqlalchemy import event
 from app import create_app, db
-from app.models import User, Order, PrintJob, Printer, OrderStatus, JobStatus, UserRole
+from app.models import User, Order, PrintJob, Printer, OrderStatus, JobStatus, UserRole, DailyOrderStat, DailyJobStat
 from app.services.analytics_service import AnalyticsService
+from app.services.workflow import assign_job, transition_order_status, retry_job
 from datetime import datetime, timedelta
 
 class TestAnalytics(unittest.TestCase):
@@ -41,6 +43,7 @@ class TestAnalytics(unittest.TestCase):
         )
         db.session.add(self.j1)
         db.session.commit()
+        AnalyticsService.invalidate_stats()
 
         self.client = self.app.test_client()
 
@@ -69,6 +72,57 @@ class TestAnalytics(unittest.TestCase):
         self.assertIsNotNone(pla_stat)
         self.assertEqual(pla_stat['grams'], 100)
 
+    def _rollups(self):
+        orders = sorted((r.day, r.status, r.orders) for r in DailyOrderStat.query if r.orders)
+        jobs = sorted((r.day, r.printer_id, r.material_type, r.order_status, r.jobs, round(r.grams, 6))
+                      for r in DailyJobStat.query if r.jobs)
+        return orders, jobs
+
+    def test_rollups_follow_writes(self):
+        other = Printer(name='Other', status='idle')
+        db.session.add(other)
+        o3 = Order(customer_user_id=self.user.id, created_at=datetime.utcnow() - timedelta(days=3))
+        db.session.add(o3)
+        db.session.commit()
+        j2 = PrintJob(order_id=o3.id, material_type='PETG', color='Red', estimated_material_grams=40,
+                      stl_path='a.stl', original_filename='a.stl')
+        j3 = PrintJob(order_id=o3.id, material_type='PLA', color='Red', estimated_material_grams=25,
+                      stl_path='b.stl', original_filename='b.stl')
+        db.session.add_all([j2, j3])
+        db.session.commit()
+
+        assign_job(j2, other.id, self.user.id)
+        transition_order_status(o3, OrderStatus.PRINTING, self.user.id)
+        db.session.expire_all()
+        j3 = db.session.get(PrintJob, j3.id)
+        j3.estimated_material_grams = 30
+        j3.assigned_printer_id = self.printer.id
+        transition_order_status(self.o1, OrderStatus.CANCELLED, self.user.id, commit=False)
+        db.session.commit()
+        retry_job(db.session.get(PrintJob, j2.id), self.user.id)
+        db.session.delete(self.o2)
+        db.session.commit()
+
+        incremental = self._rollups()
+        AnalyticsService.rebuild_rollups()
+        self.assertEqual(self._rollups(), incremental)
+
+        statuses = {s['status']: s['count'] for s in AnalyticsService.get_order_status_distribution()}
+        self.assertEqual(statuses, {OrderStatus.CANCELLED: 1, OrderStatus.PRINTING: 1})
+        usage = {s['material']: s['grams'] for s in AnalyticsService.get_filament_usage_stats(self.printer.id)}
+        self.assertEqual(usage, {'PLA': 130})
+        utilization = {s['printer']: s['jobs'] for s in AnalyticsService.get_printer_utilization()}
+        self.assertEqual(utilization, {'TestPrinter': 2, 'Other': 0})
+
+    def test_rebuild_backfills_missing_rollups(self):
+        DailyOrderStat.query.delete()
+        DailyJobStat.query.delete()
+        db.session.commit()
+        self.assertEqual(AnalyticsService.get_filament_usage_stats(), [])
+        AnalyticsService.rebuild_rollups()
+        self.test_orders_per_day()
+        self.test_filament_usage()
+
     def test_analytics_api_access(self):
         # Login
         self.client.post('/auth/login', data={'email': 'admin@test.com', 'password': 'password'})
@@ -79,6 +133,31 @@ class TestAnalytics(unittest.TestCase):
         self.assertIn('orders_per_day', data)
         self.assertIn('filament_usage', data)
 
+    def test_stats_conditional_get(self):
+        self.client.post('/auth/login', data={'email': 'admin@test.com', 'password': 'password'})
+        first = self.client.get('/analytics/api/stats?days=7')
+        self.assertEqual(first.status_code, 200)
+        etag = first.headers['ETag']
+        self.assertIn('Last-Modified', first.headers)
+
+        statements = []
+        record = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            again = self.client.get('/analytics/api/stats?days=7', headers={'If-None-Match': etag})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(again.status_code, 304)
+        self.assertFalse([s for s in statements if 'daily_' in s])
+
+        # A committed order change invalidates the cache at once
+        transition_order_status(self.o2, OrderStatus.CANCELLED, self.user.id)
+        changed = self.client.get('/analytics/api/stats?days=7', headers={'If-None-Match': etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers['ETag'], etag)
+        statuses = {s['status']: s['count'] for s in changed.get_json()['order_status']}
+        self.assertEqual(statuses[OrderStatus.CANCELLED], 1)
+
     def test_analytics_api_forbidden(self):
         # No login
         response = self.client.get('/analytics/api/stats')
@@ -0,0 +1,117 @@
+import math
+import unittest
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app import create_app, db
+from app.models import User, Order, PrintJob, Printer, Filament, CalibrationCell, JobStatus, PrinterStatus
+from app.services import calibration
+from app.services.calibration import (fit, apply_calibration, correction_factor, printer_time_factors,
+                                      rebuild_calibration, _group_cells)
+from app.services.workflow import assign_job, start_job, finish_job
+
+class TestFit(unittest.TestCase):
+    def test_recovers_printer_and_material_factors(self):
+        rng = np.random.default_rng(1)
+        truth_p = {1: math.log(1.3), 2: math.log(0.9), 3: 0.0}
+        truth_m = {'PLA': 0.0, 'PETG': math.log(1.2)}
+        printers = rng.choice([1, 2, 3], size=200000)
+        materials = rng.choice(['PLA', 'PETG'], size=200000)
+        values = (np.array([truth_p[p] for p in printers]) + np.array([truth_m[m] for m in materials])
+                  + rng.normal(0, 0.1, size=200000))
+        cells = [(c.printer_id, c.material_type, c.count, c.sum_log)
+                 for c in _group_cells('time', printers, materials, values)]
+        self.assertEqual(len(cells), 6)
+
+        # Speed is measured by scripts/bench_calibration.py
+        model = fit(cells)
+        # Only differences are identifiable: compare against printer 3 / PLA
+        for pid in (1, 2):
+            self.assertAlmostEqual(model['printer'][pid] - model['printer'][3], truth_p[pid], places=2)
+        self.assertAlmostEqual(model['material']['PETG'] - model['material']['PLA'], truth_m['PETG'], places=2)
+        total = model['printer'][1] + model['material']['PETG']
+        self.assertAlmostEqual(total, truth_p[1] + truth_m['PETG'], places=2)
+
+    def test_no_history_means_no_correction(self):
+        model = fit([])
+        self.assertEqual(model['printer_mean'], 0.0)
+
+class TestCalibrationWorkflow(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        calibration._fits.clear()
+
+        self.user = User(email='op@test.com', name='Operator')
+        self.slow = Printer(name='Slow', status=PrinterStatus.IDLE)
+        self.fast = Printer(name='Fast', status=PrinterStatus.IDLE, speed_profile='fast')
+        self.filament = Filament(material_type='PLA', color='Black', stock_grams=100000)
+        db.session.add_all([self.user, self.slow, self.fast, self.filament])
+        db.session.commit()
+        self.order = Order(customer_user_id=self.user.id)
+        db.session.add(self.order)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _run(self, printer, minutes, grams, quantity=1):
+        """One job estimated at 100 min / 20 g per unit that really took `minutes` / `grams` in total."""
+        job = PrintJob(order_id=self.order.id, material_type='PLA', color='Black', quantity=quantity,
+                       stl_path='x.stl', original_filename='x.stl', status=JobStatus.WAITING)
+        apply_calibration(job, 20.0, 100.0)
+        db.session.add(job)
+        db.session.commit()
+        assign_job(job, printer.id, self.user.id)
+        start_job(job, self.user.id)
+        job.started_at = datetime.utcnow() - timedelta(minutes=minutes)
+        finish_job(job, self.user.id, actual_grams=grams)
+        return job
+
+    def test_finish_records_actuals(self):
+        job = self._run(self.slow, 150, 25.0)
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(job.actual_material_grams, 25.0)
+        self.assertEqual(self.filament.stock_grams, 100000 - 25.0)
+        cell = CalibrationCell.query.filter_by(metric='time', printer_id=self.slow.id).one()
+        self.assertEqual(cell.count, 1)
+        self.assertAlmostEqual(cell.sum_log, math.log(1.5), places=3)
+
+    def test_new_estimates_learn_from_history(self):
+        for _ in range(40):
+            self._run(self.slow, 150, 24.0)
+            # Fast profile: 100 min at standard is ~53 min a unit here, and it does that
+            self._run(self.fast, 2 * 100 * 8.0 / 15.0, 2 * 24.0, quantity=2)
+
+        job = PrintJob(order_id=self.order.id, material_type='PLA', color='Black',
+                       stl_path='x.stl', original_filename='x.stl')
+        apply_calibration(job, 20.0, 100.0)
+        self.assertEqual(job.model_time_minutes, 100.0)
+        self.assertAlmostEqual(job.estimated_material_grams, 24.0, delta=0.6)
+        # Half the history ran 1.5x over, half on time: the average printer is ~1.22x
+        self.assertAlmostEqual(job.estimated_time_minutes, 122, delta=4)
+        self.assertGreater(correction_factor('time', 'PLA', self.slow.id), 1.35)
+
+        factors = printer_time_factors()
+        self.assertGreater(factors[self.slow.id], 1.15)
+        self.assertLess(factors[self.fast.id], 0.87)
+
+    def test_rebuild_matches_incremental(self):
+        for minutes in (120, 90, 200):
+            self._run(self.slow, minutes, 30.0)
+        self._run(self.fast, 40, 20.0)
+
+        def cells():
+            return sorted((c.metric, c.printer_id, c.material_type, c.count, round(c.sum_log, 6))
+                          for c in CalibrationCell.query.all())
+        incremental = cells()
+        rebuild_calibration()
+        self.assertEqual(cells(), incremental)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,16 @@
+import shutil
+import tempfile
 import unittest
 from io import BytesIO
 from app import create_app, db
 from app.models import User, Order, UserRole, OrderStatus
+from app.services.tasks import run_pending
 
 class TestCustomerOrder(unittest.TestCase):
     def setUp(self):
         self.app = create_app('testing')
+        self.upload_dir = tempfile.mkdtemp()
+        self.app.config['UPLOAD_FOLDER'] = self.upload_dir
         self.app_context = self.app.app_context()
         self.app_context.push()
         db.create_all()
@@ -23,6 +28,7 @@ class TestCustomerOrder(unittest.TestCase):
         db.session.remove()
         db.drop_all()
         self.app_context.pop()
+        shutil.rmtree(self.upload_dir)
 
     def test_order_flow(self):
         # 1. Submit New Order Form (File Upload)
@@ -45,6 +51,12 @@ class TestCustomerOrder(unittest.TestCase):
         response = self.client.get(f'/customer/order/{order.id}/confirm')
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'Confirm Your Order', response.data)
+
+        # Confirming waits until the background worker has analyzed the upload
+        self.client.post(f'/customer/order/{order.id}/confirm', data={'action': 'confirm'})
+        db.session.refresh(order)
+        self.assertEqual(order.status, OrderStatus.REVIEW)
+        run_pending()
         
         # 3. Confirm Order
         response = self.client.post(f'/customer/order/{order.id}/confirm', data={'action': 'confirm'}, follow_redirects=True)
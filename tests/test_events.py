@@ -0,0 +1,116 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from app import create_app, db
+from app.models import User, Order, PrintJob, Printer, JobStatus, PrinterStatus, UserRole
+from app.services import events
+from app.services.workflow import assign_job, start_job, finish_job
+
+class TestEvents(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'events.db')
+        self.app.config['EVENT_LOG_PATH'] = self.path
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.user = User(email='op@test.com', name='Operator', role=UserRole.OPERATOR)
+        self.user.set_password('password')
+        self.printer = Printer(name='P1', status=PrinterStatus.IDLE)
+        db.session.add_all([self.user, self.printer])
+        db.session.commit()
+        order = Order(customer_user_id=self.user.id)
+        db.session.add(order)
+        db.session.commit()
+        self.job = PrintJob(order_id=order.id, material_type='PLA', color='Black',
+                            stl_path='a.stl', original_filename='a.stl')
+        db.session.add(self.job)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.tmp)
+
+    def test_workflow_publishes_on_commit(self):
+        assign_job(self.job, self.printer.id, self.user.id, commit=False)
+        self.assertEqual(events.read_events(self.path, 0), [])
+        db.session.commit()
+        start_job(self.job, self.user.id)
+
+        published = events.read_events(self.path, 0)
+        kinds = [kind for _, kind, _ in published]
+        self.assertEqual(kinds, ['job', 'printer', 'job', 'printer'])
+        self.assertEqual(published[2][2], {'id': self.job.id, 'status': JobStatus.PRINTING,
+                                           'printer_id': self.printer.id, 'order_id': self.job.order_id})
+        self.assertEqual(published[3][2]['status'], PrinterStatus.PRINTING)
+        self.assertEqual(events.latest_event_id(self.path), published[-1][0])
+
+    def test_rolled_back_changes_publish_nothing(self):
+        self.job.assigned_printer_id = self.printer.id
+        self.job.status = JobStatus.PRINTING
+        finish_job(self.job, self.user.id, commit=False)
+        db.session.rollback()
+        db.session.commit()
+        self.assertEqual(events.read_events(self.path, 0), [])
+
+    def test_stream_resumes_after_last_event_id(self):
+        first = events.publish([('job', {'id': 1})], self.path)
+        events.publish([('printer', {'id': 2}), ('job', {'id': 3})], self.path)
+
+        now = [0.0]
+        def sleep(seconds):
+            now[0] += seconds
+        chunks = list(events.stream(self.path, first, lifetime=events.HEARTBEAT_SECONDS + 1,
+                                    clock=lambda: now[0], sleep=sleep))
+        self.assertEqual(chunks[0], f"retry: {events.RETRY_MS}\n\n")
+        self.assertEqual(chunks[1], f'id: {first + 1}\nevent: printer\ndata: {{"id": 2}}\n\n')
+        self.assertEqual(chunks[2], f'id: {first + 2}\nevent: job\ndata: {{"id": 3}}\n\n')
+        self.assertEqual(chunks[3:], [": keep-alive\n\n"])
+
+    def test_stream_polls_over_one_connection(self):
+        events.publish([('job', {'id': 1})], self.path)
+        opened = []
+        connect = events._connect
+        def counting_connect(path):
+            opened.append(path)
+            return connect(path)
+
+        now = [0.0]
+        def sleep(seconds):
+            now[0] += seconds
+            if now[0] == 1.0:
+                # Another worker process publishing mid-stream
+                with sqlite3.connect(self.path) as other:
+                    other.execute("INSERT INTO events (created_at, kind, data) VALUES (0, 'job', '{}')")
+        events._connect = counting_connect
+        try:
+            chunks = list(events.stream(self.path, 0, lifetime=5, clock=lambda: now[0], sleep=sleep))
+        finally:
+            events._connect = connect
+        self.assertEqual(len([c for c in chunks if c.startswith('id:')]), 2)
+        self.assertEqual(opened, [self.path])
+
+    def test_events_endpoint(self):
+        events.publish([('job', {'id': self.job.id})], self.path)
+        client = self.app.test_client()
+        client.post('/auth/login', data={'email': 'op@test.com', 'password': 'password'})
+        response = client.get('/operator/events', headers={'Last-Event-ID': '0'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        body = iter(response.response)
+        self.assertTrue(next(body).startswith(b'retry:'))
+        self.assertIn(b'event: job', next(body))
+        response.close()
+
+        self.app.config['EVENT_LOG_PATH'] = None
+        self.assertEqual(client.get('/operator/events').status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import asyncio
+import socket
+import unittest
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import User, Order, PrintJob, Printer, JobStatus, PrinterStatus, UserRole
+from app.services import fleet_poller
+from app.services.fleet_poller import FleetPoller, reconcile, STATE_IDLE, STATE_PRINTING, STATE_ERROR
+from fake_printer import FakePrinterFarm
+
+def closed_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TestFleetPoller(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.user = User(email='op@test.com', name='Operator', role=UserRole.OPERATOR)
+        self.user.set_password('password')
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_printer(self, name, **fields):
+        printer = Printer(name=name, status=PrinterStatus.IDLE, **fields)
+        db.session.add(printer)
+        db.session.commit()
+        return printer
+
+    def add_job(self, printer, status, filename='bracket.stl'):
+        order = Order(customer_user_id=self.user.id)
+        db.session.add(order)
+        db.session.commit()
+        job = PrintJob(order_id=order.id, material_type='PLA', color='Black', stl_path=filename,
+                       original_filename=filename, status=status, assigned_printer_id=printer.id)
+        db.session.add(job)
+        db.session.commit()
+        return job
+
+    def test_reconcile_rules(self):
+        printer = Printer(name='P', status=PrinterStatus.MAINTENANCE)
+        self.assertEqual(reconcile(printer, STATE_ERROR), (PrinterStatus.MAINTENANCE, None))
+
+        # Reserved by an assignment: stays PRINTING until the operator starts it
+        printer.status, printer.current_job_id = PrinterStatus.PRINTING, 7
+        self.assertEqual(reconcile(printer, STATE_IDLE), (PrinterStatus.PRINTING, 7))
+        self.assertEqual(reconcile(printer, STATE_ERROR), (PrinterStatus.ERROR, 7))
+
+        printer.status = PrinterStatus.ERROR
+        self.assertEqual(reconcile(printer, STATE_IDLE), (PrinterStatus.PRINTING, 7))
+        printer.current_job_id = None
+        self.assertEqual(reconcile(printer, STATE_IDLE), (PrinterStatus.IDLE, None))
+
+        # A print started at the printer, with no ERP job, then finishing
+        printer.status = PrinterStatus.IDLE
+        self.assertEqual(reconcile(printer, STATE_PRINTING, 'calibration_cube.gcode'), (PrinterStatus.PRINTING, None))
+        printer.status = PrinterStatus.PRINTING
+        self.assertEqual(reconcile(printer, STATE_IDLE), (PrinterStatus.IDLE, None))
+
+    def test_api_url_schemes(self):
+        self.assertEqual(fleet_poller.parse_api_url('http://10.0.0.5:7125'), ('10.0.0.5', 7125, False, ''))
+        self.assertEqual(fleet_poller.parse_api_url('https://octo.lan/printer1/'),
+                         ('octo.lan', 443, True, '/printer1'))
+        for bad in ('ftp://10.0.0.5', '10.0.0.5:7125', 'http://', 'http://host:99999'):
+            with self.assertRaises(ValueError):
+                fleet_poller.parse_api_url(bad)
+
+        secure = self.add_printer('Secure', api_url='https://octo.lan', api_type='octoprint')
+        self.add_printer('Odd', api_url='ftp://10.0.0.5')
+        poller = FleetPoller()
+        self.assertEqual(poller.load_targets(), 1)
+        self.assertEqual((poller.targets[secure.id]['port'], poller.targets[secure.id]['tls']), (443, True))
+
+    def test_poll_cycle_updates_printers(self):
+        async def scenario():
+            farm = await FakePrinterFarm().start()
+            clock = Clock()
+            printing = self.add_printer('Klipper', api_url=farm.add('a', state='printing',
+                                                                   filename='bracket_0.2mm_PLA.gcode',
+                                                                   nozzle_c=215.0, progress=0.4, chunked=True))
+            job = self.add_job(printing, JobStatus.QUEUED)
+            broken = self.add_printer('Octo', api_type='octoprint',
+                                      api_url=farm.add('b', kind='octoprint', state='Offline after error'))
+            slow = self.add_printer('Slow', api_url=farm.add('c', delay=1.0))
+            gone = self.add_printer('Gone', api_url=f'http://127.0.0.1:{closed_port()}')
+            maintained = self.add_printer('Held', api_url=farm.add('d', state='error'))
+            maintained.status = PrinterStatus.MAINTENANCE
+            manual = self.add_printer('Manual')
+            db.session.commit()
+
+            poller = FleetPoller(max_connections=4, timeout=0.3, clock=clock)
+            self.assertEqual(poller.load_targets(), 5)
+            commits = []
+            count_commit = commits.append
+            event.listen(db.session, 'after_commit', count_commit)
+            try:
+                result = await poller.poll_once()
+            finally:
+                event.remove(db.session, 'after_commit', count_commit)
+            self.assertEqual(result, {'polled': 5, 'failed': 2, 'changed': 2, 'failed_over': 0})
+            self.assertEqual(len(commits), 1)
+
+            db.session.expire_all()
+            self.assertEqual((printing.status, printing.current_job_id), (PrinterStatus.PRINTING, job.id))
+            self.assertEqual(broken.status, PrinterStatus.ERROR)
+            self.assertEqual(maintained.status, PrinterStatus.MAINTENANCE)
+            self.assertEqual(manual.status, PrinterStatus.IDLE)
+            self.assertEqual(slow.status, PrinterStatus.IDLE)
+
+            # Failing printers back off: 5s, then 10s, then they are marked ERROR
+            self.assertEqual(poller.targets[gone.id]['next_poll'], clock.now + 5)
+            clock.now += 1
+            self.assertEqual((await poller.poll_once())['polled'], 3)
+            for step in (5, 10):
+                clock.now += step
+                await poller.poll_once()
+            db.session.expire_all()
+            self.assertEqual(gone.status, PrinterStatus.ERROR)
+            self.assertEqual(slow.status, PrinterStatus.ERROR)
+
+            # Recovered firmware clears the error
+            farm.add('c')
+            clock.now += fleet_poller.BACKOFF_MAX_SECONDS
+            await poller.poll_once()
+            db.session.expire_all()
+            self.assertEqual(slow.status, PrinterStatus.IDLE)
+
+            poller.close()
+            await farm.stop()
+            return farm
+
+        farm = asyncio.run(scenario())
+        # Healthy printers reuse one kept-alive connection across cycles
+        self.assertLess(farm.connections, farm.requests)
+
+if __name__ == '__main__':
+    unittest.main()
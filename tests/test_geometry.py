@@ -0,0 +1,176 @@
+import os
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+
+import numpy as np
+
+from app import create_app, db
+from app.models import User, PrintJob, Printer, UserRole, PrinterStatus, AnalysisStatus
+from app.services import geometry
+from app.services.geometry import (parse_stl_bytes, mesh_metrics, estimate_from_metrics, analyze_stl,
+                                   STL_RECORD_DTYPE, STLError)
+from app.services.scheduler import build_plan
+from app.services.tasks import run_pending
+from stl_fixtures import box_triangles, to_binary_stl, to_ascii_stl, cube_3mf, edit_3mf_model
+
+class TestGeometry(unittest.TestCase):
+    def test_box_metrics(self):
+        m = mesh_metrics(box_triangles(10, 20, 30))
+        self.assertAlmostEqual(m['volume_mm3'], 6000, places=3)
+        self.assertAlmostEqual(m['surface_area_mm2'], 2 * (200 + 300 + 600), places=3)
+        self.assertEqual(m['size_mm'], [10, 20, 30])
+        self.assertEqual(m['triangles'], 12)
+
+    def test_ascii_and_binary_agree(self):
+        tri = box_triangles(12.5, 4, 7)
+        binary = mesh_metrics(parse_stl_bytes(to_binary_stl(tri)))
+        ascii = mesh_metrics(parse_stl_bytes(to_ascii_stl(tri)))
+        self.assertAlmostEqual(binary['volume_mm3'], ascii['volume_mm3'], places=3)
+        self.assertEqual(binary['size_mm'], ascii['size_mm'])
+
+    def test_garbage_is_rejected(self):
+        with self.assertRaises(STLError):
+            parse_stl_bytes(b"fake stl content")
+
+    def test_malformed_ascii_is_rejected(self):
+        data = to_ascii_stl(box_triangles(10, 10, 10)).replace(b'vertex 0 0 10', b'vertex 0 0 1e', 1)
+        with self.assertRaises(STLError):
+            parse_stl_bytes(data)
+        fd, path = tempfile.mkstemp(suffix='.stl')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            with self.assertRaises(STLError):
+                analyze_stl(path)
+        finally:
+            os.remove(path)
+
+    def test_estimates_follow_density_and_speed(self):
+        m = mesh_metrics(box_triangles(20, 20, 20))
+        pla_g, pla_min = estimate_from_metrics(m, 'PLA')
+        abs_g, _ = estimate_from_metrics(m, 'ABS')
+        _, fast_min = estimate_from_metrics(m, 'PLA', profile='fast')
+        self.assertGreater(pla_g, abs_g)
+        self.assertLess(fast_min, pla_min)
+        # 20mm cube: 2.88cm^3 of 1.2mm shell + 20% of the remaining 5.12cm^3 -> 3.9cm^3 of PLA
+        self.assertAlmostEqual(pla_g, 4.8, delta=0.1)
+
+    def test_chunked_scan_matches_whole_mesh(self):
+        rng = np.random.default_rng(1)
+        tri = rng.uniform(-50, 50, size=(1000, 3, 3)).astype(np.float32)
+        expected = mesh_metrics(tri)
+        old_chunk, old_block = geometry.CHUNK_TRIANGLES, geometry.ASCII_BLOCK_BYTES
+        # Small chunks/blocks so records and text lines straddle boundaries
+        geometry.CHUNK_TRIANGLES, geometry.ASCII_BLOCK_BYTES = 97, 1000
+        try:
+            for data in (to_binary_stl(tri), to_ascii_stl(tri)):
+                fd, path = tempfile.mkstemp(suffix='.stl')
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                try:
+                    m = analyze_stl(path)
+                finally:
+                    os.remove(path)
+                self.assertEqual(m['triangles'], 1000)
+                self.assertAlmostEqual(m['volume_mm3'], expected['volume_mm3'], delta=1e-3 * expected['volume_mm3'])
+                self.assertAlmostEqual(m['surface_area_mm2'], expected['surface_area_mm2'], delta=1e-3 * expected['surface_area_mm2'])
+                np.testing.assert_allclose(m['bbox_min'], expected['bbox_min'], rtol=1e-5)
+        finally:
+            geometry.CHUNK_TRIANGLES, geometry.ASCII_BLOCK_BYTES = old_chunk, old_block
+
+    def test_max_upload_is_analyzed(self):
+        # Speed at this size is measured by scripts/bench_stl.py
+        # ~64MB binary STL: 1.34M triangles
+        n = (64 * 1024 * 1024 - 84) // STL_RECORD_DTYPE.itemsize
+        rng = np.random.default_rng(0)
+        tri = rng.uniform(0, 200, size=(n, 3, 3)).astype(np.float32)
+        fd, path = tempfile.mkstemp(suffix='.stl')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(to_binary_stl(tri))
+            m = analyze_stl(path)
+            self.assertEqual(m['triangles'], n)
+        finally:
+            os.remove(path)
+
+class TestGeometryIntegration(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.upload_dir = tempfile.mkdtemp()
+        self.app.config['UPLOAD_FOLDER'] = self.upload_dir
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.customer = User(email='cust@test.com', name='Customer', role=UserRole.CUSTOMER)
+        self.customer.set_password('password')
+        db.session.add(self.customer)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.upload_dir)
+
+    def test_order_uses_mesh_estimate(self):
+        client = self.app.test_client()
+        client.post('/auth/login', data={'email': 'cust@test.com', 'password': 'password'})
+        data = {
+            'stl_files': (BytesIO(to_binary_stl(box_triangles(40, 40, 40))), 'cube.stl'),
+            'material_type': 'PETG',
+            'color': 'Grey',
+            'quantity': 2
+        }
+        response = client.post('/customer/order/new', data=data)
+        self.assertEqual(response.status_code, 302)
+        run_pending()
+
+        job = PrintJob.query.first()
+        expected = estimate_from_metrics(mesh_metrics(box_triangles(40, 40, 40)), 'PETG')
+        self.assertEqual((job.estimated_material_grams, job.estimated_time_minutes), expected)
+        self.assertNotEqual(job.estimated_material_grams, 50)
+
+    def test_malformed_ascii_upload_fails_analysis(self):
+        client = self.app.test_client()
+        client.post('/auth/login', data={'email': 'cust@test.com', 'password': 'password'})
+        data = to_ascii_stl(box_triangles(40, 40, 40)).replace(b'vertex 0 0 40', b'vertex 0 0 4e', 1)
+        client.post('/customer/order/new', data={
+            'stl_files': (BytesIO(data), 'cube.stl'),
+            'material_type': 'PLA',
+            'color': 'Grey',
+            'quantity': 1
+        })
+        run_pending()
+
+        job = PrintJob.query.first()
+        self.assertEqual(job.analysis_status, AnalysisStatus.FAILED)
+
+    def test_malformed_3mf_upload_fails_analysis(self):
+        client = self.app.test_client()
+        client.post('/auth/login', data={'email': 'cust@test.com', 'password': 'password'})
+        client.post('/customer/order/new', data={
+            'stl_files': (BytesIO(edit_3mf_model(cube_3mf(40), b'x="40"', b'x="1e"')), 'cube.3mf'),
+            'material_type': 'PLA',
+            'color': 'Grey',
+            'quantity': 1
+        })
+        run_pending()
+
+        job = PrintJob.query.first()
+        self.assertEqual(job.analysis_status, AnalysisStatus.FAILED)
+
+    def test_scheduler_scales_by_printer_speed(self):
+        slow = Printer(name='Slow', status=PrinterStatus.IDLE, speed_profile='slow')
+        fast = Printer(name='Fast', status=PrinterStatus.IDLE, speed_profile='fast')
+        db.session.add_all([slow, fast])
+        db.session.commit()
+
+        plan = {lane['printer'].name: lane for lane in build_plan([], [slow, fast])}
+        self.assertGreater(plan['Slow']['time_factor'], 1)
+        self.assertLess(plan['Fast']['time_factor'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
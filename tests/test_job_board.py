@@ -0,0 +1,81 @@
+import unittest
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import User, Order, PrintJob, Printer, JobStatus, PrinterStatus, UserRole
+from app.services.job_board import load_board, board_page
+
+STATUSES = [JobStatus.WAITING, JobStatus.QUEUED, JobStatus.PRINTING, JobStatus.FAILED, JobStatus.DONE]
+
+class TestJobBoard(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.user = User(email='op@test.com', name='Operator', role=UserRole.OPERATOR)
+        self.user.set_password('password')
+        db.session.add(self.user)
+        self.printers = [Printer(name=f'P{i}', status=PrinterStatus.IDLE) for i in range(3)]
+        db.session.add_all(self.printers)
+        db.session.commit()
+        self.order = Order(customer_user_id=self.user.id)
+        db.session.add(self.order)
+        db.session.commit()
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'email': 'op@test.com', 'password': 'password'})
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _add_jobs(self, count):
+        for i in range(count):
+            status = STATUSES[i % len(STATUSES)]
+            printer = self.printers[i % 3] if status != JobStatus.WAITING else None
+            db.session.add(PrintJob(order_id=self.order.id, material_type='PLA', color='Black',
+                                    stl_path=f'{i}.stl', original_filename=f'{i}.stl', status=status,
+                                    assigned_printer_id=printer.id if printer else None))
+        db.session.commit()
+        db.session.expire_all()
+
+    def _count_queries(self, url):
+        statements = []
+        record = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = self.client.get(url)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(response.status_code, 200)
+        return len(statements)
+
+    def test_query_count_does_not_grow_with_the_queue(self):
+        self._add_jobs(5)
+        small = self._count_queries('/operator/jobs')
+        small_api = self._count_queries('/operator/api/jobs')
+        self._add_jobs(60)
+        self.assertEqual(self._count_queries('/operator/jobs'), small)
+        self.assertEqual(self._count_queries('/operator/api/jobs?per_page=100'), small_api)
+
+    def test_board_partitions_active_jobs(self):
+        self._add_jobs(10)
+        board, printers = load_board()
+        self.assertEqual({status: len(jobs) for status, jobs in board.items()},
+                         {JobStatus.WAITING: 2, JobStatus.QUEUED: 2, JobStatus.PRINTING: 2, JobStatus.FAILED: 2})
+        self.assertEqual(len(printers), 3)
+
+    def test_json_pages(self):
+        self._add_jobs(25)
+        first = board_page(JobStatus.QUEUED, page=1, per_page=3)
+        self.assertEqual((first['total'], first['pages'], len(first['jobs'])), (5, 2, 3))
+        self.assertEqual(first['jobs'][0]['printer']['name'], 'P1')
+        last = self.client.get('/operator/api/jobs?status=queued&page=2&per_page=3').get_json()
+        self.assertEqual([j['id'] for j in last['jobs']],
+                         [j.id for j in PrintJob.query.filter_by(status=JobStatus.QUEUED).order_by(PrintJob.id)][3:])
+        self.assertEqual(self.client.get('/operator/api/jobs?status=done').status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import os
+import shutil
+import tempfile
+import unittest
+from app import create_app, db
+from app.models import (User, Order, PrintJob, Printer, Plate, OrderStatus, JobStatus,
+                        PrinterStatus, PlateStatus)
+from app.services.nesting import build_plates, plate_layout, PlatePacker
+from app.services.workflow import assign_plate, start_plate, finish_plate, fail_plate, retry_job
+from stl_fixtures import box_stl
+
+class TestNesting(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.upload_dir = tempfile.mkdtemp()
+        self.app.config['UPLOAD_FOLDER'] = self.upload_dir
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.user = User(email='op@test.com', name='Operator')
+        db.session.add(self.user)
+        self.printer = Printer(name='P1', status=PrinterStatus.IDLE, bed_width_mm=200, bed_depth_mm=200)
+        db.session.add(self.printer)
+        db.session.commit()
+
+        self.order = Order(customer_user_id=self.user.id, status=OrderStatus.NEW)
+        db.session.add(self.order)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.upload_dir)
+
+    def _job(self, name, w, d, material='PLA', color='Black', quantity=1):
+        with open(os.path.join(self.upload_dir, name), 'wb') as f:
+            f.write(box_stl(w, d, 10))
+        job = PrintJob(order_id=self.order.id, stl_path=f'uploads/{name}', original_filename=name,
+                       material_type=material, color=color, quantity=quantity,
+                       estimated_material_grams=10, status=JobStatus.WAITING)
+        db.session.add(job)
+        db.session.commit()
+        return job
+
+    def test_packer_places_all_units_or_none(self):
+        packer = PlatePacker(100, 100)
+        self.assertTrue(packer.try_add(1, 40, 40, 4))
+        self.assertFalse(packer.try_add(2, 40, 40, 1))
+        self.assertEqual(len(packer.placements), 4)
+        # No overlaps on the bed
+        for i, a in enumerate(packer.placements):
+            self.assertLessEqual(a['x'] + a['w'], 100)
+            self.assertLessEqual(a['y'] + a['d'], 100)
+            for b in packer.placements[i + 1:]:
+                overlap = (a['x'] < b['x'] + b['w'] and b['x'] < a['x'] + a['w'] and
+                           a['y'] < b['y'] + b['d'] and b['y'] < a['y'] + a['d'])
+                self.assertFalse(overlap)
+
+    def test_build_plates_groups_same_spool(self):
+        a = self._job('a.stl', 50, 50)
+        b = self._job('b.stl', 30, 60, quantity=2)
+        other = self._job('c.stl', 40, 40, color='Red')
+        big = self._job('big.stl', 180, 180)
+
+        plates = build_plates(200, 200, self.user.id)
+        self.assertEqual(len(plates), 1)
+        plate = plates[0]
+        self.assertEqual({j.id for j in plate.jobs}, {a.id, b.id})
+        self.assertEqual(len(plate_layout(plate)), 3)
+        self.assertIsNone(other.plate_id)  # alone in its color
+        self.assertIsNone(big.plate_id)    # too big to share a bed
+
+    def test_plate_runs_as_one_unit(self):
+        a = self._job('a.stl', 50, 50)
+        b = self._job('b.stl', 50, 50)
+        plate = build_plates(200, 200, self.user.id)[0]
+
+        assign_plate(plate, self.printer.id, self.user.id)
+        self.assertEqual(plate.status, PlateStatus.QUEUED)
+        self.assertTrue(all(j.assigned_printer_id == self.printer.id for j in (a, b)))
+
+        start_plate(plate, self.user.id)
+        self.assertTrue(all(j.status == JobStatus.PRINTING for j in (a, b)))
+
+        finish_plate(plate, self.user.id)
+        self.assertTrue(all(j.status == JobStatus.DONE for j in (a, b)))
+        self.assertEqual(self.printer.status, PrinterStatus.IDLE)
+        self.assertEqual(self.order.status, OrderStatus.DONE)
+
+    def test_failed_plate_jobs_retry_individually(self):
+        a = self._job('a.stl', 50, 50)
+        self._job('b.stl', 50, 50)
+        plate = build_plates(200, 200, self.user.id)[0]
+        assign_plate(plate, self.printer.id, self.user.id)
+        start_plate(plate, self.user.id)
+        fail_plate(plate, self.user.id)
+
+        self.assertEqual(a.status, JobStatus.FAILED)
+        self.assertEqual(self.printer.status, PrinterStatus.MAINTENANCE)
+        retry_job(a, self.user.id)
+        self.assertIsNone(a.plate_id)
+
+    def test_plate_must_be_printing_to_finish(self):
+        a = self._job('a.stl', 50, 50)
+        self._job('b.stl', 50, 50)
+        plate = build_plates(200, 200, self.user.id)[0]
+        with self.assertRaises(ValueError):
+            finish_plate(plate, self.user.id)
+        assign_plate(plate, self.printer.id, self.user.id)
+        with self.assertRaises(ValueError):
+            finish_plate(plate, self.user.id)
+        self.assertEqual(plate.status, PlateStatus.QUEUED)
+        self.assertNotEqual(a.status, JobStatus.DONE)
+
+    def test_only_queued_or_printing_plates_can_fail(self):
+        a = self._job('a.stl', 50, 50)
+        self._job('b.stl', 50, 50)
+        plate = build_plates(200, 200, self.user.id)[0]
+        with self.assertRaises(ValueError):
+            fail_plate(plate, self.user.id)
+        self.assertEqual(plate.status, PlateStatus.PLANNED)
+        assign_plate(plate, self.printer.id, self.user.id)
+        start_plate(plate, self.user.id)
+        finish_plate(plate, self.user.id)
+        with self.assertRaises(ValueError):
+            fail_plate(plate, self.user.id)
+        self.assertEqual(plate.status, PlateStatus.DONE)
+        self.assertEqual(a.status, JobStatus.DONE)
+
+    def test_plate_must_fit_bed(self):
+        self._job('a.stl', 50, 50)
+        self._job('b.stl', 50, 50)
+        plate = build_plates(200, 200, self.user.id)[0]
+        small = Printer(name='Mini', status=PrinterStatus.IDLE, bed_width_mm=120, bed_depth_mm=120)
+        db.session.add(small)
+        db.session.commit()
+        with self.assertRaises(ValueError):
+            assign_plate(plate, small.id, self.user.id)
+
+if __name__ == '__main__':
+    unittest.main()
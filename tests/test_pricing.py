@@ -0,0 +1,129 @@
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+
+import numpy as np
+
+from app import create_app, db
+from app.models import User, Order, PricingRule, PricingRuleKind, UserRole
+from app.services import pricing
+from app.services.pricing import calculate_estimate, price_lines, rate_table
+
+class TestPricing(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        pricing._compiled.clear()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _rule(self, **kwargs):
+        rule = PricingRule(**kwargs)
+        db.session.add(rule)
+        db.session.commit()
+        return rule
+
+    def test_defaults_without_rules(self):
+        # (50g x 0.50 + 60min x 0.10 + 5.00 base) x 2
+        self.assertEqual(calculate_estimate(50, 60, 2), 72.0)
+
+    def test_rules_apply(self):
+        self._rule(kind=PricingRuleKind.MATERIAL, material_type='PETG', rate_per_gram=1.0)
+        self._rule(kind=PricingRuleKind.QUANTITY_BREAK, min_quantity=10, percent=10)
+        self._rule(kind=PricingRuleKind.QUANTITY_BREAK, min_quantity=100, percent=25)
+        self._rule(kind=PricingRuleKind.RUSH, percent=50)
+        customer = User(email='c@test.com', name='C', role=UserRole.CUSTOMER)
+        db.session.add(customer)
+        db.session.commit()
+        self._rule(kind=PricingRuleKind.CUSTOMER, customer_user_id=customer.id, percent=20)
+
+        self.assertEqual(calculate_estimate(50, 60, 1, 'PETG'), 61.0)
+        self.assertEqual(calculate_estimate(50, 60, 1, 'PLA'), 36.0)
+        self.assertEqual(calculate_estimate(50, 60, 10, 'PLA'), 324.0)
+        self.assertEqual(calculate_estimate(50, 60, 100, 'PLA'), 2700.0)
+        self.assertEqual(calculate_estimate(50, 60, 1, 'PLA', rush=True), 54.0)
+        self.assertEqual(calculate_estimate(50, 60, 1, 'PLA', customer_id=customer.id), 28.8)
+
+    def test_compiled_table_is_reused_until_a_rule_changes(self):
+        table = rate_table()
+        self.assertIs(rate_table(), table)
+
+        rule = self._rule(kind=PricingRuleKind.MATERIAL, rate_per_gram=1.0)
+        self.assertEqual(calculate_estimate(50, 60, 1), 61.0)
+        table = rate_table()
+        self.assertIs(rate_table(), table)
+
+        rule.active = False
+        db.session.commit()
+        self.assertEqual(calculate_estimate(50, 60, 1), 36.0)
+        db.session.delete(rule)
+        db.session.commit()
+        self.assertIsNot(rate_table(), table)
+
+    def test_batch_matches_single_lines(self):
+        self._rule(kind=PricingRuleKind.MATERIAL, material_type='ABS', rate_per_minute=0.2, base_fee=7)
+        self._rule(kind=PricingRuleKind.QUANTITY_BREAK, min_quantity=5, percent=5)
+        rng = np.random.default_rng(0)
+        grams = rng.uniform(1, 500, 1000).round(1)
+        minutes = rng.integers(5, 900, 1000)
+        quantity = rng.integers(1, 12, 1000)
+        materials = rng.choice(['PLA', 'PETG', 'ABS'], 1000).tolist()
+
+        # Speed is measured by scripts/bench_pricing.py
+        batch = price_lines(grams, minutes, quantity, materials)
+        singles = [calculate_estimate(g, m, q, mat) for g, m, q, mat in zip(grams, minutes, quantity, materials)]
+        np.testing.assert_allclose(batch, singles)
+
+class TestPricingRoutes(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.upload_dir = tempfile.mkdtemp()
+        self.app.config['UPLOAD_FOLDER'] = self.upload_dir
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        pricing._compiled.clear()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.upload_dir)
+
+    def _login(self, role):
+        user = User(email=f'{role}@test.com', name=role, role=role)
+        user.set_password('password')
+        db.session.add(user)
+        db.session.commit()
+        self.client.post('/auth/login', data={'email': user.email, 'password': 'password'})
+        return user
+
+    def test_admin_adds_rule(self):
+        self._login(UserRole.ADMIN)
+        self.client.post('/admin/pricing', data={'kind': PricingRuleKind.RUSH, 'percent': '30'})
+        self.assertEqual(PricingRule.query.one().percent, 30)
+        self.client.post('/admin/pricing', data={'kind': PricingRuleKind.QUANTITY_BREAK, 'percent': '30'})
+        self.assertEqual(PricingRule.query.count(), 1)
+        self.assertIn(b'Rush surcharge: 30%', self.client.get('/admin/pricing').data)
+
+    def test_rush_order_is_priced_with_surcharge(self):
+        db.session.add(PricingRule(kind=PricingRuleKind.RUSH, percent=50))
+        db.session.commit()
+        self._login(UserRole.CUSTOMER)
+        self.client.post('/customer/order/new', data={
+            'stl_files': (BytesIO(b'not a mesh'), 'part.stl'),
+            'material_type': 'PLA', 'color': 'Black', 'quantity': 1, 'rush': 'y'})
+        order = Order.query.one()
+        self.assertTrue(order.priority)
+        # Placeholder 50g / 60min: 36.00 plus 50%
+        self.assertEqual(float(order.total_estimated_price), 54.0)
+
+if __name__ == '__main__':
+    unittest.main()
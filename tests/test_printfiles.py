@@ -0,0 +1,171 @@
+import math
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from io import BytesIO
+
+from app import create_app, db
+from app.models import User, Order, Task, UserRole, AnalysisStatus
+from app.services.geometry import estimate_from_metrics, MATERIAL_DENSITY
+from app.services.printfiles import scan_gcode, analyze_3mf, load_3mf_triangles, PrintFileError
+from app.services.tasks import run_pending
+from stl_fixtures import cube_3mf, edit_3mf_model
+
+PRUSA_GCODE = b"""; generated by PrusaSlicer 2.6.0
+G90
+M83
+G1 X10 Y10 E1.5 F1200
+; filament used [mm] = 1234.50
+; filament used [cm3] = 2.97
+; estimated printing time (normal mode) = 1h 2m 3s
+; estimated printing time (silent mode) = 2h 0m 0s
+; filament_diameter = 1.75
+"""
+
+CURA_GCODE = b""";FLAVOR:Marlin
+;TIME:5400
+;Filament used: 2.5m
+G1 X5 Y5 E1 F600
+"""
+
+# A 10 x 10 square, 1mm of filament per side, then a full circle of radius 5
+UNSLICED_GCODE = b"""G21
+G90
+M82
+G28
+G1 Z0.2 F600
+G1 X10 Y10 F6000
+G1 X20 Y10 E1 F600
+G1 X20 Y20 E2
+G1 X10 Y20 E3
+G1 X10 Y10 E4
+G1 E3 F2400 ; retract
+G92 E0
+G4 P500
+G2 X10 Y10 I5 J0 E2 F600
+"""
+
+class TestGcode(unittest.TestCase):
+    def test_prusa_header(self):
+        m = scan_gcode(BytesIO(PRUSA_GCODE))
+        self.assertEqual(m['sliced_seconds'], 3723)
+        self.assertEqual(m['filament_length_mm'], 1234.5)
+        self.assertAlmostEqual(m['filament_mm3'], 2970)
+
+    def test_cura_header(self):
+        m = scan_gcode(BytesIO(CURA_GCODE))
+        self.assertEqual(m['sliced_seconds'], 5400)
+        self.assertEqual(m['filament_length_mm'], 2500)
+        self.assertAlmostEqual(m['filament_mm3'], 2500 * math.pi * 0.875 ** 2)
+
+    def test_moves_are_summed_without_header(self):
+        m = scan_gcode(BytesIO(UNSLICED_GCODE))
+        self.assertAlmostEqual(m['filament_length_mm'], 6)
+        # 4 sides and a full arc at 10 mm/s, travel at 100 mm/s, a retract and a dwell
+        expected = (0.2 / 10 + math.hypot(10, 10) / 100 + 40 / 10 + 1 / 40 + 0.5
+                    + 2 * math.pi * 5 / 10)
+        self.assertAlmostEqual(m['sliced_seconds'], expected, places=3)
+        self.assertEqual(m['size_mm'][:2], [10, 10])
+
+    def test_no_moves(self):
+        with self.assertRaises(PrintFileError):
+            scan_gcode(BytesIO(b'; just a comment\nM104 S200\n'))
+
+    def test_estimate_uses_sliced_numbers(self):
+        m = scan_gcode(BytesIO(PRUSA_GCODE))
+        grams, minutes = estimate_from_metrics(m, 'PETG', profile='fast')
+        self.assertEqual(grams, round(2.97 * MATERIAL_DENSITY['PETG'], 1))
+        self.assertEqual(minutes, 62)
+
+class TestThreeMF(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _write(self, content, name='part.3mf'):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_mesh_metrics(self):
+        m = analyze_3mf(self._write(cube_3mf(20)))
+        self.assertAlmostEqual(m['volume_mm3'], 8000, places=2)
+        self.assertEqual(m['size_mm'], [20, 20, 20])
+        self.assertEqual(load_3mf_triangles(self._write(cube_3mf(20))).shape, (12, 3, 3))
+
+    def test_units(self):
+        m = analyze_3mf(self._write(cube_3mf(2, unit='centimeter')))
+        self.assertAlmostEqual(m['volume_mm3'], 8000, places=2)
+
+    def test_embedded_gcode_wins(self):
+        m = analyze_3mf(self._write(cube_3mf(20, gcode=PRUSA_GCODE)))
+        self.assertEqual(m['source'], 'gcode')
+        self.assertEqual(m['sliced_seconds'], 3723)
+
+    def test_not_a_zip(self):
+        with self.assertRaises(PrintFileError):
+            analyze_3mf(self._write(b'solid nope'))
+
+    def test_malformed_numbers(self):
+        for old, new in ((b'x="20"', b'x="1e"'), (b'v1="0"', b'v1="a"'), (b'v1="0"', b'v1="1.5"')):
+            path = self._write(edit_3mf_model(cube_3mf(20), old, new))
+            with self.assertRaises(PrintFileError):
+                analyze_3mf(path)
+            with self.assertRaises(PrintFileError):
+                load_3mf_triangles(path)
+
+    def test_corrupt_deflate_data(self):
+        data = bytearray(cube_3mf(20))
+        with zipfile.ZipFile(BytesIO(bytes(data))) as zf:
+            info = zf.getinfo('3D/3dmodel.model')
+        start = info.header_offset + 30 + len(info.filename.encode()) + len(info.extra)
+        data[start:start + info.compress_size] = b'\xff' * info.compress_size
+        with self.assertRaises(PrintFileError):
+            analyze_3mf(self._write(bytes(data)))
+
+class TestSlicedUpload(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.upload_dir = tempfile.mkdtemp()
+        self.app.config['UPLOAD_FOLDER'] = self.upload_dir
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        customer = User(email='cust@test.com', name='Customer', role=UserRole.CUSTOMER)
+        customer.set_password('password')
+        db.session.add(customer)
+        db.session.commit()
+
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'email': 'cust@test.com', 'password': 'password'})
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.upload_dir)
+
+    def test_gcode_and_3mf_orders_get_exact_estimates(self):
+        self.client.post('/customer/order/new', data={
+            'stl_files': [(BytesIO(PRUSA_GCODE), 'bracket.gcode'), (BytesIO(cube_3mf(20)), 'cube.3mf')],
+            'material_type': 'PLA', 'color': 'Black', 'quantity': 1})
+        order = Order.query.first()
+        gcode_job, mesh_job = order.jobs
+        # Only the mesh gets a thumbnail
+        self.assertEqual(Task.query.filter_by(kind='render_thumbnail').count(), 1)
+
+        run_pending()
+        self.assertEqual(gcode_job.analysis_status, AnalysisStatus.DONE)
+        self.assertEqual(gcode_job.estimated_time_minutes, 62)
+        self.assertEqual(gcode_job.estimated_material_grams, round(2.97 * MATERIAL_DENSITY['PLA'], 1))
+        self.assertEqual(mesh_job.analysis_status, AnalysisStatus.DONE)
+        self.assertNotEqual(mesh_job.estimated_material_grams, 50)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import User, Order, PricingRule, PricingRuleKind, UserRole
+from app.services import pricing, quotes, uploads
+from app.services.tasks import run_pending
+from stl_fixtures import cube_stl
+
+class TestQuotes(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.upload_dir = tempfile.mkdtemp()
+        self.app.config['UPLOAD_FOLDER'] = self.upload_dir
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        pricing._compiled.clear()
+        quotes.quote_line.cache_clear()
+
+        for email in ('cust@test.com', 'other@test.com'):
+            user = User(email=email, name='Customer', role=UserRole.CUSTOMER)
+            user.set_password('password')
+            db.session.add(user)
+        db.session.commit()
+        self.customer = User.query.filter_by(email='cust@test.com').one()
+
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'email': 'cust@test.com', 'password': 'password'})
+        self.sha = self._upload(self.customer, cube_stl(30))
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.upload_dir)
+
+    def _upload(self, user, content, name='cube.stl'):
+        upload = uploads.create_upload(user.id, name, len(content))
+        path = uploads.partial_path(upload)
+        with open(path, 'wb') as f:
+            f.write(content)
+        upload.received_bytes = len(content)
+        return uploads.complete_upload(upload).file_hash
+
+    def _quote(self, **body):
+        return self.client.post('/customer/quote', json=dict({'material_type': 'PLA', 'quantity': 1}, **body))
+
+    def test_quote_matches_order_price_and_writes_nothing(self):
+        statements = []
+        engine = db.engine
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement.split()[0].upper())
+
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            response = self._quote(files=[self.sha], quantity=3)
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(statements), {'SELECT'})
+        self.assertEqual(Order.query.count(), 0)
+        quoted = response.get_json()
+
+        upload_id = uploads.Upload.query.one().id
+        self.client.post('/customer/order/new', data={'upload_ids': upload_id, 'material_type': 'PLA',
+                                                      'color': 'Black', 'quantity': 3})
+        run_pending()
+        order = Order.query.one()
+        self.assertEqual(quoted['total'], float(order.total_estimated_price))
+        self.assertEqual(quoted['lines'][0]['estimated_time_minutes'], order.jobs[0].estimated_time_minutes)
+
+    def test_repeat_quotes_are_cached_until_prices_change(self):
+        first = self._quote(files=[self.sha]).get_json()
+        hits = quotes.quote_line.cache_info().hits
+        self.assertEqual(self._quote(files=[self.sha]).get_json(), first)
+        self.assertEqual(quotes.quote_line.cache_info().hits, hits + 1)
+
+        db.session.add(PricingRule(kind=PricingRuleKind.MATERIAL, rate_per_gram=2.0))
+        db.session.commit()
+        self.assertGreater(self._quote(files=[self.sha]).get_json()['total'], first['total'])
+
+    def test_only_own_files(self):
+        other = User.query.filter_by(email='other@test.com').one()
+        theirs = self._upload(other, cube_stl(20), 'theirs.stl')
+        self.assertEqual(self._quote(files=[theirs]).status_code, 404)
+        self.assertEqual(self._quote(files=['0' * 64]).status_code, 404)
+
+    def test_bad_requests(self):
+        self.assertEqual(self._quote(files=[self.sha], material_type='Gold').status_code, 400)
+        self.assertEqual(self._quote(files=[self.sha], quantity=0).status_code, 400)
+        self.assertEqual(self._quote(files=['nope']).status_code, 400)
+        self.assertEqual(self._quote(files=[]).status_code, 400)
+
+    def test_unreadable_file_is_reported_per_line(self):
+        bad = self._upload(self.customer, b'not a mesh at all', 'bad.stl')
+        body = self._quote(files=[self.sha, bad]).get_json()
+        self.assertIn('price', body['lines'][0])
+        self.assertIn('error', body['lines'][1])
+        self.assertEqual(body['total'], body['lines'][0]['price'])
+
+if __name__ == '__main__':
+    unittest.main()
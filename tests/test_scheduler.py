@@ -0,0 +1,108 @@
+import unittest
+from app import create_app, db
+from app.models import User, Order, PrintJob, Printer, OrderStatus, JobStatus, PrinterStatus, AuditLog
+from app.services.scheduler import build_plan, run_scheduler, get_waiting_jobs
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.user = User(email='op@test.com', name='Operator')
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _order(self, priority=False, status=OrderStatus.NEW):
+        o = Order(customer_user_id=self.user.id, priority=priority, status=status)
+        db.session.add(o)
+        db.session.commit()
+        return o
+
+    def _job(self, order, material='PLA', color='Black', minutes=60, quantity=1):
+        j = PrintJob(order_id=order.id, stl_path='x.stl', original_filename='x.stl',
+                     material_type=material, color=color, estimated_time_minutes=minutes,
+                     quantity=quantity, status=JobStatus.WAITING)
+        db.session.add(j)
+        db.session.commit()
+        return j
+
+    def _printers(self, n):
+        printers = [Printer(name=f'P{i}', status=PrinterStatus.IDLE) for i in range(n)]
+        db.session.add_all(printers)
+        db.session.commit()
+        return printers
+
+    def test_priority_orders_go_first(self):
+        normal = self._job(self._order())
+        rush = self._job(self._order(priority=True))
+        self._printers(1)
+
+        assigned = run_scheduler(self.user.id)
+        self.assertEqual([j.id for j, p in assigned], [rush.id])
+        self.assertEqual(rush.status, JobStatus.QUEUED)
+        self.assertEqual(normal.status, JobStatus.WAITING)
+
+    def test_review_orders_are_not_scheduled(self):
+        self._job(self._order(status=OrderStatus.REVIEW))
+        self._printers(1)
+        self.assertEqual(get_waiting_jobs(), [])
+        self.assertEqual(run_scheduler(self.user.id), [])
+
+    def test_same_spool_jobs_share_a_lane(self):
+        o = self._order()
+        a1 = self._job(o, 'PLA', 'Black', minutes=30)
+        b1 = self._job(o, 'PETG', 'Grey', minutes=30)
+        a2 = self._job(o, 'PLA', 'Black', minutes=30)
+        b2 = self._job(o, 'PETG', 'Grey', minutes=30)
+        printers = self._printers(2)
+
+        plan = build_plan(get_waiting_jobs(), printers)
+        lanes = [[j.id for j in lane['jobs']] for lane in plan]
+        self.assertIn([a1.id, a2.id], lanes)
+        self.assertIn([b1.id, b2.id], lanes)
+
+    def test_load_is_balanced_by_estimated_time(self):
+        o = self._order()
+        long_job = self._job(o, minutes=600)
+        short_jobs = [self._job(o, minutes=60) for _ in range(3)]
+        printers = self._printers(2)
+
+        plan = build_plan(get_waiting_jobs(), printers)
+        long_lane = next(l for l in plan if long_job in l['jobs'])
+        other_lane = next(l for l in plan if l is not long_lane)
+        self.assertEqual(long_lane['jobs'], [long_job])
+        self.assertEqual(other_lane['jobs'], short_jobs)
+
+    def test_plan_is_applied_in_one_pass(self):
+        o = self._order()
+        jobs = [self._job(o) for _ in range(5)]
+        printers = self._printers(3)
+
+        assigned = run_scheduler(self.user.id)
+        self.assertEqual(len(assigned), 3)
+        for p in printers:
+            self.assertIsNotNone(p.current_job_id)
+        self.assertEqual(sum(1 for j in jobs if j.status == JobStatus.WAITING), 2)
+        self.assertEqual(AuditLog.query.filter_by(action='auto_assign').count(), 3)
+
+        # Nothing idle left, so a second tick is a no-op
+        self.assertEqual(run_scheduler(self.user.id), [])
+
+    def test_spare_printers_split_big_jobs(self):
+        job = self._job(self._order(), quantity=6)
+        self._printers(3)
+
+        assigned = run_scheduler(self.user.id)
+        self.assertEqual(len(assigned), 3)
+        self.assertEqual(sum(j.quantity for j, p in assigned), 6)
+        self.assertIn(job, [j for j, p in assigned])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+from datetime import datetime, timedelta
+from app import create_app, db
+from app.models import User, Order, PrintJob, Printer, OrderStatus, JobStatus, PrinterStatus
+from app.services.sequencing import (sequence_jobs, sequence_report, changeover_minutes,
+                                     MATERIAL_SWAP_MINUTES, COLOR_SWAP_MINUTES)
+from app.services.scheduler import plan_current_queue
+from app.services.workflow import start_job
+
+class TestSequencing(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.user = User(email='op@test.com', name='Operator')
+        db.session.add(self.user)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _job(self, material, color, priority=False, due_date=None, minutes=60):
+        o = Order(customer_user_id=self.user.id, priority=priority, due_date=due_date, status=OrderStatus.NEW)
+        db.session.add(o)
+        db.session.flush()
+        j = PrintJob(order_id=o.id, stl_path='x.stl', original_filename='x.stl',
+                     material_type=material, color=color, estimated_time_minutes=minutes,
+                     status=JobStatus.WAITING)
+        db.session.add(j)
+        db.session.commit()
+        return j
+
+    def test_changeover_costs(self):
+        self.assertEqual(changeover_minutes(None, ('PLA', 'Black')), 0)
+        self.assertEqual(changeover_minutes(('PLA', 'Black'), ('PLA', 'Black')), 0)
+        self.assertEqual(changeover_minutes(('PLA', 'Black'), ('PLA', 'Red')), COLOR_SWAP_MINUTES)
+        self.assertEqual(changeover_minutes(('PLA', 'Black'), ('PETG', 'Black')), MATERIAL_SWAP_MINUTES)
+
+    def test_groups_by_spool_and_beats_fifo(self):
+        jobs = [self._job('PLA', 'Black'), self._job('PETG', 'Grey'),
+                self._job('PLA', 'Black'), self._job('PETG', 'Grey')]
+
+        report = sequence_report(jobs, loaded_spool=('PLA', 'Black'))
+        self.assertEqual(report['sequence'], [jobs[0], jobs[2], jobs[1], jobs[3]])
+        self.assertEqual(report['swaps'], 1)
+        self.assertEqual(report['fifo_swaps'], 3)
+        self.assertEqual(report['minutes_saved'], 2 * MATERIAL_SWAP_MINUTES)
+
+    def test_rush_jobs_are_not_deferred_for_spool(self):
+        normal = self._job('PLA', 'Black')
+        rush = self._job('PETG', 'Grey', priority=True)
+        self.assertEqual(sequence_jobs([normal, rush], loaded_spool=('PLA', 'Black')), [rush, normal])
+
+    def test_due_date_is_respected(self):
+        now = datetime.utcnow()
+        tight = self._job('PETG', 'Grey', due_date=now + timedelta(minutes=90))
+        loose = self._job('PLA', 'Black', due_date=now + timedelta(days=2))
+        # Running the loaded spool first would finish the tight job at 60+15+60 > 90
+        self.assertEqual(sequence_jobs([loose, tight], ('PLA', 'Black'), now=now), [tight, loose])
+
+        relaxed = self._job('PETG', 'Grey', due_date=now + timedelta(hours=5))
+        self.assertEqual(sequence_jobs([loose, relaxed], ('PLA', 'Black'), now=now), [loose, relaxed])
+
+    def test_start_job_records_loaded_spool(self):
+        printer = Printer(name='P1', status=PrinterStatus.IDLE)
+        db.session.add(printer)
+        db.session.commit()
+        job = self._job('PETG', 'Grey')
+        job.assigned_printer_id = printer.id
+        db.session.commit()
+
+        start_job(job, self.user.id)
+        self.assertEqual((printer.loaded_material, printer.loaded_color), ('PETG', 'Grey'))
+
+    def test_scheduler_prefers_printer_with_matching_spool(self):
+        p1 = Printer(name='P1', status=PrinterStatus.IDLE, loaded_material='PLA', loaded_color='Black')
+        p2 = Printer(name='P2', status=PrinterStatus.IDLE, loaded_material='PETG', loaded_color='Grey')
+        db.session.add_all([p1, p2])
+        db.session.commit()
+        petg = self._job('PETG', 'Grey')
+        pla = self._job('PLA', 'Black')
+
+        plan = {lane['printer'].id: lane['jobs'] for lane in plan_current_queue()}
+        self.assertEqual(plan[p1.id], [pla])
+        self.assertEqual(plan[p2.id], [petg])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+from datetime import datetime, timedelta
+from app import create_app, db
+from app.models import User, Order, PrintJob, Printer, OrderStatus, JobStatus, PrinterStatus, UserRole
+from app.services.simulation import snapshot_farm, simulate, what_if, clear_eta_cache
+
+class TestSimulation(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        clear_eta_cache()
+
+        self.customer = User(email='cust@test.com', name='Customer', role=UserRole.CUSTOMER)
+        self.customer.set_password('password')
+        db.session.add(self.customer)
+        db.session.add_all([Printer(name=f'P{i}', status=PrinterStatus.IDLE) for i in range(2)])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _order(self, n_jobs, minutes=60, status=OrderStatus.NEW):
+        o = Order(customer_user_id=self.customer.id, status=status)
+        db.session.add(o)
+        db.session.flush()
+        for _ in range(n_jobs):
+            db.session.add(PrintJob(order_id=o.id, stl_path='x.stl', original_filename='x.stl',
+                                    material_type='PLA', color='Black',
+                                    estimated_time_minutes=minutes, status=JobStatus.WAITING))
+        db.session.commit()
+        return o
+
+    def test_eta_follows_queue(self):
+        first = self._order(2)
+        second = self._order(2)
+        result = simulate(snapshot_farm(), iterations=500, seed=1)
+
+        # Two printers, 60 min jobs: first order ~1h, second ~2h
+        self.assertAlmostEqual(result['orders'][first.id].mean(), 60, delta=15)
+        self.assertAlmostEqual(result['orders'][second.id].mean(), 120, delta=20)
+
+    def test_printing_job_remaining_time_uses_start(self):
+        order = self._order(2, minutes=60, status=OrderStatus.PRINTING)
+        started, legacy = order.jobs
+        printers = Printer.query.order_by(Printer.id).all()
+        for job, printer in zip(order.jobs, printers):
+            job.status, job.assigned_printer_id = JobStatus.PRINTING, printer.id
+        started.started_at = datetime.utcnow() - timedelta(minutes=45)
+        db.session.commit()
+
+        bound = {job_id: minutes for _, minutes, job_id, _ in snapshot_farm()['bound']}
+        self.assertAlmostEqual(bound[started.id], 15, delta=0.5)
+        # No start time recorded: assumed half done
+        self.assertEqual(bound[legacy.id], 30)
+
+    def test_failures_push_eta_out(self):
+        self._order(4)
+        failed = self._order(1, status=OrderStatus.PRINTING)
+        failed.jobs[0].status = JobStatus.FAILED
+        db.session.commit()
+
+        snap = snapshot_farm()
+        self.assertEqual(snap['failure_rate'], 1.0)
+        snap_ok = dict(snap, failure_rate=0.0)
+        slow = simulate(snap, iterations=500, seed=1)['makespan'].mean()
+        fast = simulate(snap_ok, iterations=500, seed=1)['makespan'].mean()
+        self.assertGreater(slow, fast)
+
+    def test_what_if_does_not_touch_db(self):
+        self._order(10)
+        printers_before = Printer.query.count()
+        result = what_if(extra_printers=5, iterations=200, seed=1)
+
+        self.assertLess(result['what_if']['p50_minutes'], result['current']['p50_minutes'])
+        self.assertEqual(Printer.query.count(), printers_before)
+        self.assertFalse(db.session.dirty or db.session.new)
+
+    def test_thousands_of_iterations(self):
+        # Speed is measured by scripts/bench_simulation.py
+        for _ in range(30):
+            self._order(10)
+        result = simulate(snapshot_farm(), iterations=2000, seed=1)
+        self.assertEqual(len(result['jobs']), 300)
+        self.assertEqual(result['makespan'].shape, (2000,))
+
+    def test_order_detail_shows_eta(self):
+        order = self._order(1)
+        client = self.app.test_client()
+        client.post('/auth/login', data={'email': 'cust@test.com', 'password': 'password'})
+        response = client.get(f'/customer/orders/{order.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Est. Ready', response.data)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+from app import create_app, db
+from app.models import User, Order, PrintJob, StoredFile, Task, UserRole, AnalysisStatus
+from app.services.tasks import run_pending
+from app.services.workflow import split_job
+from stl_fixtures import cube_stl
+
+class TestContentAddressedStorage(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.upload_dir = tempfile.mkdtemp()
+        self.app.config['UPLOAD_FOLDER'] = self.upload_dir
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.customer = User(email='cust@test.com', name='Customer', role=UserRole.CUSTOMER)
+        self.customer.set_password('password')
+        db.session.add(self.customer)
+        db.session.commit()
+
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'email': 'cust@test.com', 'password': 'password'})
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.upload_dir)
+
+    def _upload(self, content, name='bracket.stl', material='PLA'):
+        data = {
+            'stl_files': (BytesIO(content), name),
+            'material_type': material,
+            'color': 'Black',
+            'quantity': 2
+        }
+        self.client.post('/customer/order/new', data=data)
+        return Order.query.order_by(Order.id.desc()).first()
+
+    def _stored_files_on_disk(self):
+        return [f for _, _, files in os.walk(self.upload_dir) for f in files]
+
+    def test_identical_uploads_are_stored_once(self):
+        first = self._upload(cube_stl(30))
+        second = self._upload(cube_stl(30), name='same_bracket_renamed.stl')
+        self._upload(cube_stl(40))
+
+        self.assertEqual(StoredFile.query.count(), 2)
+        self.assertEqual(len(self._stored_files_on_disk()), 2)
+        a, b = first.jobs[0], second.jobs[0]
+        self.assertEqual(a.stl_path, b.stl_path)
+        self.assertEqual(db.session.get(StoredFile, 1).ref_count, 2)
+
+    def test_repeat_upload_is_quoted_from_cache(self):
+        first = self._upload(cube_stl(30))
+        run_pending()
+        self.assertIsNotNone(StoredFile.query.first().analysis_json)
+
+        second = self._upload(cube_stl(30), material='ABS')
+        job = second.jobs[0]
+        self.assertEqual(job.analysis_status, AnalysisStatus.DONE)
+        self.assertEqual(Task.query.filter_by(kind='analyze_job').count(), 1)
+        # Cached geometry, but material-specific estimate
+        self.assertLess(job.estimated_material_grams, first.jobs[0].estimated_material_grams)
+        self.assertEqual(job.estimated_time_minutes, first.jobs[0].estimated_time_minutes)
+
+    def test_references_follow_jobs(self):
+        order = self._upload(cube_stl(30))
+        stored = StoredFile.query.first()
+        self.assertEqual(stored.ref_count, 1)
+
+        split_job(order.jobs[0], 2, self.customer.id)
+        db.session.refresh(stored)
+        self.assertEqual(stored.ref_count, 2)
+
+        self.client.post(f'/customer/order/{order.id}/confirm', data={'action': 'cancel'})
+        db.session.refresh(stored)
+        self.assertEqual(stored.ref_count, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from io import BytesIO
+from werkzeug.datastructures import FileStorage
+from app import create_app, db
+from app.models import User, Order, PrintJob, StoredFile, Upload, OrderStatus, UploadStatus
+from app.services import storage_maintenance
+from app.services.storage import store_upload, get_file_path, GZ_SUFFIX
+from app.services.storage_maintenance import collect_garbage, compress_old_files
+
+class TestStorageMaintenance(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.upload_dir = tempfile.mkdtemp()
+        self.app.config['UPLOAD_FOLDER'] = self.upload_dir
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.user = User(email='cust@test.com', name='Customer')
+        db.session.add(self.user)
+        db.session.commit()
+        # Everything written during the test counts as old enough to collect
+        self.old_grace = storage_maintenance.GRACE_SECONDS
+        storage_maintenance.GRACE_SECONDS = -60
+
+    def tearDown(self):
+        storage_maintenance.GRACE_SECONDS = self.old_grace
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.upload_dir)
+
+    def _write(self, rel_path, content):
+        path = get_file_path(rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def _order_with_file(self, content, status=OrderStatus.NEW, age_days=0):
+        order = Order(customer_user_id=self.user.id, status=status,
+                      created_at=datetime.utcnow() - timedelta(days=age_days))
+        db.session.add(order)
+        db.session.flush()
+        stored = store_upload(FileStorage(BytesIO(content), filename='part.stl'))
+        db.session.add(PrintJob(order_id=order.id, stl_path=stored.rel_path, file_hash=stored.sha256,
+                                original_filename='part.stl', material_type='PLA', color='Black'))
+        db.session.commit()
+        return order, get_file_path(stored.rel_path)
+
+    def test_unreferenced_files_are_collected(self):
+        _, kept = self._order_with_file(b'keep me' * 100)
+        orphan = self._write('uploads/order_7/abc_cancelled.stl', b'x' * 5000)
+        cancelled, dropped = self._order_with_file(b'cancelled order' * 100)
+        db.session.delete(cancelled)
+        db.session.commit()
+
+        report = collect_garbage()
+        self.assertEqual(report['files_deleted'], 2)
+        self.assertEqual(report['bytes_reclaimed'], 5000 + 1500)
+        self.assertTrue(os.path.exists(kept))
+        self.assertFalse(os.path.exists(orphan))
+        self.assertFalse(os.path.exists(dropped))
+        self.assertFalse(os.path.exists(os.path.dirname(orphan)))
+        self.assertEqual(StoredFile.query.count(), 1)
+
+    def test_dry_run_changes_nothing(self):
+        orphan = self._write('uploads/order_7/abc.stl', b'x' * 10)
+        self.assertEqual(collect_garbage(dry_run=True)['files_deleted'], 1)
+        self.assertTrue(os.path.exists(orphan))
+
+    def test_recent_files_survive(self):
+        storage_maintenance.GRACE_SECONDS = 3600
+        orphan = self._write('uploads/order_7/abc.stl', b'x' * 10)
+        collect_garbage()
+        self.assertTrue(os.path.exists(orphan))
+
+    def test_reused_file_is_not_collected(self):
+        storage_maintenance.GRACE_SECONDS = 3600
+        content = b'uploaded twice' * 100
+        cancelled, path = self._order_with_file(content)
+        db.session.delete(cancelled)
+        db.session.commit()
+        old = os.path.getmtime(path) - 2 * 3600
+        os.utime(path, (old, old))
+
+        # The same bytes come in again: the stored copy is reused and its age reset
+        store_upload(FileStorage(BytesIO(content), filename='part.stl'))
+        db.session.commit()
+        self.assertEqual(collect_garbage()['files_deleted'], 0)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(StoredFile.query.count(), 1)
+
+    def test_file_claimed_during_scan_is_kept(self):
+        orphan = self._write('uploads/order_7/abc_late.stl', b'x' * 10)
+        order = Order(customer_user_id=self.user.id)
+        db.session.add(order)
+        db.session.commit()
+        scan = storage_maintenance.iter_files
+
+        def scan_then_claim(root):
+            # A job for this file is committed after referenced_paths() ran
+            db.session.add(PrintJob(order_id=order.id, stl_path='uploads/order_7/abc_late.stl',
+                                    original_filename='late.stl', material_type='PLA', color='Black'))
+            db.session.commit()
+            yield from scan(root)
+
+        storage_maintenance.iter_files = scan_then_claim
+        try:
+            report = collect_garbage()
+        finally:
+            storage_maintenance.iter_files = scan
+        self.assertEqual(report['files_deleted'], 0)
+        self.assertTrue(os.path.exists(orphan))
+
+    def test_in_flight_uploads_are_kept(self):
+        active = Upload(customer_user_id=self.user.id, filename='a.stl', size_bytes=10)
+        stale = Upload(customer_user_id=self.user.id, filename='b.stl', size_bytes=10,
+                       updated_at=datetime.utcnow() - timedelta(days=5))
+        db.session.add_all([active, stale])
+        db.session.commit()
+        active_path = self._write(f'uploads/partial/{active.id}.part', b'12345')
+        stale_path = self._write(f'uploads/partial/{stale.id}.part', b'12345')
+
+        report = collect_garbage()
+        self.assertEqual(report['uploads_abandoned'], 1)
+        self.assertTrue(os.path.exists(active_path))
+        self.assertFalse(os.path.exists(stale_path))
+        self.assertEqual(Upload.query.one().status, UploadStatus.RECEIVING)
+
+    def test_old_orders_are_compressed_and_restored_on_access(self):
+        content = b'solid cube\n' + b'facet normal 0 0 0\n' * 2000
+        old, old_path = self._order_with_file(content, status=OrderStatus.COMPLETED, age_days=90)
+        _, recent_path = self._order_with_file(b'recent' * 1000, status=OrderStatus.COMPLETED, age_days=1)
+        _, active_path = self._order_with_file(b'active' * 1000, status=OrderStatus.PRINTING, age_days=90)
+
+        report = compress_old_files(days=30)
+        self.assertEqual(report['files_compressed'], 1)
+        self.assertGreater(report['bytes_reclaimed'], len(content) // 2)
+        self.assertFalse(os.path.exists(old_path))
+        self.assertTrue(os.path.exists(old_path + GZ_SUFFIX))
+        self.assertTrue(os.path.exists(recent_path))
+        self.assertTrue(os.path.exists(active_path))
+
+        # Compressed files are still referenced, not garbage
+        collect_garbage()
+        self.assertTrue(os.path.exists(old_path + GZ_SUFFIX))
+
+        with open(get_file_path(old.jobs[0].stl_path), 'rb') as f:
+            self.assertEqual(f.read(), content)
+        self.assertFalse(os.path.exists(old_path + GZ_SUFFIX))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+from app import create_app, db
+from app.models import User, Order, PrintJob, Task, UserRole, OrderStatus, AnalysisStatus, TaskStatus
+from app.services import tasks
+from app.services.tasks import enqueue, claim_next, execute_task, run_pending, requeue_running, task_handler
+from app.services.pricing import calculate_estimate
+from stl_fixtures import cube_stl
+
+def job_price(job):
+    return calculate_estimate(job.estimated_material_grams, job.estimated_time_minutes, job.quantity,
+                              job.material_type, job.order.customer_user_id, bool(job.order.priority))
+
+class TestTasks(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.upload_dir = tempfile.mkdtemp()
+        self.app.config['UPLOAD_FOLDER'] = self.upload_dir
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.customer = User(email='cust@test.com', name='Customer', role=UserRole.CUSTOMER)
+        self.customer.set_password('password')
+        db.session.add(self.customer)
+        db.session.commit()
+
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'email': 'cust@test.com', 'password': 'password'})
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.upload_dir)
+
+    def _upload(self, *files):
+        data = {
+            'stl_files': [(BytesIO(content), name) for name, content in files],
+            'material_type': 'PLA',
+            'color': 'Black',
+            'quantity': 1
+        }
+        self.client.post('/customer/order/new', data=data)
+        return Order.query.order_by(Order.id.desc()).first()
+
+    def test_upload_is_analyzed_in_background(self):
+        order = self._upload(('cube.stl', cube_stl(30)), ('bad.stl', b'not an stl'))
+        cube, bad = order.jobs
+        self.assertEqual(cube.analysis_status, AnalysisStatus.PENDING)
+        self.assertEqual(Task.query.filter_by(kind='analyze_job').count(), 2)
+
+        poll = self.client.get(f'/customer/order/{order.id}/analysis').get_json()
+        self.assertEqual(poll['pending'], 2)
+
+        # Two analyses plus a thumbnail for each file
+        self.assertEqual(run_pending(), 4)
+        self.assertEqual(cube.analysis_status, AnalysisStatus.DONE)
+        self.assertNotEqual(cube.estimated_material_grams, 50)
+        # Unreadable files keep the placeholder estimate
+        self.assertEqual(bad.analysis_status, AnalysisStatus.FAILED)
+        self.assertEqual(bad.estimated_material_grams, 50)
+
+        poll = self.client.get(f'/customer/order/{order.id}/analysis').get_json()
+        self.assertEqual(poll['pending'], 0)
+        self.assertAlmostEqual(poll['total_estimated_price'], job_price(cube) + job_price(bad), places=2)
+
+    def test_confirm_waits_for_analysis(self):
+        order = self._upload(('cube.stl', cube_stl(30)))
+        self.client.post(f'/customer/order/{order.id}/confirm', data={'action': 'confirm'})
+        self.assertEqual(order.status, OrderStatus.REVIEW)
+
+        run_pending()
+        self.client.post(f'/customer/order/{order.id}/confirm', data={'action': 'confirm'})
+        db.session.refresh(order)
+        self.assertEqual(order.status, OrderStatus.NEW)
+
+    def test_cancelled_order_task_is_harmless(self):
+        order = self._upload(('cube.stl', cube_stl(30)))
+        self.client.post(f'/customer/order/{order.id}/confirm', data={'action': 'cancel'})
+        run_pending()
+        self.assertEqual(Task.query.first().status, TaskStatus.DONE)
+
+    def test_failing_task_is_retried_then_failed(self):
+        calls = []
+
+        @task_handler('explode')
+        def explode(payload):
+            calls.append(payload)
+            raise RuntimeError('boom')
+
+        try:
+            task = enqueue('explode', {'n': 1})
+            run_pending()
+            self.assertEqual(len(calls), tasks.MAX_ATTEMPTS)
+            self.assertEqual(task.status, TaskStatus.FAILED)
+            self.assertIn('boom', task.error)
+        finally:
+            del tasks.HANDLERS['explode']
+
+    def test_claim_is_exclusive_and_recoverable(self):
+        self._upload(('cube.stl', cube_stl(30)))
+        task_id = claim_next()
+        self.assertIsNotNone(task_id)
+        thumbnail_id = claim_next()
+        self.assertNotIn(thumbnail_id, (None, task_id))
+        self.assertIsNone(claim_next())
+
+        # Worker died mid-task: next worker start puts it back
+        self.assertEqual(requeue_running(), 2)
+        self.assertEqual(claim_next(), task_id)
+        self.assertEqual(execute_task(task_id), TaskStatus.DONE)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import math
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from app import create_app, db
+from app.models import User, Printer, PrinterStatus, UserRole
+from app.services import telemetry
+
+class TestTelemetry(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.tmp = tempfile.mkdtemp()
+        self.app.config['TELEMETRY_FOLDER'] = self.tmp
+        self.app.config['TELEMETRY_TOKEN'] = 'secret'
+        self.app.config['TELEMETRY_CAPACITY'] = 8
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.user = User(email='op@test.com', name='Operator', role=UserRole.OPERATOR)
+        self.user.set_password('password')
+        self.printer = Printer(name='P1', status=PrinterStatus.IDLE)
+        db.session.add_all([self.user, self.printer])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.tmp)
+
+    def post(self, samples, token='secret'):
+        return self.client.post('/telemetry/ingest', json={'samples': samples},
+                                headers={'Authorization': f'Bearer {token}'})
+
+    def test_ring_keeps_newest_samples_in_order(self):
+        ring = telemetry.TelemetryRing(os.path.join(self.tmp, 'ring'), capacity=4)
+        for start in (0, 3, 6):
+            batch = np.zeros(3, dtype=telemetry.SAMPLE_DTYPE)
+            batch['ts'] = np.arange(start, start + 3)
+            ring.append(batch)
+        self.assertEqual(ring.recent()['ts'].tolist(), [5.0, 6.0, 7.0, 8.0])
+        self.assertEqual(ring.recent(2)['ts'].tolist(), [7.0, 8.0])
+
+        # Another process opening the same file sees the same samples
+        reopened = telemetry.TelemetryRing(os.path.join(self.tmp, 'ring'))
+        self.assertEqual(reopened.capacity, 4)
+        self.assertEqual(reopened.recent(1)['ts'].tolist(), [8.0])
+
+    def test_ring_works_without_flock(self):
+        # As on Windows, where fcntl does not exist
+        with mock.patch.object(telemetry, 'fcntl', None):
+            ring = telemetry.TelemetryRing(os.path.join(self.tmp, 'ring'), capacity=4)
+            batch = np.zeros(2, dtype=telemetry.SAMPLE_DTYPE)
+            batch['ts'] = [1.0, 2.0]
+            ring.append(batch)
+            self.assertEqual(ring.recent()['ts'].tolist(), [1.0, 2.0])
+
+    def test_ingest_exposes_latest_sample(self):
+        pid = self.printer.id
+        base = float(int(time.time()) - 1000)
+        response = self.post([
+            {'printer_id': pid, 'ts': base + 200, 'nozzle_c': 215.0, 'bed_c': 60.0, 'progress': 50.0},
+            {'printer_id': pid, 'ts': base + 100, 'nozzle_c': 180.0, 'bed_c': 55.0, 'progress': 10.0},
+            {'printer_id': 999, 'ts': base + 300, 'nozzle_c': 1.0},
+            {'printer_id': pid, 'ts': base + 150, 'nozzle_c': 200.0, 'error_code': 7},
+        ])
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.get_json(), {'accepted': 3, 'rejected': 1})
+
+        # Stored in time order, so the newest reading wins regardless of batch order
+        latest = telemetry.latest_sample(pid, now=base + 210)
+        self.assertEqual(latest, {'ts': base + 200, 'nozzle_c': 215.0, 'bed_c': 60.0, 'progress': 50.0,
+                                  'error_code': 0, 'age_seconds': 10.0})
+        self.assertTrue(math.isnan(telemetry.ring_for(pid).recent()['bed_c'][1]))
+        self.assertEqual(self.printer.status, PrinterStatus.IDLE)
+
+        self.client.post('/auth/login', data={'email': 'op@test.com', 'password': 'password'})
+        page = self.client.get(f'/operator/printers/{pid}').get_data(as_text=True)
+        self.assertIn('215.0 &deg;C', page)
+
+    def test_ingest_rejects_bad_requests(self):
+        sample = {'printer_id': self.printer.id, 'nozzle_c': 200.0}
+        self.assertEqual(self.post([sample], token='wrong').status_code, 401)
+        self.assertEqual(self.client.post('/telemetry/ingest', json={'samples': [sample]}).status_code, 401)
+        self.assertEqual(self.post([]).status_code, 400)
+        self.assertEqual(self.post([{'nozzle_c': 200.0}]).status_code, 400)
+        self.assertEqual(self.post([{'printer_id': self.printer.id, 'bed_c': 'hot'}]).status_code, 400)
+        for ts in (1e20, -1e12, 'NaN', 'Infinity', 0):
+            response = self.post([{'printer_id': self.printer.id, 'ts': ts, 'nozzle_c': 200.0}])
+            self.assertEqual(response.status_code, 400, ts)
+        self.assertIsNone(telemetry.latest_sample(self.printer.id))
+
+    def test_sample_ts_must_be_recent(self):
+        now = 1760000000.0
+        _, samples = telemetry.parse_samples([{'printer_id': 1}, {'printer_id': 1, 'ts': now - 3600}], now=now)
+        self.assertEqual(samples['ts'].tolist(), [now, now - 3600])
+        # A zero ts is a printer without a clock, not a request for the server's
+        for ts in (0, 0.0, 1e20, -1e12, float('nan'), float('inf'), now + 2 * 86400,
+                   now - telemetry.MAX_SAMPLE_AGE_SECONDS - 1):
+            with self.assertRaises(ValueError):
+                telemetry.parse_samples([{'printer_id': 1, 'ts': now}, {'printer_id': 1, 'ts': ts}], now=now)
+
+if __name__ == '__main__':
+    unittest.main()
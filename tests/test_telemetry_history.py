@@ -0,0 +1,115 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app import create_app, db
+from app.models import User, Printer, PrinterStatus, UserRole
+from app.services import telemetry_history as history
+from app.services.telemetry import SAMPLE_DTYPE
+
+def samples(ts, nozzle, bed=None, error_code=0):
+    records = np.zeros(len(ts), dtype=SAMPLE_DTYPE)
+    records['ts'] = ts
+    records['nozzle_c'] = nozzle
+    records['bed_c'] = np.nan if bed is None else bed
+    records['progress'] = np.nan
+    records['error_code'] = error_code
+    return records
+
+class TestTelemetryHistory(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.tmp = tempfile.mkdtemp()
+        self.app.config['TELEMETRY_FOLDER'] = self.tmp
+        self.app.config['TELEMETRY_TOKEN'] = 'secret'
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.user = User(email='op@test.com', name='Operator', role=UserRole.OPERATOR)
+        self.user.set_password('password')
+        self.printer = Printer(name='P1', status=PrinterStatus.IDLE)
+        db.session.add_all([self.user, self.printer])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.tmp)
+
+    def test_segments_work_without_flock(self):
+        # As on Windows, where fcntl does not exist
+        day = datetime(2026, 10, 18)
+        start = history._to_seconds(day)
+        with mock.patch.object(history, 'fcntl', None):
+            history.record_samples(self.printer.id, samples([start, start + 1], [200.0, 201.0]))
+            stored = history._read(history.segment_path(self.printer.id, day.date(), '1s'), SAMPLE_DTYPE)
+        self.assertEqual(stored['nozzle_c'].tolist(), [200.0, 201.0])
+
+    def test_downsample_min_max_weighted_avg(self):
+        raw = history.as_aggregate(samples([0, 1, 2, 60, 61], [200, 210, np.nan, 100, 300],
+                                           error_code=[0, 5, 0, 0, 0]))
+        minutes = history.downsample(raw, 60)
+        self.assertEqual(minutes['ts'].tolist(), [0.0, 60.0])
+        self.assertEqual(minutes['count'].tolist(), [3, 2])
+        self.assertEqual(minutes['nozzle_c_min'].tolist(), [200.0, 100.0])
+        self.assertEqual(minutes['nozzle_c_max'].tolist(), [210.0, 300.0])
+        self.assertEqual(minutes['nozzle_c_avg'].tolist(), [205.0, 200.0])
+        self.assertTrue(np.isnan(minutes['bed_c_avg']).all())
+        self.assertEqual(minutes['error_code'].tolist(), [5, 0])
+
+        # Averages of averages are weighted by how many samples reported the reading
+        quarter = history.downsample(minutes, 900)
+        self.assertAlmostEqual(float(quarter['nozzle_c_avg'][0]), (200 + 210 + 100 + 300) / 4)
+        self.assertEqual(quarter['count'].tolist(), [5])
+        self.assertEqual(quarter['nozzle_c_n'].tolist(), [4])
+
+    def test_compact_downsamples_and_expires(self):
+        now = datetime(2026, 10, 18, 12, 0)
+        old_day = datetime(2026, 10, 10)
+        start = history._to_seconds(old_day)
+        history.record_samples(self.printer.id, samples(start + np.arange(0, 7200), 200.0, bed=60.0))
+        history.record_samples(self.printer.id, samples([history._to_seconds(now) - 10], 215.0))
+
+        result = history.compact(now=now)
+        self.assertEqual(result['segments_written'], 2)
+        self.assertEqual(result['segments_deleted'], 1)
+        folder = os.path.join(self.tmp, 'history', str(self.printer.id))
+        self.assertEqual(sorted(os.listdir(folder)), ['2026-10-10.15m', '2026-10-10.1m', '2026-10-18.1s'])
+        self.assertEqual(history.compact(now=now)['segments_written'], 0)
+
+        # A two hour window is answered from the minute segment
+        window = history.query(self.printer.id, old_day, old_day + timedelta(hours=2))
+        self.assertEqual(window['resolution_seconds'], 60)
+        self.assertEqual(len(window['ts']), 120)
+        self.assertEqual(window['nozzle_c']['avg'][0], 200.0)
+        self.assertIsNone(window['progress']['avg'][0])
+
+        # A week spans compacted and raw days alike
+        week = history.query(self.printer.id, now - timedelta(days=10), now)
+        self.assertEqual(week['resolution_seconds'], 1800)
+        self.assertEqual(len(week['ts']), 5)
+        self.assertEqual(week['nozzle_c']['max'][-1], 215.0)
+
+    def test_ingest_feeds_history_endpoint(self):
+        now = time.time()
+        response = self.client.post('/telemetry/ingest', headers={'Authorization': 'Bearer secret'}, json={
+            'samples': [{'printer_id': self.printer.id, 'ts': now - i, 'nozzle_c': 200.0 + i} for i in range(3)]})
+        self.assertEqual(response.status_code, 202)
+
+        self.client.post('/auth/login', data={'email': 'op@test.com', 'password': 'password'})
+        data = self.client.get(f'/operator/printers/{self.printer.id}/telemetry?hours=1').get_json()
+        self.assertEqual(data['resolution_seconds'], 60)
+        self.assertEqual(sum(1 for v in data['nozzle_c']['max'] if v is not None), len(data['ts']))
+        self.assertEqual(max(data['nozzle_c']['max']), 202.0)
+
+if __name__ == '__main__':
+    unittest.main()
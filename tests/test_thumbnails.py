@@ -0,0 +1,124 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import zlib
+from io import BytesIO
+
+import numpy as np
+from werkzeug.datastructures import FileStorage
+
+from app import create_app, db
+from app.models import User, Order, PrintJob, UserRole, OrderStatus
+from app.services import storage_maintenance
+from app.services.storage import store_upload
+from app.services.storage_maintenance import collect_garbage
+from app.services.tasks import enqueue, run_pending
+from app.services.thumbnails import render_triangles, encode_png, thumbnail_path, THUMB_SIZE
+from stl_fixtures import box_triangles, sphere_triangles
+
+def decode_png(data):
+    """Just enough PNG reading to check encode_png round-trips."""
+    assert data[:8] == b'\x89PNG\r\n\x1a\n'
+    pos, idat = 8, b''
+    while pos < len(data):
+        length, tag = struct.unpack('>I4s', data[pos:pos + 8])
+        body = data[pos + 8:pos + 8 + length]
+        assert struct.unpack('>I', data[pos + 8 + length:pos + 12 + length])[0] == zlib.crc32(tag + body)
+        if tag == b'IHDR':
+            width, height = struct.unpack('>II', body[:8])
+        elif tag == b'IDAT':
+            idat += body
+        pos += 12 + length
+    rows = np.frombuffer(zlib.decompress(idat), dtype=np.uint8).reshape(height, 1 + width * 4)
+    return rows[:, 1:].reshape(height, width, 4)
+
+class TestRenderer(unittest.TestCase):
+    def test_box_is_drawn_centred_on_transparent_background(self):
+        img = render_triangles(box_triangles(40, 20, 30))
+        self.assertEqual(img.shape, (THUMB_SIZE, THUMB_SIZE, 4))
+        self.assertEqual(img[0, 0, 3], 0)
+        self.assertEqual(img[THUMB_SIZE // 2, THUMB_SIZE // 2, 3], 255)
+        # Faces facing different ways get different shades
+        opaque = img[img[..., 3] == 255][:, :3]
+        self.assertGreaterEqual(len(np.unique(opaque, axis=0)), 3)
+
+    def test_png_round_trip(self):
+        img = render_triangles(box_triangles(10, 10, 10))
+        np.testing.assert_array_equal(decode_png(encode_png(img)), img)
+
+    def test_500k_triangles(self):
+        # Speed is measured by scripts/bench_thumbnails.py
+        mesh = sphere_triangles(500)
+        self.assertEqual(len(mesh), 500000)
+        img = render_triangles(mesh)
+        self.assertEqual(img[THUMB_SIZE // 2, THUMB_SIZE // 2, 3], 255)
+
+class TestThumbnailCache(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.upload_dir = tempfile.mkdtemp()
+        self.app.config['UPLOAD_FOLDER'] = self.upload_dir
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.operator = User(email='op@test.com', name='Operator', role=UserRole.OPERATOR)
+        self.operator.set_password('password')
+        db.session.add(self.operator)
+        db.session.commit()
+
+        records = np.zeros(12, dtype=[('normal', '<f4', (3,)), ('vertices', '<f4', (3, 3)), ('attr', '<u2')])
+        records['vertices'] = box_triangles(30, 30, 10)
+        self.stored = store_upload(FileStorage(BytesIO(b'\0' * 80 + struct.pack('<I', 12) + records.tobytes()),
+                                               filename='part.stl'))
+        order = Order(customer_user_id=self.operator.id, status=OrderStatus.NEW)
+        db.session.add(order)
+        db.session.flush()
+        db.session.add(PrintJob(order_id=order.id, stl_path=self.stored.rel_path, file_hash=self.stored.sha256,
+                                original_filename='part.stl', material_type='PLA', color='Black'))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.upload_dir)
+
+    def test_worker_renders_and_operator_page_serves(self):
+        enqueue('render_thumbnail', {'sha256': self.stored.sha256})
+        run_pending()
+        self.assertTrue(os.path.exists(thumbnail_path(self.stored.sha256)))
+
+        client = self.app.test_client()
+        client.post('/auth/login', data={'email': 'op@test.com', 'password': 'password'})
+        response = client.get(f'/operator/thumbnails/{self.stored.sha256}.png')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/png')
+        self.assertEqual(response.cache_control.max_age, 365 * 24 * 3600)
+        self.assertTrue(response.cache_control.private)
+        self.assertEqual(decode_png(response.data).shape, (THUMB_SIZE, THUMB_SIZE, 4))
+        response.close()
+
+        self.assertEqual(client.get('/operator/thumbnails/' + '0' * 64 + '.png').status_code, 404)
+        self.assertIn(self.stored.sha256.encode(), client.get('/operator/jobs').data)
+
+    def test_thumbnails_follow_their_file(self):
+        enqueue('render_thumbnail', {'sha256': self.stored.sha256})
+        run_pending()
+        orphan = thumbnail_path('ab' * 32)
+        os.makedirs(os.path.dirname(orphan), exist_ok=True)
+        open(orphan, 'wb').close()
+
+        old_grace = storage_maintenance.GRACE_SECONDS
+        storage_maintenance.GRACE_SECONDS = -60
+        try:
+            collect_garbage()
+        finally:
+            storage_maintenance.GRACE_SECONDS = old_grace
+        self.assertTrue(os.path.exists(thumbnail_path(self.stored.sha256)))
+        self.assertFalse(os.path.exists(orphan))
+
+if __name__ == '__main__':
+    unittest.main()
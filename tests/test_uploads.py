@@ -0,0 +1,120 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from app import create_app, db
+from app.models import User, Order, StoredFile, UserRole, UploadStatus, Upload
+from app.services import uploads
+
+class TestChunkedUploads(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.upload_dir = tempfile.mkdtemp()
+        self.app.config['UPLOAD_FOLDER'] = self.upload_dir
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        for email in ('cust@test.com', 'other@test.com'):
+            user = User(email=email, name='Customer', role=UserRole.CUSTOMER)
+            user.set_password('password')
+            db.session.add(user)
+        db.session.commit()
+
+        self.client = self.app.test_client()
+        self.client.post('/auth/login', data={'email': 'cust@test.com', 'password': 'password'})
+        self.content = os.urandom(250000)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.upload_dir)
+
+    def _create(self, filename='part.stl'):
+        response = self.client.post('/customer/uploads', json={'filename': filename, 'size': len(self.content)})
+        self.assertEqual(response.status_code, 201)
+        return response.get_json()['id']
+
+    def _put(self, upload_id, offset, chunk, checksum=None):
+        headers = {'X-Chunk-SHA256': checksum or hashlib.sha256(chunk).hexdigest()}
+        return self.client.put(f'/customer/uploads/{upload_id}?offset={offset}', data=chunk, headers=headers)
+
+    def test_resume_after_bad_chunks(self):
+        upload_id = self._create()
+        first, rest = self.content[:100000], self.content[100000:]
+        self.assertEqual(self._put(upload_id, 0, first).get_json()['offset'], 100000)
+
+        # Chunk corrupted in transit: discarded, offset unchanged
+        response = self._put(upload_id, 100000, rest, checksum='0' * 64)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(f'/customer/uploads/{upload_id}').get_json()['offset'], 100000)
+
+        # Client thought nothing arrived: told where to resume
+        response = self._put(upload_id, 0, first)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.get_json()['offset'], 100000)
+
+        self._put(upload_id, 100000, rest)
+        response = self.client.post(f'/customer/uploads/{upload_id}/complete')
+        self.assertEqual(response.get_json()['status'], UploadStatus.COMPLETE)
+
+        stored = StoredFile.query.one()
+        self.assertEqual(stored.sha256, hashlib.sha256(self.content).hexdigest())
+        with open(os.path.join(self.upload_dir, *stored.rel_path.split('/')[1:]), 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+    def test_incomplete_upload_cannot_complete(self):
+        upload_id = self._create()
+        self._put(upload_id, 0, self.content[:1000])
+        self.assertEqual(self.client.post(f'/customer/uploads/{upload_id}/complete').status_code, 400)
+
+    def test_oversized_chunk_is_rejected(self):
+        old = uploads.MAX_CHUNK_BYTES
+        uploads.MAX_CHUNK_BYTES = 1000
+        try:
+            upload_id = self._create()
+            response = self._put(upload_id, 0, self.content[:5000])
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.get_json()['offset'], 0)
+        finally:
+            uploads.MAX_CHUNK_BYTES = old
+
+    def test_order_references_completed_uploads(self):
+        ids = []
+        for name in ('a.stl', 'b.stl'):
+            upload_id = self._create(name)
+            self._put(upload_id, 0, self.content)
+            self.client.post(f'/customer/uploads/{upload_id}/complete')
+            ids.append(upload_id)
+
+        data = {'upload_ids': ','.join(ids), 'material_type': 'PLA', 'color': 'Black', 'quantity': 1}
+        response = self.client.post('/customer/order/new', data=data)
+        self.assertEqual(response.status_code, 302)
+
+        order = Order.query.one()
+        self.assertEqual([j.original_filename for j in order.jobs], ['a.stl', 'b.stl'])
+        # Same bytes twice: one stored copy, two references
+        self.assertEqual(StoredFile.query.one().ref_count, 2)
+        self.assertTrue(all(u.status == UploadStatus.CONSUMED for u in Upload.query.all()))
+
+        # An upload backs only one order
+        self.client.post('/customer/order/new', data=data)
+        self.assertEqual(Order.query.count(), 1)
+
+    def test_uploads_are_private(self):
+        other = User.query.filter_by(email='other@test.com').one()
+        upload = uploads.create_upload(other.id, 'theirs.stl', len(self.content))
+        self.assertEqual(self.client.get(f'/customer/uploads/{upload.id}').status_code, 404)
+        self.assertEqual(self._put(upload.id, 0, self.content).status_code, 404)
+        data = {'upload_ids': upload.id, 'material_type': 'PLA', 'color': 'Black', 'quantity': 1}
+        self.client.post('/customer/order/new', data=data)
+        self.assertEqual(Order.query.count(), 0)
+
+    def test_only_stl_uploads(self):
+        response = self.client.post('/customer/uploads', json={'filename': 'evil.exe', 'size': 10})
+        self.assertEqual(response.status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app import create_app, db
+from app.models import User, Printer, PrinterStatus, PrinterStatusChange, PrinterDayStat, UserRole
+from app.services import utilization
+from app.services.utilization import interval_seconds, printer_utilization, rebuild_printer_days, MAX_HOUR_WINDOW
+
+class TestIntervalEngine(unittest.TestCase):
+    def test_seconds_per_bucket(self):
+        # Printer 0: maintenance from before the window, busy at 10, idle at 40.
+        # Printer 1: busy from 30. Printer 2: no history.
+        seconds = interval_seconds([0, 0, 0, 1], [-5, 10, 40, 30], [2, 0, 1, 0], 3, np.array([0.0, 50.0, 100.0]))
+        np.testing.assert_allclose(seconds[0], [[30, 10, 10], [0, 50, 0]])
+        np.testing.assert_allclose(seconds[1], [[20, 0, 0], [50, 0, 0]])
+        np.testing.assert_allclose(seconds[2], 0)
+
+class TestUtilization(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        admin = User(email='admin@test.com', name='Admin', role=UserRole.ADMIN)
+        admin.set_password('password')
+        db.session.add(admin)
+        self.printer = Printer(name='P1', status=PrinterStatus.IDLE)
+        self.other = Printer(name='P2', status=PrinterStatus.IDLE)
+        db.session.add_all([self.printer, self.other])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def _history(self, printer, *changes):
+        PrinterStatusChange.query.filter_by(printer_id=printer.id).delete()
+        db.session.add_all(PrinterStatusChange(printer_id=printer.id, status=status, changed_at=at)
+                           for at, status in changes)
+        db.session.commit()
+
+    def test_status_changes_are_recorded(self):
+        self.assertEqual(PrinterStatusChange.query.filter_by(printer_id=self.printer.id).count(), 1)
+        self.printer.status = PrinterStatus.PRINTING
+        db.session.commit()
+        self.printer.status = PrinterStatus.PRINTING
+        self.printer.notes = 'unchanged status'
+        db.session.commit()
+        self.printer.status = PrinterStatus.IDLE
+        db.session.commit()
+        statuses = [c.status for c in PrinterStatusChange.query.filter_by(printer_id=self.printer.id)
+                    .order_by(PrinterStatusChange.id)]
+        self.assertEqual(statuses, [PrinterStatus.IDLE, PrinterStatus.PRINTING, PrinterStatus.IDLE])
+        # The closed intervals went into today's row
+        day = PrinterDayStat.query.filter_by(printer_id=self.printer.id).one()
+        self.assertGreaterEqual(day.idle_seconds, 0)
+        self.assertEqual(day.maintenance_seconds, 0)
+
+    def test_day_buckets_match_the_change_log(self):
+        d0 = datetime(2026, 3, 1)
+        self._history(self.printer,
+                      (d0 - timedelta(days=2), PrinterStatus.IDLE),
+                      (d0 + timedelta(hours=6), PrinterStatus.PRINTING),
+                      (d0 + timedelta(days=1, hours=18), PrinterStatus.MAINTENANCE),
+                      (d0 + timedelta(days=2, hours=6), PrinterStatus.ERROR),
+                      (d0 + timedelta(days=2, hours=12), PrinterStatus.IDLE))
+        self._history(self.other, (d0 + timedelta(days=1), PrinterStatus.PRINTING))
+        rebuild_printer_days()
+
+        start, end = d0 + timedelta(hours=12), d0 + timedelta(days=3, hours=12)
+        ids = [self.printer.id, self.other.id]
+        rolled_up = utilization.utilization_seconds(ids, start, end, 'day')
+        raw = utilization._raw_seconds(ids, start, end, 'day')
+        np.testing.assert_allclose(rolled_up, raw)
+
+        result = printer_utilization(start, end, 'day', ids)
+        self.assertEqual(len(result['buckets']), 4)
+        self.assertEqual(result['printers'][self.printer.id]['busy'], [100.0, 75.0, 0.0, 0.0])
+        self.assertEqual(result['printers'][self.printer.id]['maintenance'], [0.0, 25.0, 50.0, 0.0])
+        self.assertEqual(result['printers'][self.other.id]['busy'], [0.0, 100.0, 100.0, 100.0])
+        self.assertEqual(result['totals'][self.printer.id],
+                         {'busy': 41.67, 'idle': 33.33, 'maintenance': 25.0})
+
+        hourly = printer_utilization(start, start + timedelta(hours=2), 'hour', ids)
+        self.assertEqual(hourly['printers'][self.printer.id]['busy'], [100.0, 100.0])
+        self.assertEqual(hourly['printers'][self.other.id]['busy'], [0.0, 0.0])
+
+    def test_open_interval_counts_until_now(self):
+        now = datetime.utcnow()
+        self._history(self.printer, (now - timedelta(days=3), PrinterStatus.PRINTING))
+        rebuild_printer_days()
+        totals = printer_utilization(now - timedelta(days=2), bucket='day',
+                                     printer_ids=[self.printer.id])['totals'][self.printer.id]
+        self.assertAlmostEqual(totals['busy'], 100.0, places=1)
+
+    def test_hour_buckets_are_limited_to_max_window(self):
+        # Speed is measured by scripts/bench_utilization.py
+        end = datetime(2026, 1, 1)
+        self.assertEqual(len(printer_utilization(end - MAX_HOUR_WINDOW, end, 'hour')['buckets']),
+                         MAX_HOUR_WINDOW.days * 24)
+        with self.assertRaises(ValueError):
+            printer_utilization(end - MAX_HOUR_WINDOW - timedelta(hours=1), end, 'hour')
+
+    def test_api(self):
+        client = self.app.test_client()
+        client.post('/auth/login', data={'email': 'admin@test.com', 'password': 'password'})
+        response = client.get(f'/analytics/api/utilization?days=2&bucket=hour&printer_id={self.printer.id}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.get_json()['printers']), [str(self.printer.id)])
+        self.assertEqual(client.get('/analytics/api/utilization?bucket=week').status_code, 400)
+        stats = client.get('/analytics/api/stats').get_json()
+        self.assertIn('busy', stats['printer_utilization'][0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+import asyncio
+import unittest
+
+from app import create_app, db
+from app.models import User, Order, PrintJob, Printer, Plate, AuditLog, JobStatus, PrinterStatus, PlateStatus, UserRole
+from app.services.fleet_poller import FleetPoller
+from app.services.watchdog import TimerWheel, Watchdog, fail_over
+from app.services.workflow import assign_job, start_job
+from fake_printer import FakePrinterFarm
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+class TestTimerWheel(unittest.TestCase):
+    def test_fires_due_timers_once(self):
+        wheel = TimerWheel(resolution=1.0, slots=8, now=0.0)
+        wheel.schedule('a', 3.0)
+        wheel.schedule('b', 5.5)
+        wheel.schedule('c', 20.0)  # more than a turn ahead, shares a bucket with nearer timers
+        wheel.schedule('d', 4.0)
+        wheel.cancel('d')
+        self.assertEqual(wheel.advance(2.9), [])
+        self.assertEqual(wheel.advance(3.0), ['a'])
+        wheel.schedule('b', 7.0)  # rescheduled before it fired
+        self.assertEqual(wheel.advance(6.0), [])
+        self.assertEqual(wheel.advance(12.5), ['b'])
+        self.assertEqual(len(wheel), 1)
+        self.assertEqual(wheel.advance(100.0), ['c'])
+        self.assertEqual(len(wheel), 0)
+
+    def test_past_deadline_fires_on_next_advance(self):
+        wheel = TimerWheel(resolution=1.0, slots=8, now=50.0)
+        wheel.schedule('late', 10.0)
+        self.assertEqual(wheel.advance(50.0), ['late'])
+
+class TestWatchdog(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.user = User(email='op@test.com', name='Operator', role=UserRole.OPERATOR)
+        self.user.set_password('password')
+        self.printers = [Printer(name=f'P{i}', status=PrinterStatus.IDLE) for i in range(3)]
+        db.session.add_all([self.user] + self.printers)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_job(self, printer=None, start=False):
+        order = Order(customer_user_id=self.user.id)
+        db.session.add(order)
+        db.session.commit()
+        job = PrintJob(order_id=order.id, material_type='PLA', color='Black', stl_path='a.stl',
+                       original_filename='a.stl', status=JobStatus.WAITING)
+        db.session.add(job)
+        db.session.commit()
+        if printer is not None:
+            assign_job(job, printer.id, self.user.id)
+            job.status = JobStatus.QUEUED
+            db.session.commit()
+            if start:
+                start_job(job, self.user.id)
+        return job
+
+    def test_stale_printers_reported_once(self):
+        clock = Clock()
+        elsewhere = {}
+        watchdog = Watchdog(timeout=10, clock=clock, last_seen=elsewhere.get)
+        watchdog.watch([1, 2, 3])
+        clock.now += 5
+        watchdog.beat(1)
+        self.assertEqual(watchdog.stale(), [])
+
+        # 2 reported through telemetry, which is only checked when its timer runs out
+        elsewhere[2] = clock.now
+        clock.now += 6
+        self.assertEqual(watchdog.stale(), [3])
+        clock.now += 5
+        self.assertEqual(sorted(watchdog.stale()), [1, 2])
+        clock.now += 100
+        self.assertEqual(watchdog.stale(), [])
+
+        watchdog.beat(3)
+        clock.now += 10
+        self.assertEqual(watchdog.stale(), [3])
+
+    def test_fail_over_requeues_jobs(self):
+        running, reserved, held = self.printers
+        started = self.add_job(running, start=True)
+        queued = self.add_job(reserved)
+        plate = Plate(material_type='PLA', color='Black', bed_width_mm=200, bed_depth_mm=200,
+                      status=PlateStatus.QUEUED, assigned_printer_id=reserved.id)
+        db.session.add(plate)
+        db.session.commit()
+        queued.plate_id = plate.id
+        kept = self.add_job(held, start=True)
+        held.status = PrinterStatus.MAINTENANCE
+        db.session.commit()
+
+        result = fail_over([p.id for p in self.printers])
+        self.assertEqual(result, {running.id: [started.id], reserved.id: [queued.id]})
+        for job in (started, queued):
+            self.assertEqual((job.status, job.assigned_printer_id, job.plate_id), (JobStatus.WAITING, None, None))
+        for printer in (running, reserved):
+            self.assertEqual((printer.status, printer.current_job_id), (PrinterStatus.ERROR, None))
+        self.assertEqual(plate.status, PlateStatus.FAILED)
+        self.assertEqual((kept.status, held.status), (JobStatus.PRINTING, PrinterStatus.MAINTENANCE))
+        self.assertEqual(AuditLog.query.filter_by(action='heartbeat_lost').count(), 2)
+        self.assertEqual(AuditLog.query.filter_by(action='fail_job', entity_id=started.id).count(), 1)
+
+        # Already handled: nothing more to do
+        self.assertEqual(fail_over([running.id]), {})
+
+    def test_poller_fails_over_silent_printer(self):
+        printer = self.printers[0]
+        job = self.add_job(printer, start=True)
+
+        async def scenario():
+            farm = await FakePrinterFarm().start()
+            printer.api_url = farm.add('a', state='printing', filename='a.gcode')
+            db.session.commit()
+            clock = Clock()
+            poller = FleetPoller(timeout=0.5, clock=clock, watchdog=Watchdog(timeout=30, clock=clock))
+            poller.load_targets()
+            results = [await poller.poll_once()]
+
+            # The printer drops off the network mid-print
+            del farm.printers['a']
+            for _ in range(8):
+                clock.now += 10
+                results.append(await poller.poll_once())
+            poller.close()
+            await farm.stop()
+            return results
+
+        results = asyncio.run(scenario())
+        self.assertEqual([r['failed_over'] for r in results], [0, 0, 0, 1, 0, 0, 0, 0, 0])
+        db.session.expire_all()
+        self.assertEqual((job.status, job.assigned_printer_id), (JobStatus.WAITING, None))
+        self.assertEqual((printer.status, printer.current_job_id), (PrinterStatus.ERROR, None))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -77,6 +77,42 @@ class TestWorkflow(unittest.TestCase):
         self.assertEqual(self.job.status, JobStatus.WAITING)
         self.assertIsNone(self.job.assigned_printer_id) # Should be unassigned
 
+    def test_split_job_spreads_units(self):
+        """Test a high-quantity job is split into runs over idle printers."""
+        from app.models import Order, OrderStatus
+        from app.services.workflow import assign_job_parallel
+
+        big = PrintJob(order_id=self.order.id, material_type='PLA', color='Black',
+                       estimated_material_grams=10, quantity=5, status=JobStatus.WAITING,
+                       stl_path='big.stl', original_filename='big.stl')
+        db.session.add(big)
+        idle = [Printer(name=f'Idle{i}', status=PrinterStatus.IDLE) for i in range(2)]
+        db.session.add_all(idle)
+        db.session.commit()
+
+        runs = assign_job_parallel(big, self.user.id)
+        self.assertEqual(len(runs), 2)
+        self.assertEqual(sorted(r.quantity for r, p in runs), [2, 3])
+        self.assertEqual({p.id for r, p in runs}, {p.id for p in idle})
+        self.assertTrue(all(r.status == JobStatus.QUEUED for r, p in runs))
+        self.assertEqual(runs[1][0].parent_job_id, big.id)
+        self.assertEqual(self.order.units_total, 6)
+
+        # Order only completes once every run is done
+        finish_job(self.job, self.user.id)
+        for run, printer in runs[:-1]:
+            start_job(run, self.user.id)
+            finish_job(run, self.user.id)
+            self.assertNotEqual(self.order.status, OrderStatus.DONE)
+        last = runs[-1][0]
+        start_job(last, self.user.id)
+        finish_job(last, self.user.id)
+        self.assertEqual(self.order.units_done, 6)
+        self.assertEqual(self.order.status, OrderStatus.DONE)
+
+        # Filament is consumed per unit: 50g for the original job + 5 x 10g
+        self.assertEqual(Filament.query.get(self.filament.id).stock_grams, 1000 - 50 - 50)
+
 
 if __name__ == '__main__':
     unittest.main()